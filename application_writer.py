@@ -0,0 +1,140 @@
+import asyncio
+import logging
+from typing import Dict, List, Optional, Tuple
+
+import asyncpg
+
+
+# Столбцы заявки при вставке и их типы (для разворачивания массивов через unnest)
+APPLICATION_COLUMNS = (
+    ('telegram_id', 'bigint'),
+    ('client_name', 'text'),
+    ('organization_name', 'text'),
+    ('phone', 'text'),
+    ('email', 'text'),
+    ('other_information', 'text'),
+    ('entity_type_id', 'integer'),
+    ('feedback_id', 'integer'),
+    ('convenient_time_id', 'integer'),
+    ('category_id', 'integer'),
+    ('subcategory_id', 'integer'),
+    ('idempotency_key', 'uuid'),
+)
+
+_COLUMN_NAMES = ', '.join(name for name, _ in APPLICATION_COLUMNS)
+
+# Вставка одной заявки. Повторная вставка с тем же ключом идемпотентности ничего не возвращает
+INSERT_APPLICATION_QUERY = (
+    f"INSERT INTO applications.applications({_COLUMN_NAMES}) "
+    f"VALUES({', '.join(f'${i}' for i in range(1, len(APPLICATION_COLUMNS) + 1))}) "
+    f"ON CONFLICT (idempotency_key) DO NOTHING RETURNING application_id, created_at;"
+)
+
+# Вставка пачки заявок одним запросом: каждый столбец передается массивом
+INSERT_APPLICATIONS_BATCH_QUERY = (
+    f"INSERT INTO applications.applications({_COLUMN_NAMES}) "
+    f"SELECT * FROM unnest({', '.join(f'${i}::{t}[]' for i, (_, t) in enumerate(APPLICATION_COLUMNS, start=1))}) "
+    f"ON CONFLICT (idempotency_key) DO NOTHING RETURNING idempotency_key, application_id, created_at;"
+)
+
+
+class ApplicationWriter:
+    """
+    Запись заявок в базу.
+
+    При `batch_delay=0` каждая заявка вставляется своим запросом. При `batch_delay>0` заявки, отправленные
+    почти одновременно, копятся до `batch_delay` секунд (или до `batch_size` штук) и вставляются одним
+    многострочным INSERT, а каждый вызвавший получает свою строку через future. Так при всплеске отправок
+    число запросов и занятых соединений пула растет медленнее числа заявок.
+
+    Строки пачки сопоставляются с вызвавшими по ключу идемпотентности. Если пачка целиком не вставилась
+    (например, одна из заявок нарушает ограничение), заявки пачки вставляются по одной: ошибка одной заявки
+    достается только ее отправителю.
+    """
+
+    def __init__(self, pool: asyncpg.pool.Pool, batch_delay: float = 0, batch_size: int = 100,
+                 timeout: float = 3) -> None:
+        """
+        :param pool: Подключение к базе PostgreSQL. Тип: `asyncpg.pool.Pool`.
+        :param batch_delay: Сколько секунд копить заявки в пачку. `0` - без пачек. Тип: `float`.
+        :param batch_size: Максимальный размер пачки. Тип: `int`.
+        :param timeout: Таймаут запроса (сек.). Тип: `float`.
+        """
+        self.pool = pool
+        self.batch_delay = batch_delay
+        self.batch_size = batch_size
+        self.timeout = timeout
+        self._pending: List[Tuple[tuple, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._flushes = set()
+
+    async def insert(self, values: Dict) -> Optional[asyncpg.Record]:
+        """
+        Вставить заявку.
+
+        :param values: Значения столбцов из `APPLICATION_COLUMNS`; отсутствующие столбцы - `NULL`.
+                       Ключ `idempotency_key` (`uuid.UUID`) обязателен. Тип: `dict`.
+        :return: Запись с `application_id` и `created_at` или `None`, если заявка с таким ключом
+                 идемпотентности уже есть. Тип: `asyncpg.Record | None`.
+        """
+        row = tuple(values.get(name) for name, _ in APPLICATION_COLUMNS)
+        if not self.batch_delay:
+            return await self._insert_one(row)
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((row, future))
+        if len(self._pending) >= self.batch_size:
+            self._flush_pending()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.batch_delay, self._flush_pending)
+        return await future
+
+    async def close(self) -> None:
+        """
+        Вставить накопленные заявки и дождаться завершения всех вставок.
+
+        :return: Возвращает `None`
+        """
+        self._flush_pending()
+        await asyncio.gather(*self._flushes, return_exceptions=True)
+
+    def _flush_pending(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, []
+        task = asyncio.create_task(self._flush(batch))
+        self._flushes.add(task)
+        task.add_done_callback(self._flushes.discard)
+
+    async def _insert_one(self, row: tuple) -> Optional[asyncpg.Record]:
+        async with self.pool.acquire(timeout=self.timeout) as connection:
+            return await connection.fetchrow(INSERT_APPLICATION_QUERY, *row, timeout=self.timeout)
+
+    async def _flush(self, batch: List[Tuple[tuple, asyncio.Future]]) -> None:
+        key_index = len(APPLICATION_COLUMNS) - 1
+        try:
+            columns = [list(column) for column in zip(*(row for row, _ in batch))]
+            async with self.pool.acquire(timeout=self.timeout) as connection:
+                records = await connection.fetch(INSERT_APPLICATIONS_BATCH_QUERY, *columns, timeout=self.timeout)
+        except Exception as e:
+            logging.warning(f"Пачка заявок ({len(batch)} шт.) не вставлена, вставка по одной: {e}")
+            await asyncio.gather(*(self._flush_one(row, future) for row, future in batch))
+            return
+        inserted = {record['idempotency_key']: record for record in records}
+        for row, future in batch:
+            # Строку получает первый отправитель с этим ключом, повторные отправки в той же пачке - None
+            record = inserted.pop(row[key_index], None)
+            if not future.done():
+                future.set_result(record)
+
+    async def _flush_one(self, row: tuple, future: asyncio.Future) -> None:
+        try:
+            record = await self._insert_one(row)
+        except Exception as e:
+            if not future.done():
+                future.set_exception(e)
+        else:
+            if not future.done():
+                future.set_result(record)
@@ -0,0 +1,28 @@
+from typing import Any
+
+from aiogram.client.session.aiohttp import AiohttpSession
+
+
+class BotApiSession(AiohttpSession):
+    """
+    Сессия Bot API с настраиваемым временем жизни простаивающих соединений.
+
+    `AiohttpSession` задает соединителю только `limit`, поэтому простаивающее соединение закрывается через
+    15 секунд по умолчанию aiohttp. Здесь в параметры соединителя добавляется `keepalive_timeout`, чтобы между
+    всплесками обновлений соединения к серверу Bot API переиспользовались, а не открывались заново.
+    Сессию и соединитель по-прежнему создает `AiohttpSession.create_session`.
+    """
+
+    def __init__(self, keepalive_timeout: float = 15, **kwargs: Any) -> None:
+        """
+        :param keepalive_timeout: Сколько секунд держать простаивающее соединение открытым. Тип: `float`.
+        :param kwargs: Остальные параметры `AiohttpSession` (`api`, `limit`, `proxy`, `timeout` и т.д.).
+        """
+        self.keepalive_timeout = keepalive_timeout
+        super().__init__(**kwargs)
+        self._connector_init["keepalive_timeout"] = keepalive_timeout
+
+    def _setup_proxy_connector(self, proxy: Any) -> None:
+        # Смена прокси пересоздает параметры соединителя: keepalive_timeout добавляется к новым
+        super()._setup_proxy_connector(proxy)
+        self._connector_init["keepalive_timeout"] = self.keepalive_timeout
@@ -0,0 +1,257 @@
+import asyncio
+import os
+import shutil
+from abc import ABC, abstractmethod
+from contextlib import AsyncExitStack
+from pathlib import Path
+from typing import AsyncGenerator, AsyncIterable, Optional
+
+import aiofiles
+from aiogram import Bot
+from aiogram.types import FSInputFile, InputFile
+
+
+# Размер части multipart-загрузки в S3. Минимум для всех частей, кроме последней, - 5 МБ
+S3_PART_SIZE = 8 * 1024 * 1024
+
+# Размер порции при чтении файла для повторной отправки
+READ_CHUNK_SIZE = 64 * 1024
+
+
+async def read_file(path: Path) -> AsyncGenerator[bytes, None]:
+    """
+    Прочитать файл порциями по `READ_CHUNK_SIZE`.
+
+    :param path: Путь к файлу. Тип: `Path`.
+    :return: Содержимое файла порциями. Тип: `AsyncGenerator[bytes, None]`.
+    """
+    async with aiofiles.open(path, "rb") as file:
+        while chunk := await file.read(READ_CHUNK_SIZE):
+            yield chunk
+
+
+class DocumentStorage(ABC):
+    """
+    Хранилище документов заявок.
+
+    Документ адресуется ключом - относительным путем вида `Физическое лицо/<клиент>/<папка>/<файл>`.
+    При сохранении хранилище возвращает ссылку на документ, которая записывается в `applications.documents.file_path`
+    и по которой документ потом читается.
+    """
+
+    @abstractmethod
+    async def save_stream(self, key: str, chunks: AsyncIterable[bytes]) -> str:
+        """
+        Сохранить документ, читая его содержимое потоком.
+
+        :param key: Ключ документа. Тип: `str`.
+        :param chunks: Содержимое документа порциями. Тип: `AsyncIterable[bytes]`.
+        :return: Ссылка на сохраненный документ. Тип: `str`.
+        """
+
+    async def save_file(self, key: str, path: Path) -> str:
+        """
+        Сохранить документ из файла на локальном диске (например, из папки локального сервера Bot API).
+        Исходный файл не изменяется.
+
+        :param key: Ключ документа. Тип: `str`.
+        :param path: Путь к файлу. Тип: `Path`.
+        :return: Ссылка на сохраненный документ. Тип: `str`.
+        """
+        return await self.save_stream(key, read_file(path))
+
+    @abstractmethod
+    def input_file(self, ref: str, filename: str) -> InputFile:
+        """
+        Получить документ для отправки в Telegram. Содержимое читается потоком в момент отправки.
+
+        :param ref: Ссылка на документ. Тип: `str`.
+        :param filename: Имя файла, которое увидит пользователь. Тип: `str`.
+        :return: Файл для отправки. Тип: `InputFile`.
+        """
+
+    @abstractmethod
+    async def delete(self, refs: list) -> None:
+        """
+        Удалить документы.
+
+        :param refs: Ссылки на документы. Тип: `list[str]`.
+        :return: Возвращает `None`
+        """
+
+    async def close(self) -> None:
+        """
+        Закрыть соединения хранилища.
+        """
+
+
+class LocalDocumentStorage(DocumentStorage):
+    """
+    Хранилище документов в папке на локальном диске. Ссылка на документ - абсолютный путь к файлу.
+    """
+
+    def __init__(self, root: Path) -> None:
+        """
+        :param root: Папка документов. Тип: `Path`.
+        """
+        self.root = root
+
+    async def save_stream(self, key: str, chunks: AsyncIterable[bytes]) -> str:
+        path = self.root / key
+        path.parent.mkdir(parents=True, exist_ok=True)
+        async with aiofiles.open(path, "wb") as file:
+            async for chunk in chunks:
+                await file.write(chunk)
+        return str(path)
+
+    async def save_file(self, key: str, path: Path) -> str:
+        target = self.root / key
+        await asyncio.to_thread(self._link_or_copy, path, target)
+        return str(target)
+
+    @staticmethod
+    def _link_or_copy(source: Path, target: Path) -> None:
+        target.parent.mkdir(parents=True, exist_ok=True)
+        target.unlink(missing_ok=True)
+        try:
+            # Жесткая ссылка не копирует данные. Файл не переносится: он остается в кэше сервера Bot API
+            os.link(source, target)
+        except OSError:
+            # Другая файловая система или ссылки не поддерживаются
+            shutil.copyfile(source, target)
+
+    def input_file(self, ref: str, filename: str) -> InputFile:
+        return FSInputFile(ref, filename=filename)
+
+    async def delete(self, refs: list) -> None:
+        await asyncio.to_thread(self._delete, refs)
+
+    def _delete(self, refs: list) -> None:
+        for path in map(Path, refs):
+            path.unlink(missing_ok=True)
+            # Удаляем опустевшие папки вплоть до корня хранилища, не включая его
+            parent = path.parent
+            while parent != self.root and self.root in parent.parents:
+                try:
+                    parent.rmdir()
+                except OSError:
+                    # Папка не пуста
+                    break
+                parent = parent.parent
+
+
+class S3InputFile(InputFile):
+    """
+    Документ из S3, который читается потоком при отправке в Telegram.
+    """
+
+    def __init__(self, storage: "S3DocumentStorage", key: str, filename: str) -> None:
+        super().__init__(filename=filename, chunk_size=READ_CHUNK_SIZE)
+        self.storage = storage
+        self.key = key
+
+    async def read(self, bot: Bot) -> AsyncGenerator[bytes, None]:
+        client = await self.storage.client()
+        response = await client.get_object(Bucket=self.storage.bucket, Key=self.key)
+        async with response["Body"] as body:
+            async for chunk in body.iter_chunks(self.chunk_size):
+                yield chunk
+
+
+class S3DocumentStorage(DocumentStorage):
+    """
+    Хранилище документов в S3-совместимом объектном хранилище (AWS S3, MinIO и т.п.).
+    Ссылка на документ - `s3://<bucket>/<key>`.
+
+    Документ загружается multipart-загрузкой частями по `S3_PART_SIZE`, поэтому в памяти держится
+    не больше одной части независимо от размера файла.
+    """
+
+    def __init__(self, bucket: str, endpoint_url: Optional[str] = None, access_key: Optional[str] = None,
+                 secret_key: Optional[str] = None, region: Optional[str] = None) -> None:
+        """
+        :param bucket: Имя бакета. Тип: `str`.
+        :param endpoint_url: Адрес S3 API, например `http://localhost:9000` для MinIO. Тип: `str | None`.
+        :param access_key: Ключ доступа. Тип: `str | None`.
+        :param secret_key: Секретный ключ. Тип: `str | None`.
+        :param region: Регион. Тип: `str | None`.
+        """
+        self.bucket = bucket
+        self.endpoint_url = endpoint_url
+        self.access_key = access_key
+        self.secret_key = secret_key
+        self.region = region
+        self._client = None
+        self._client_lock = asyncio.Lock()
+        self._exit_stack = AsyncExitStack()
+
+    async def client(self):
+        """
+        Получить клиент S3, создав его при первом обращении.
+        """
+        if self._client is None:
+            # Документы альбома сохраняются одновременно: клиент должен создать только первый из них
+            async with self._client_lock:
+                if self._client is None:
+                    # aiobotocore импортируется только при использовании S3: он тянет botocore и замедляет запуск
+                    from aiobotocore.session import get_session
+
+                    self._client = await self._exit_stack.enter_async_context(get_session().create_client(
+                        "s3", endpoint_url=self.endpoint_url, aws_access_key_id=self.access_key,
+                        aws_secret_access_key=self.secret_key, region_name=self.region
+                    ))
+        return self._client
+
+    def _ref(self, key: str) -> str:
+        return f"s3://{self.bucket}/{key}"
+
+    def _key(self, ref: str) -> str:
+        return ref.removeprefix(f"s3://{self.bucket}/")
+
+    async def save_stream(self, key: str, chunks: AsyncIterable[bytes]) -> str:
+        client = await self.client()
+        buffer = bytearray()
+        upload_id = None
+        parts = []
+        try:
+            async for chunk in chunks:
+                buffer.extend(chunk)
+                if len(buffer) >= S3_PART_SIZE:
+                    if upload_id is None:
+                        upload = await client.create_multipart_upload(Bucket=self.bucket, Key=key)
+                        upload_id = upload["UploadId"]
+                    part = await client.upload_part(Bucket=self.bucket, Key=key, UploadId=upload_id,
+                                                    PartNumber=len(parts) + 1, Body=bytes(buffer))
+                    parts.append({"PartNumber": len(parts) + 1, "ETag": part["ETag"]})
+                    buffer.clear()
+            if upload_id is None:
+                # Файл меньше одной части - обычная загрузка
+                await client.put_object(Bucket=self.bucket, Key=key, Body=bytes(buffer))
+                return self._ref(key)
+            if buffer:
+                part = await client.upload_part(Bucket=self.bucket, Key=key, UploadId=upload_id,
+                                                PartNumber=len(parts) + 1, Body=bytes(buffer))
+                parts.append({"PartNumber": len(parts) + 1, "ETag": part["ETag"]})
+            await client.complete_multipart_upload(Bucket=self.bucket, Key=key, UploadId=upload_id,
+                                                   MultipartUpload={"Parts": parts})
+        except BaseException:
+            if upload_id is not None:
+                await client.abort_multipart_upload(Bucket=self.bucket, Key=key, UploadId=upload_id)
+            raise
+        return self._ref(key)
+
+    def input_file(self, ref: str, filename: str) -> InputFile:
+        return S3InputFile(self, self._key(ref), filename)
+
+    async def delete(self, refs: list) -> None:
+        client = await self.client()
+        keys = [self._key(ref) for ref in refs]
+        # DeleteObjects принимает не больше 1000 ключей за запрос
+        for start in range(0, len(keys), 1000):
+            await client.delete_objects(Bucket=self.bucket, Delete={
+                "Objects": [{"Key": key} for key in keys[start:start + 1000]], "Quiet": True
+            })
+
+    async def close(self) -> None:
+        await self._exit_stack.aclose()
+        self._client = None
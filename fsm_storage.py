@@ -0,0 +1,200 @@
+import asyncio
+import json
+import logging
+import math
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+
+import msgpack
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+from aiogram.fsm.storage.redis import RedisStorage
+from redis.asyncio.client import Redis
+
+
+class MsgpackRedisStorage(RedisStorage):
+    """
+    Хранилище FSM в Redis, которое сериализует данные пользователя в msgpack вместо JSON.
+
+    msgpack компактнее JSON и сохраняет типы ключей (`int` остаётся `int`).
+    Данные, записанные в JSON до перехода на msgpack, по-прежнему читаются.
+    """
+
+    def __init__(self, redis: Redis, **kwargs: Any) -> None:
+        kwargs.setdefault("json_dumps", msgpack.packb)
+        kwargs.setdefault("json_loads", json.loads)
+        super().__init__(redis, **kwargs)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        redis_key = self.key_builder.build(key, "data")
+        value = await self.redis.get(redis_key)
+        if value is None:
+            return {}
+        try:
+            return msgpack.unpackb(value, strict_map_key=False)
+        except ValueError:
+            # Данные, записанные в JSON до перехода на msgpack
+            return self.json_loads(value)
+
+
+# Маркер "значение еще не загружено из нижнего уровня"
+_MISSING = object()
+
+
+@dataclass
+class _Entry:
+    state: Any = _MISSING
+    data: Any = _MISSING
+    dirty_state: bool = False
+    dirty_data: bool = False
+    expires_at: float = math.inf
+
+
+class TieredStorage(BaseStorage):
+    """
+    Двухуровневое хранилище FSM: ограниченный LRU-кэш в памяти процесса (L1) поверх другого хранилища
+    (как правило, `MsgpackRedisStorage`), которое остается долговременной копией на случай перезапуска.
+
+    При `flush_interval=0` запись сквозная (write-through): каждое изменение сразу пишется в нижний уровень.
+    При `flush_interval>0` запись отложенная (write-behind): изменения копятся в L1 и сбрасываются пачкой
+    раз в `flush_interval` секунд, при вытеснении записи из L1 и при закрытии хранилища.
+
+    Рассчитано на маршрутизацию обновлений по пользователям: сессию пользователя обслуживает один процесс,
+    иначе процессы будут видеть устаревшие копии из своих L1.
+    """
+
+    def __init__(self, backend: BaseStorage, max_size: int = 10000, flush_interval: float = 0,
+                 ttl: Optional[float] = None) -> None:
+        """
+        :param backend: Нижний уровень (долговременное хранилище). Тип: `BaseStorage`.
+        :param max_size: Максимальное количество сессий в L1. Тип: `int`.
+        :param flush_interval: Интервал (сек.) отложенной записи. `0` - сквозная запись. Тип: `float`.
+        :param ttl: Через сколько секунд после последней записи сессия считается истекшей
+                    (обычно равен TTL данных в Redis). `None` - без ограничения. Тип: `float | None`.
+        """
+        self.backend = backend
+        self.max_size = max_size
+        self.flush_interval = flush_interval
+        self.ttl = ttl
+        self._entries: OrderedDict[StorageKey, _Entry] = OrderedDict()
+        # Вытесненные из L1 сессии, запись которых в нижний уровень еще идет
+        self._evicting: Dict[StorageKey, _Entry] = {}
+        self._flush_task: Optional[asyncio.Task] = None
+
+    def _entry(self, key: StorageKey) -> _Entry:
+        entry = self._entries.get(key)
+        if entry is None and key in self._evicting:
+            # Вытесненная сессия еще записывается: она свежее нижнего уровня, возвращаем ее в L1
+            entry = self._entries[key] = self._evicting[key]
+        if entry is not None and entry.expires_at <= time.monotonic() and not (entry.dirty_state or entry.dirty_data):
+            del self._entries[key]
+            entry = None
+        if entry is None:
+            entry = self._entries[key] = _Entry(expires_at=self._expires_at())
+        else:
+            self._entries.move_to_end(key)
+        return entry
+
+    def _expires_at(self) -> float:
+        return time.monotonic() + self.ttl if self.ttl else math.inf
+
+    async def _evict(self) -> None:
+        while len(self._entries) > self.max_size:
+            key, entry = self._entries.popitem(last=False)
+            if not (entry.dirty_state or entry.dirty_data):
+                continue
+            self._evicting[key] = entry
+            try:
+                await self._write(key, entry)
+            except Exception as e:
+                logging.error(f"Не удалось записать вытесненную сессию FSM {key}: {e}")
+                # Сессия остается в L1 измененной и будет записана при следующем сбросе
+                self._entries.setdefault(key, entry)
+                break
+            finally:
+                if self._evicting.get(key) is entry:
+                    del self._evicting[key]
+
+    async def _write(self, key: StorageKey, entry: _Entry) -> None:
+        # Флаг снимается до записи: изменение, сделанное во время записи, снова его поставит
+        if entry.dirty_state:
+            entry.dirty_state = False
+            try:
+                await self.backend.set_state(key, entry.state)
+            except Exception:
+                entry.dirty_state = True
+                raise
+        if entry.dirty_data:
+            entry.dirty_data = False
+            try:
+                await self.backend.set_data(key, entry.data)
+            except Exception:
+                entry.dirty_data = True
+                raise
+
+    async def _changed(self, key: StorageKey, entry: _Entry) -> None:
+        entry.expires_at = self._expires_at()
+        if not self.flush_interval:
+            await self._write(key, entry)
+        elif self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_loop())
+        await self._evict()
+
+    async def _flush_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def flush(self) -> None:
+        """
+        Записать в нижний уровень все измененные сессии. Сессии, которые записать не удалось,
+        остаются измененными и будут записаны при следующем сбросе.
+        """
+        for key, entry in list(self._entries.items()):
+            if entry.dirty_state or entry.dirty_data:
+                try:
+                    await self._write(key, entry)
+                except Exception as e:
+                    logging.error(f"Ошибка отложенной записи сессии FSM {key}: {e}")
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        entry = self._entry(key)
+        entry.state = state.state if isinstance(state, State) else state
+        entry.dirty_state = True
+        await self._changed(key, entry)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        entry = self._entry(key)
+        if entry.state is _MISSING:
+            state = await self.backend.get_state(key)
+            # Пока шло чтение, состояние могли записать - тогда оно свежее прочитанного
+            if entry.state is _MISSING:
+                entry.state = state
+        await self._evict()
+        return entry.state
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        entry = self._entry(key)
+        entry.data = data.copy()
+        entry.dirty_data = True
+        await self._changed(key, entry)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        entry = self._entry(key)
+        if entry.data is _MISSING:
+            data = await self.backend.get_data(key)
+            if entry.data is _MISSING:
+                entry.data = data
+        await self._evict()
+        return entry.data.copy()
+
+    async def close(self) -> None:
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            self._flush_task = None
+        try:
+            await self.flush()
+        finally:
+            await self.backend.close()
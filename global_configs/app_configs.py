@@ -0,0 +1,152 @@
+import os
+
+
+#
+# Настройки экспорта заявок (/export)
+#
+# EXPORT_PREFETCH - Сколько строк серверный курсор забирает из PostgreSQL за один раз
+# EXPORT_TIMEOUT - Таймаут (сек.) одной выборки курсора. Первая выборка включает сортировку, поэтому больше 3 сек.
+#
+
+EXPORT_PREFETCH = int(os.getenv('PROJECT_0_EXPORT_PREFETCH', '1000'))
+EXPORT_TIMEOUT = float(os.getenv('PROJECT_0_EXPORT_TIMEOUT', '60'))
+
+
+#
+# Уведомления клиентов об изменении статуса заявки (LISTEN/NOTIFY)
+#
+# NOTIFY_RATE_LIMIT - Максимум сообщений в секунду, которые бот отправляет из очереди уведомлений
+# NOTIFY_QUEUE_SIZE - Максимальный размер очереди уведомлений. При переполнении новые уведомления отбрасываются
+# NOTIFY_RECONNECT_DELAY - Пауза (сек.) перед переподключением слушателя к PostgreSQL и интервал проверки соединения
+# NOTIFY_DEDUP_TTL - Сколько секунд уведомление о том же статусе той же заявки не отправляется повторно. Канал слушают
+#                    все запущенные экземпляры бота (например, старый и новый во время перезапуска), отправляет один
+#
+
+NOTIFY_RATE_LIMIT = float(os.getenv('PROJECT_0_NOTIFY_RATE_LIMIT', '20'))
+NOTIFY_QUEUE_SIZE = int(os.getenv('PROJECT_0_NOTIFY_QUEUE_SIZE', '10000'))
+NOTIFY_RECONNECT_DELAY = float(os.getenv('PROJECT_0_NOTIFY_RECONNECT_DELAY', '5'))
+NOTIFY_DEDUP_TTL = float(os.getenv('PROJECT_0_NOTIFY_DEDUP_TTL', '600'))
+
+
+#
+# Кэш справочников (типы лиц, категории, подкатегории, способы связи, удобное время)
+#
+# REFERENCE_CACHE_TTL - Время жизни (сек.) справочника в памяти процесса
+#
+
+REFERENCE_CACHE_TTL = float(os.getenv('PROJECT_0_REFERENCE_CACHE_TTL', '300'))
+
+
+#
+# Кэш страницы "Статус заявок" клиента в Redis. Сбрасывается при отправке заявки, смене статуса заявки клиента
+# и изменении системных пользователей (добавление, удаление, смена статуса)
+#
+# STATUS_PAGE_CACHE_TTL - Время жизни (сек.) страницы на случай изменений в обход бота и триггеров.
+#                         Значение 0 отключает кэш
+#
+
+STATUS_PAGE_CACHE_TTL = float(os.getenv('PROJECT_0_STATUS_PAGE_CACHE_TTL', '600'))
+
+
+#
+# Очистка документов брошенных черновиков
+#
+# DOCS_SWEEP_INTERVAL - Интервал (сек.) между проходами очистки. Значение 0 отключает очистку
+# DOCS_SWEEP_MIN_AGE - Минимальный возраст файла (сек.), после которого он может быть удален.
+#                      Должен быть не меньше TTL данных FSM (PROJECT_0_REDIS_DATA_TTL)
+# DOCS_SWEEP_BATCH_SIZE - Сколько документов черновиков проверять за один запрос к базе
+#
+
+DOCS_SWEEP_INTERVAL = float(os.getenv('PROJECT_0_DOCS_SWEEP_INTERVAL', '3600'))
+DOCS_SWEEP_MIN_AGE = float(os.getenv('PROJECT_0_DOCS_SWEEP_MIN_AGE', '172800'))
+DOCS_SWEEP_BATCH_SIZE = int(os.getenv('PROJECT_0_DOCS_SWEEP_BATCH_SIZE', '500'))
+
+
+#
+# Черновик описания задачи (other_information)
+#
+# DRAFT_TEXT_MAX_SIZE - Максимальный суммарный размер (байт, UTF-8) описания задачи из всех сообщений пользователя
+#
+
+DRAFT_TEXT_MAX_SIZE = int(os.getenv('PROJECT_0_DRAFT_TEXT_MAX_SIZE', '262144'))
+
+
+#
+# Прием документов альбомом (несколько файлов одним сообщением)
+#
+# MEDIA_GROUP_DELAY - Сколько секунд ждать следующий файл альбома, прежде чем считать альбом полученным
+#
+
+MEDIA_GROUP_DELAY = float(os.getenv('PROJECT_0_MEDIA_GROUP_DELAY', '1'))
+
+
+#
+# HTTP-сервер проверок для оркестратора: /health/live - процесс работает, /health/ready - бот прогрет и принимает обновления
+#
+# HEALTH_HOST - Адрес сервера
+# HEALTH_PORT - Порт сервера. Значение 0 отключает сервер
+#
+
+HEALTH_HOST = os.getenv('PROJECT_0_HEALTH_HOST', '0.0.0.0')
+HEALTH_PORT = int(os.getenv('PROJECT_0_HEALTH_PORT', '8080'))
+
+
+#
+# SHUTDOWN_TIMEOUT - Сколько секунд при остановке (SIGTERM/SIGINT) ждать обработки уже полученных обновлений
+#                    и отправки уведомлений из очереди. Должно быть меньше времени, которое оркестратор дает
+#                    на остановку до SIGKILL (в Kubernetes по умолчанию 30 секунд)
+#
+
+SHUTDOWN_TIMEOUT = float(os.getenv('PROJECT_0_SHUTDOWN_TIMEOUT', '25'))
+
+
+#
+# Антифлуд: ограничение частоты обращений пользователя (ведро токенов)
+#
+# THROTTLE_BACKEND - Где хранить ведра: redis - общие для всех процессов бота, memory - в памяти процесса
+# THROTTLE_LIMITS - Лимиты по классам обработчиков: <класс>=<токенов в секунду>/<емкость ведра>, через запятую.
+#                   Классы: default - по умолчанию, menu - меню и команды, heavy - тяжелые запросы к базе,
+#                   documents - загрузка документов. Пустая строка отключает антифлуд.
+#                   Текстовые шаги создания заявки не ограничиваются (см. WIZARD_INPUT_FLAGS в start_app.py)
+#
+
+THROTTLE_BACKEND = os.getenv('PROJECT_0_THROTTLE_BACKEND', 'redis')
+THROTTLE_LIMITS = {
+    name.strip(): tuple(float(value) for value in limit.split('/'))
+    for name, limit in (item.split('=') for item in os.getenv(
+        'PROJECT_0_THROTTLE_LIMITS', 'default=1/5,menu=0.5/3,heavy=0.1/2,documents=2/20'
+    ).split(',') if item.strip())
+}
+
+
+#
+# CALLBACK_DEDUP_TTL - Сколько секунд повторное нажатие той же inline-кнопки того же сообщения считается дублем
+#                      и не обрабатывается. Значение 0 отключает проверку
+#
+
+CALLBACK_DEDUP_TTL = float(os.getenv('PROJECT_0_CALLBACK_DEDUP_TTL', '3'))
+
+
+#
+# Запись заявок пачками при всплеске отправок
+#
+# INSERT_BATCH_DELAY - Сколько секунд копить отправленные заявки, чтобы вставить их одним запросом.
+#                      Значение 0 - каждая заявка вставляется сразу своим запросом
+# INSERT_BATCH_SIZE - Максимальное количество заявок в одном запросе
+#
+
+INSERT_BATCH_DELAY = float(os.getenv('PROJECT_0_INSERT_BATCH_DELAY', '0'))
+INSERT_BATCH_SIZE = int(os.getenv('PROJECT_0_INSERT_BATCH_SIZE', '100'))
+
+
+#
+# Профилирование обработчиков по команде /profile
+#
+# PROFILE_DEFAULT_SECONDS - Длительность профилирования (сек.), если в команде не указано иное
+# PROFILE_MAX_SECONDS - Максимальная длительность профилирования (сек.)
+# PROFILE_INTERVAL - Интервал сэмплирования стека цикла событий (сек.)
+#
+
+PROFILE_DEFAULT_SECONDS = float(os.getenv('PROJECT_0_PROFILE_DEFAULT_SECONDS', '60'))
+PROFILE_MAX_SECONDS = float(os.getenv('PROJECT_0_PROFILE_MAX_SECONDS', '600'))
+PROFILE_INTERVAL = float(os.getenv('PROJECT_0_PROFILE_INTERVAL', '0.005'))
@@ -26,4 +26,35 @@ DBMS_USER = os.getenv('PROJECT_0_POSTGRESQL_USER')
 DBMS_PASSWORD = os.getenv('PROJECT_0_POSTGRESQL_PASSWORD')
 DBMS_DATABASE = os.getenv('PROJECT_0_POSTGRESQL_DATABASE')
 
-REDIS_HOST = os.getenv('PROJECT_0_REDIS_HOST')
\ No newline at end of file
+REDIS_HOST = os.getenv('PROJECT_0_REDIS_HOST')
+
+
+#
+# Время жизни (сек.) ключей FSM в Redis. Брошенные черновики заявок удаляются по истечении TTL.
+# Значение 0 отключает TTL.
+#
+# REDIS_STATE_TTL - TTL ключа состояния
+# REDIS_DATA_TTL - TTL ключа данных (черновика заявки)
+#
+
+REDIS_STATE_TTL = int(os.getenv('PROJECT_0_REDIS_STATE_TTL', '172800')) or None
+REDIS_DATA_TTL = int(os.getenv('PROJECT_0_REDIS_DATA_TTL', '172800')) or None
+
+
+#
+# Кэш сессий FSM в памяти процесса поверх Redis
+#
+# FSM_L1_SIZE - Максимальное количество сессий в памяти процесса. Значение 0 отключает кэш (FSM читается из Redis)
+# FSM_FLUSH_INTERVAL - Интервал (сек.) отложенной записи изменений в Redis. Значение 0 - запись в Redis сразу
+#
+
+FSM_L1_SIZE = int(os.getenv('PROJECT_0_FSM_L1_SIZE', '10000'))
+FSM_FLUSH_INTERVAL = float(os.getenv('PROJECT_0_FSM_FLUSH_INTERVAL', '0'))
+
+
+#
+# RUN_MIGRATIONS - Применять миграции из папки migrations при запуске бота (1 - да, 0 - нет).
+# Миграции можно применить и вручную: `python migrate.py`
+#
+
+RUN_MIGRATIONS = os.getenv('PROJECT_0_RUN_MIGRATIONS', '1') == '1'
@@ -0,0 +1,28 @@
+import os
+
+
+#
+# DOCS_STORAGE - Где хранятся документы заявок:
+#
+# * local - папка docs рядом с start_app.py
+# * s3 - S3-совместимое объектное хранилище (AWS S3, MinIO и т.п.), общее для нескольких экземпляров бота
+#
+
+DOCS_STORAGE = os.getenv('PROJECT_0_DOCS_STORAGE', 'local')
+
+
+#
+# Данные для подключения к S3 (используются при DOCS_STORAGE = 's3'):
+#
+# S3_ENDPOINT_URL - Адрес S3 API, например http://localhost:9000 для MinIO. Пусто - AWS S3
+# S3_BUCKET - Бакет для документов
+# S3_ACCESS_KEY - Ключ доступа
+# S3_SECRET_KEY - Секретный ключ
+# S3_REGION - Регион
+#
+
+S3_ENDPOINT_URL = os.getenv('PROJECT_0_S3_ENDPOINT_URL')
+S3_BUCKET = os.getenv('PROJECT_0_S3_BUCKET')
+S3_ACCESS_KEY = os.getenv('PROJECT_0_S3_ACCESS_KEY')
+S3_SECRET_KEY = os.getenv('PROJECT_0_S3_SECRET_KEY')
+S3_REGION = os.getenv('PROJECT_0_S3_REGION')
@@ -5,3 +5,36 @@ import os
 CHAT_ID = os.getenv('PROJECT_0_TELEGRAM_CHAT_ID')
 # Токен бота
 BOT_TOKEN = os.getenv('PROJECT_0_TELEGRAM_BOT_TOKEN')
+
+
+#
+# Собственный сервер Bot API (telegram-bot-api)
+#
+# BOT_API_SERVER_URL - Адрес сервера, например http://localhost:8081. Пусто - облачный api.telegram.org
+# BOT_API_LOCAL_MODE - Сервер запущен с --local: документы до 2000 МБ, и бот забирает их с диска сервера
+#                      (жесткой ссылкой или копированием), а не скачивает по HTTP
+# BOT_API_SERVER_FILES_DIR - Папка с файлами (--dir) так, как ее видит сервер Bot API
+# BOT_API_LOCAL_FILES_DIR - Та же папка так, как ее видит бот (если сервер в другом контейнере). Пусто - пути совпадают
+#
+
+BOT_API_SERVER_URL = os.getenv('PROJECT_0_BOT_API_SERVER_URL', '')
+BOT_API_LOCAL_MODE = os.getenv('PROJECT_0_BOT_API_LOCAL_MODE', '1') == '1' and bool(BOT_API_SERVER_URL)
+BOT_API_SERVER_FILES_DIR = os.getenv('PROJECT_0_BOT_API_SERVER_FILES_DIR', '')
+BOT_API_LOCAL_FILES_DIR = os.getenv('PROJECT_0_BOT_API_LOCAL_FILES_DIR', '')
+
+# Максимальный размер документа, который бот может получить (МБ): от облачного Bot API и от сервера с --local
+DOCUMENT_MAX_SIZE_MB = 20
+LOCAL_DOCUMENT_MAX_SIZE_MB = 2000
+
+
+#
+# Пул соединений к Bot API
+#
+# BOT_API_POOL_LIMIT - Максимальное количество одновременных соединений
+# BOT_API_KEEPALIVE_TIMEOUT - Сколько секунд держать простаивающее соединение открытым для повторного использования
+# BOT_API_TIMEOUT - Таймаут запроса к Bot API (сек.)
+#
+
+BOT_API_POOL_LIMIT = int(os.getenv('PROJECT_0_BOT_API_POOL_LIMIT', '100'))
+BOT_API_KEEPALIVE_TIMEOUT = float(os.getenv('PROJECT_0_BOT_API_KEEPALIVE_TIMEOUT', '15'))
+BOT_API_TIMEOUT = float(os.getenv('PROJECT_0_BOT_API_TIMEOUT', '60'))
@@ -0,0 +1,230 @@
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from aiogram import BaseMiddleware
+from aiogram.dispatcher.flags import get_flag
+from aiogram.types import CallbackQuery, TelegramObject, Update
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+
+
+class InFlightMiddleware(BaseMiddleware):
+    """
+    Учет обновлений, которые обрабатываются в данный момент. Регистрируется как outer-middleware на `update`.
+
+    Нужен для плавной остановки: после остановки опроса бот дожидается обработки уже полученных обновлений
+    (`wait_idle`), а не обрывает их вместе с закрытием хранилища FSM и сессии бота.
+    """
+
+    def __init__(self) -> None:
+        # Задача обработки -> ID обновления
+        self.tasks: Dict[asyncio.Task, int] = {}
+        # Наибольший ID обновления, которое дошло до обработки
+        self.last_update_id: int | None = None
+        self._idle = asyncio.Event()
+        self._idle.set()
+
+    async def __call__(self, handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+                       event: Update, data: Dict[str, Any]) -> Any:
+        task = asyncio.current_task()
+        self.tasks[task] = event.update_id
+        self._idle.clear()
+        if self.last_update_id is None or event.update_id > self.last_update_id:
+            self.last_update_id = event.update_id
+        try:
+            return await handler(event, data)
+        finally:
+            del self.tasks[task]
+            if not self.tasks:
+                self._idle.set()
+
+    async def wait_idle(self, timeout: float) -> bool:
+        """
+        Дождаться, пока не останется обновлений в обработке.
+
+        :param timeout: Максимальное время ожидания (сек.). Тип: `float`.
+        :return: `True` - все обновления обработаны, `False` - истекло время ожидания.
+        """
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout=max(timeout, 0))
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    async def cancel(self) -> list:
+        """
+        Прервать обработку оставшихся обновлений.
+
+        :return: ID прерванных обновлений. Тип: `list[int]`.
+        """
+        tasks = dict(self.tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        return sorted(tasks.values())
+
+
+# Ведро токенов пользователя в Redis: пополняет ведро по прошедшему времени и пытается взять один токен.
+# KEYS[1] - ключ ведра. ARGV[1] - скорость пополнения (токенов в секунду), ARGV[2] - емкость ведра.
+# Возвращает 1 - токен взят, -1 - токенов нет (первый отказ подряд), 0 - токенов нет (повторный отказ).
+TOKEN_BUCKET_LUA = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'ts', 'rejected')
+local tokens = tonumber(bucket[1]) or burst
+local ts = tonumber(bucket[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+local result
+if tokens >= 1 then
+    tokens = tokens - 1
+    result = 1
+elseif bucket[3] == '1' then
+    result = 0
+else
+    result = -1
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now), 'rejected', result == 1 and '0' or '1')
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+return result
+"""
+
+
+class ThrottlingMiddleware(BaseMiddleware):
+    """
+    Ограничение частоты обращений пользователя (антифлуд) по алгоритму ведра токенов.
+
+    Регистрируется на `message` и `callback_query`. Класс лимита задается флагом обработчика `throttling`
+    (`flags={"throttling": "menu"}`), без флага используется класс `default`; `flags={"throttling": None}`
+    отключает ограничение. Лишнее обновление отбрасывается до вызова обработчика, поэтому не нагружает
+    базу и Redis. Предупреждение пользователю отправляется один раз на серию отказов, а не на каждый.
+
+    С клиентом Redis ведра общие для всех процессов бота, без него - свои у каждого процесса.
+    """
+
+    def __init__(self, limits: Dict[str, tuple], redis: Optional[Redis] = None) -> None:
+        """
+        :param limits: Лимиты по классам: имя -> (токенов в секунду, емкость ведра). Тип: `dict[str, tuple]`.
+        :param redis: Клиент Redis или `None`, чтобы хранить ведра в памяти процесса. Тип: `Redis | None`.
+        """
+        self.limits = limits
+        self.redis = redis
+        self._script = redis.register_script(TOKEN_BUCKET_LUA) if redis is not None else None
+        # Ведра в памяти процесса: ключ -> [токены, время, был ли отказ]
+        self._buckets: Dict[str, list] = {}
+
+    async def __call__(self, handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+                       event: TelegramObject, data: Dict[str, Any]) -> Any:
+        name = get_flag(data, "throttling", default="default")
+        user = data.get("event_from_user")
+        if name is None or name not in self.limits or user is None:
+            return await handler(event, data)
+        rate, burst = self.limits[name]
+        result = await self.take(f"throttle:{user.id}:{name}", rate, burst)
+        if result > 0:
+            return await handler(event, data)
+        if result < 0:
+            logging.info(f"Антифлуд: обновления пользователя отбрасываются (ID пользователя: {user.id}) "
+                         f"(Класс: {name})")
+            if isinstance(event, CallbackQuery):
+                await event.answer("Слишком часто. Подождите немного.")
+            else:
+                await event.answer("🤖 Слишком много сообщений. Подождите немного.")
+        return None
+
+    async def take(self, key: str, rate: float, burst: float) -> int:
+        """
+        Взять токен из ведра.
+
+        :param key: Ключ ведра. Тип: `str`.
+        :param rate: Скорость пополнения, токенов в секунду. Тип: `float`.
+        :param burst: Емкость ведра. Тип: `float`.
+        :return: 1 - токен взят, -1 - токенов нет (первый отказ подряд), 0 - токенов нет (повторный отказ).
+        """
+        if self._script is None:
+            return self._take_local(key, rate, burst)
+        try:
+            return int(await self._script(keys=[key], args=[rate, burst]))
+        except RedisError as e:
+            # Недоступность Redis не должна останавливать бота: пропускаем обновление без ограничения
+            logging.error(f"Антифлуд: ошибка Redis, ограничение не применено: {e}")
+            return 1
+
+    def _take_local(self, key: str, rate: float, burst: float) -> int:
+        now = time.monotonic()
+        if len(self._buckets) > 10000:
+            # Удаляем ведра, которые успели наполниться целиком: они ничем не отличаются от новых
+            self._buckets = {k: b for k, b in self._buckets.items() if b[0] + (now - b[1]) * rate < burst}
+        tokens, ts, rejected = self._buckets.get(key, (burst, now, False))
+        tokens = min(burst, tokens + (now - ts) * rate)
+        if tokens >= 1:
+            self._buckets[key] = [tokens - 1, now, False]
+            return 1
+        self._buckets[key] = [tokens, now, True]
+        return 0 if rejected else -1
+
+
+class CallbackDedupMiddleware(BaseMiddleware):
+    """
+    Отбрасывание повторных нажатий одной и той же inline-кнопки. Регистрируется как outer-middleware
+    на `callback_query`, то есть до фильтров и обработчиков.
+
+    Нажатие определяется ключом (пользователь, сообщение, состояние FSM, callback_data). Первое нажатие занимает
+    ключ в Redis на `ttl` секунд (SET NX EX), повторные нажатия в этот срок получают пустой ответ и не обрабатываются.
+    Состояние входит в ключ, потому что шаги создания заявки редактируют одно и то же сообщение, а кнопки разных
+    шагов (тип лица, категория, подкатегория) используют одни и те же номера: нажатие "1" на следующем шаге -
+    новый выбор, а не повтор.
+    Ключ общий для всех процессов бота, поэтому дубль отбрасывается, даже если попал в другой процесс.
+    """
+
+    def __init__(self, redis: Redis, ttl: float) -> None:
+        """
+        :param redis: Клиент Redis. Тип: `Redis`.
+        :param ttl: Сколько секунд нажатие считается повторным. Тип: `float`.
+        """
+        self.redis = redis
+        self.ttl = ttl
+
+    async def __call__(self, handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+                       event: CallbackQuery, data: Dict[str, Any]) -> Any:
+        message_id = event.message.message_id if event.message else event.inline_message_id
+        # raw_state кладет FSMContextMiddleware, который выполняется раньше, на уровне update
+        key = f"callback:{event.from_user.id}:{message_id}:{data.get('raw_state')}:{event.data}"
+        try:
+            first = await self.redis.set(key, 1, nx=True, px=int(self.ttl * 1000))
+        except RedisError as e:
+            logging.error(f"Дедупликация нажатий: ошибка Redis, нажатие обработано без проверки: {e}")
+            first = True
+        if first:
+            return await handler(event, data)
+        logging.info(f"Повторное нажатие отброшено (ID пользователя: {event.from_user.id}) (Кнопка: {event.data})")
+        # Ответ нужен, чтобы у пользователя пропал индикатор загрузки на кнопке
+        await event.answer()
+        return None
+
+
+class ProfilingMiddleware(BaseMiddleware):
+    """
+    Замер времени обработчиков для профилирования по команде /profile. Регистрируется на `message`
+    и `callback_query` после антифлуда, поэтому учитывает только обновления, дошедшие до обработчика.
+
+    Пока сеанс профилирования не запущен (`session is None`), обновление сразу передается обработчику.
+    """
+
+    def __init__(self) -> None:
+        # Текущий сеанс профилирования (`profiler.ProfileSession`) или `None`
+        self.session = None
+
+    async def __call__(self, handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+                       event: TelegramObject, data: Dict[str, Any]) -> Any:
+        session = self.session
+        if session is None:
+            return await handler(event, data)
+        start = time.perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            session.record(data["handler"].callback.__name__, time.perf_counter() - start)
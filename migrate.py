@@ -0,0 +1,193 @@
+import argparse
+import asyncio
+import logging
+import re
+from pathlib import Path
+
+import asyncpg
+
+from global_configs.database_configs import DBMS_HOST, DBMS_PORT, DBMS_USER, DBMS_PASSWORD, DBMS_DATABASE
+
+
+# Папка с миграциями. Файл миграции - `<номер>_<описание>.sql`, применяются по возрастанию номера
+MIGRATIONS_DIR = Path(__file__).parent / 'migrations'
+
+# Первая строка миграции, которую нужно выполнять вне транзакции (например, `CREATE INDEX CONCURRENTLY`).
+# Такая миграция выполняется по одному оператору, а операторы разделяются `;` в конце строки
+NO_TRANSACTION_MARK = '-- no-transaction'
+
+# Ключ advisory-блокировки: несколько экземпляров бота, запущенных одновременно, применяют миграции по очереди
+MIGRATIONS_LOCK_KEY = 7340034
+
+# Пауза (сек.) между попытками взять блокировку миграций
+MIGRATIONS_LOCK_RETRY_DELAY = 1
+
+# Оператор `CREATE [UNIQUE] INDEX CONCURRENTLY [IF NOT EXISTS] <индекс> ON <схема>.<таблица>`
+CONCURRENT_INDEX_RE = re.compile(
+    r'^CREATE\s+(?:UNIQUE\s+)?INDEX\s+CONCURRENTLY\s+(?:IF\s+NOT\s+EXISTS\s+)?(\w+)\s+ON\s+(?:ONLY\s+)?(\w+)\.',
+    re.IGNORECASE
+)
+
+# Валидность индекса: NULL - индекса нет, false - построение индекса прервалось
+INDEX_VALID_QUERY = ("SELECT i.indisvalid FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+                     "JOIN pg_namespace n ON n.oid = c.relnamespace WHERE n.nspname = $1 AND c.relname = $2")
+
+MIGRATION_FILE_RE = re.compile(r'^(\d+)_[\w-]+\.sql$')
+
+
+def list_migrations() -> list:
+    """
+    Получить миграции из папки `MIGRATIONS_DIR`, отсортированные по номеру.
+
+    :return: Список пар (версия, путь к файлу). Тип: `list[tuple[str, Path]]`.
+    """
+    migrations = []
+    for path in MIGRATIONS_DIR.glob('*.sql'):
+        match = MIGRATION_FILE_RE.match(path.name)
+        if match is None:
+            raise ValueError(f"Некорректное имя файла миграции: {path.name}")
+        migrations.append((int(match.group(1)), path.stem, path))
+    migrations.sort()
+    return [(version, path) for _, version, path in migrations]
+
+
+def split_statements(sql: str) -> list:
+    """
+    Разбить миграцию на операторы по `;` в конце строки. Рассчитано на простые операторы без `$$`-блоков.
+
+    :param sql: Текст миграции. Тип: `str`.
+    :return: Операторы. Тип: `list[str]`.
+    """
+    statements = re.split(r';[ \t]*$', sql, flags=re.MULTILINE)
+    result = []
+    for statement in statements:
+        # Отбрасываем комментарии, чтобы не выполнять пустые операторы
+        code = '\n'.join(line for line in statement.splitlines() if not line.strip().startswith('--')).strip()
+        if code:
+            result.append(code)
+    return result
+
+
+async def applied_migrations(connection: asyncpg.Connection) -> set:
+    """
+    Получить версии уже примененных миграций.
+
+    :param connection: Подключение к базе PostgreSQL. Тип: `asyncpg.Connection`.
+    :return: Версии миграций. Тип: `set[str]`.
+    """
+    await connection.execute("""
+        CREATE TABLE IF NOT EXISTS public.schema_migrations (
+            version     text PRIMARY KEY,
+            applied_at  timestamptz NOT NULL DEFAULT now()
+        )
+    """)
+    rows = await connection.fetch("SELECT version FROM public.schema_migrations")
+    return {row['version'] for row in rows}
+
+
+async def create_index_concurrently(connection: asyncpg.Connection, statement: str, schema: str, index: str) -> None:
+    """
+    Выполнить `CREATE INDEX CONCURRENTLY`.
+
+    Прерванное построение оставляет невалидный индекс, который `IF NOT EXISTS` молча пропустил бы, поэтому
+    невалидный индекс с тем же именем сначала удаляется, а после построения индекс проверяется.
+
+    :param connection: Подключение к базе PostgreSQL. Тип: `asyncpg.Connection`.
+    :param statement: Оператор создания индекса. Тип: `str`.
+    :param schema: Схема индекса (схема таблицы). Тип: `str`.
+    :param index: Имя индекса. Тип: `str`.
+    :return: Возвращает `None`
+    :raises RuntimeError: Если индекс после построения невалиден.
+    """
+    if await connection.fetchval(INDEX_VALID_QUERY, schema, index) is False:
+        logging.warning(f"Удаление невалидного индекса {schema}.{index} перед повторным построением")
+        await connection.execute(f'DROP INDEX CONCURRENTLY IF EXISTS "{schema}"."{index}"')
+    await connection.execute(statement)
+    if not await connection.fetchval(INDEX_VALID_QUERY, schema, index):
+        raise RuntimeError(f"Индекс {schema}.{index} после построения невалиден")
+
+
+async def apply_migration(connection: asyncpg.Connection, version: str, path: Path) -> None:
+    """
+    Применить одну миграцию и отметить ее в `schema_migrations`.
+
+    :param connection: Подключение к базе PostgreSQL. Тип: `asyncpg.Connection`.
+    :param version: Версия миграции. Тип: `str`.
+    :param path: Путь к файлу миграции. Тип: `Path`.
+    :return: Возвращает `None`
+    """
+    sql = path.read_text(encoding='utf-8')
+    if sql.lstrip().startswith(NO_TRANSACTION_MARK):
+        # Операторы должны быть идемпотентными (IF NOT EXISTS): при сбое миграция повторится целиком
+        for statement in split_statements(sql):
+            match = CONCURRENT_INDEX_RE.match(statement)
+            if match is not None:
+                await create_index_concurrently(connection, statement, match.group(2), match.group(1))
+            else:
+                await connection.execute(statement)
+        await connection.execute("INSERT INTO public.schema_migrations (version) VALUES ($1)", version)
+    else:
+        async with connection.transaction():
+            await connection.execute(sql)
+            await connection.execute("INSERT INTO public.schema_migrations (version) VALUES ($1)", version)
+
+
+async def run_migrations() -> list:
+    """
+    Применить все непримененные миграции. Используется отдельное подключение без ограничения времени запроса:
+    построение индекса на большой таблице может занять больше, чем таймаут пула бота.
+
+    :return: Версии примененных миграций. Тип: `list[str]`.
+    """
+    connection = await asyncpg.connect(host=DBMS_HOST, port=DBMS_PORT, user=DBMS_USER,
+                                       password=DBMS_PASSWORD, database=DBMS_DATABASE)
+    try:
+        # Не ждем блокировку внутри pg_advisory_lock: ожидающий запрос держит снимок данных, а CREATE INDEX
+        # CONCURRENTLY у держателя блокировки ждет завершения всех старых снимков - вышла бы взаимная блокировка
+        while not await connection.fetchval("SELECT pg_try_advisory_lock($1)", MIGRATIONS_LOCK_KEY):
+            await asyncio.sleep(MIGRATIONS_LOCK_RETRY_DELAY)
+        try:
+            applied = await applied_migrations(connection)
+            new_versions = []
+            for version, path in list_migrations():
+                if version in applied:
+                    continue
+                logging.info(f"Применение миграции {version}")
+                await apply_migration(connection, version, path)
+                new_versions.append(version)
+            return new_versions
+        finally:
+            await connection.execute("SELECT pg_advisory_unlock($1)", MIGRATIONS_LOCK_KEY)
+    finally:
+        await connection.close()
+
+
+async def show_migrations() -> None:
+    """
+    Вывести список миграций и отметку, применена ли каждая из них.
+    """
+    connection = await asyncpg.connect(host=DBMS_HOST, port=DBMS_PORT, user=DBMS_USER,
+                                       password=DBMS_PASSWORD, database=DBMS_DATABASE)
+    try:
+        applied = await applied_migrations(connection)
+    finally:
+        await connection.close()
+    for version, _ in list_migrations():
+        print(f"[{'x' if version in applied else ' '}] {version}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Миграции базы данных бота')
+    parser.add_argument('--list', action='store_true', help='показать миграции и их состояние, ничего не применяя')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    if args.list:
+        asyncio.run(show_migrations())
+        return
+    versions = asyncio.run(run_migrations())
+    print(f"Применено миграций: {len(versions)}" if versions else 'Все миграции уже применены')
+
+
+if __name__ == '__main__':
+    main()
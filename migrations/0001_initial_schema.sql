@@ -0,0 +1,94 @@
+-- Исходная схема базы данных бота.
+-- Все объекты создаются с IF NOT EXISTS: на базе, созданной вручную до появления миграций, миграция ничего не меняет.
+
+CREATE SCHEMA IF NOT EXISTS system_users_telegram_bot;
+CREATE SCHEMA IF NOT EXISTS applications;
+
+-- Системные пользователи ----------------------------------------------------------------------------------------------
+
+CREATE TABLE IF NOT EXISTS system_users_telegram_bot.access (
+    access_id       serial PRIMARY KEY,
+    access_name     text NOT NULL,
+    access_reading  boolean NOT NULL DEFAULT false,
+    access_record   boolean NOT NULL DEFAULT false,
+    access_removal  boolean NOT NULL DEFAULT false
+);
+
+CREATE TABLE IF NOT EXISTS system_users_telegram_bot.system_users_for_telegram (
+    system_user_id  serial PRIMARY KEY,
+    telegram_id     bigint NOT NULL,
+    full_name       text,
+    status          boolean NOT NULL DEFAULT true,
+    access_id       integer NOT NULL REFERENCES system_users_telegram_bot.access (access_id),
+    description     text
+);
+
+-- Справочники ---------------------------------------------------------------------------------------------------------
+
+CREATE TABLE IF NOT EXISTS applications.entity_types (
+    entity_type_id    serial PRIMARY KEY,
+    name_entity_type  text NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS applications.categories (
+    category_id    serial PRIMARY KEY,
+    name_category  text NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS applications.subcategories (
+    subcategory_id    serial PRIMARY KEY,
+    category_id       integer NOT NULL REFERENCES applications.categories (category_id),
+    name_subcategory  text NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS applications.feedback (
+    feedback_id    serial PRIMARY KEY,
+    name_feedback  text NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS applications.convenient_time (
+    convenient_time_id    serial PRIMARY KEY,
+    convenient_time_name  text NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS applications.statuses (
+    status_id    serial PRIMARY KEY,
+    name_status  text NOT NULL
+);
+
+-- Бот сравнивает тип лица по названию, поэтому в пустой базе заводим оба типа
+INSERT INTO applications.entity_types (name_entity_type)
+SELECT name FROM (VALUES ('Физическое лицо'), ('Юридическое лицо')) AS t (name)
+WHERE NOT EXISTS (SELECT 1 FROM applications.entity_types);
+
+-- Статус по умолчанию для новых заявок (status_id = 1)
+INSERT INTO applications.statuses (name_status)
+SELECT 'Новая'
+WHERE NOT EXISTS (SELECT 1 FROM applications.statuses);
+
+-- Заявки --------------------------------------------------------------------------------------------------------------
+
+CREATE TABLE IF NOT EXISTS applications.applications (
+    application_id      serial PRIMARY KEY,
+    telegram_id         bigint,
+    client_name         text,
+    organization_name   text,
+    phone               text,
+    email               text,
+    other_information   text,
+    entity_type_id      integer REFERENCES applications.entity_types (entity_type_id),
+    feedback_id         integer REFERENCES applications.feedback (feedback_id),
+    convenient_time_id  integer REFERENCES applications.convenient_time (convenient_time_id),
+    category_id         integer REFERENCES applications.categories (category_id),
+    subcategory_id      integer REFERENCES applications.subcategories (subcategory_id),
+    status_id           integer NOT NULL DEFAULT 1 REFERENCES applications.statuses (status_id),
+    created_at          timestamp NOT NULL DEFAULT now()
+);
+
+CREATE TABLE IF NOT EXISTS applications.documents (
+    document_id     serial PRIMARY KEY,
+    application_id  integer NOT NULL REFERENCES applications.applications (application_id) ON DELETE CASCADE,
+    file_path       text NOT NULL,
+    original_name   text,
+    uploaded_at     timestamp NOT NULL DEFAULT now()
+);
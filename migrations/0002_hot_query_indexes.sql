@@ -0,0 +1,28 @@
+-- no-transaction
+-- Индексы для частых запросов бота. Создаются CONCURRENTLY, чтобы не блокировать запись в рабочую базу,
+-- поэтому миграция выполняется вне транзакции, по одному оператору.
+-- Невалидный индекс, оставшийся после прерванного построения, migrate.py удаляет и строит заново.
+
+-- Поиск системного пользователя при каждом обращении к боту
+CREATE INDEX CONCURRENTLY IF NOT EXISTS system_users_for_telegram_telegram_id_idx
+    ON system_users_telegram_bot.system_users_for_telegram (telegram_id);
+
+-- "Статус заявок" клиента: WHERE telegram_id = $1 ORDER BY created_at DESC
+CREATE INDEX CONCURRENTLY IF NOT EXISTS applications_telegram_id_created_at_idx
+    ON applications.applications (telegram_id, created_at DESC);
+
+-- Список заявок для системных пользователей и выгрузка /export: ORDER BY created_at
+CREATE INDEX CONCURRENTLY IF NOT EXISTS applications_created_at_idx
+    ON applications.applications (created_at DESC);
+
+-- Документы заявки: WHERE application_id = $1 ORDER BY uploaded_at
+CREATE INDEX CONCURRENTLY IF NOT EXISTS documents_application_id_uploaded_at_idx
+    ON applications.documents (application_id, uploaded_at);
+
+-- Очистка документов брошенных черновиков: WHERE file_path = ANY($1)
+CREATE INDEX CONCURRENTLY IF NOT EXISTS documents_file_path_idx
+    ON applications.documents (file_path);
+
+-- Подкатегории выбранной категории
+CREATE INDEX CONCURRENTLY IF NOT EXISTS subcategories_category_id_idx
+    ON applications.subcategories (category_id);
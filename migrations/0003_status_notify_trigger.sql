@@ -0,0 +1,21 @@
+-- Уведомление клиента о смене статуса заявки: триггер публикует событие в канал LISTEN/NOTIFY,
+-- который слушает бот. Имя канала должно совпадать с `STATUS_NOTIFY_CHANNEL` в `start_app.py`.
+
+CREATE OR REPLACE FUNCTION applications.notify_application_status_changed() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    PERFORM pg_notify('application_status_changed', json_build_object(
+        'application_id', NEW.application_id,
+        'telegram_id', NEW.telegram_id,
+        'status_id', NEW.status_id,
+        'name_status', (SELECT name_status FROM applications.statuses WHERE status_id = NEW.status_id),
+        'created_at', to_char(NEW.created_at, 'DD.MM.YYYY HH24:MI')
+    )::text);
+    RETURN NEW;
+END;
+$$;
+
+CREATE OR REPLACE TRIGGER application_status_changed
+    AFTER UPDATE OF status_id ON applications.applications
+    FOR EACH ROW WHEN (OLD.status_id IS DISTINCT FROM NEW.status_id)
+    EXECUTE FUNCTION applications.notify_application_status_changed();
@@ -0,0 +1,8 @@
+-- no-transaction
+-- Ключ идемпотентности заявки: создается при начале заполнения заявки и передается в INSERT при отправке.
+-- Повторная отправка того же черновика (двойное нажатие, повтор обновления после перезапуска) не создает вторую заявку.
+
+ALTER TABLE applications.applications ADD COLUMN IF NOT EXISTS idempotency_key uuid;
+
+CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS applications_idempotency_key_key
+    ON applications.applications (idempotency_key);
@@ -0,0 +1,63 @@
+-- Сводная статистика заявок для кнопки "Аналитика": количество заявок по дню, статусу, категории и типу лица.
+-- Таблица обновляется триггером при каждом изменении заявки, поэтому отчет не сканирует applications.applications.
+-- Заявки без категории (физические лица) учитываются с category_id = 0, без типа лица - с entity_type_id = 0.
+--
+-- Счетчик разбит на слоты: иначе все одновременные заявки одного дня, статуса, категории и типа лица обновляли бы
+-- одну строку и ждали ее блокировку до конца транзакции. Соединение пишет в свой слот (pg_backend_pid() % 16),
+-- а отчет суммирует слоты (ANALYTICS_QUERIES использует sum). Уменьшение счетчика тоже пишется в свой слот,
+-- поэтому отдельный слот может быть отрицательным.
+
+CREATE TABLE IF NOT EXISTS applications.application_stats (
+    day             date NOT NULL,
+    status_id       integer NOT NULL,
+    category_id     integer NOT NULL,
+    entity_type_id  integer NOT NULL,
+    slot            smallint NOT NULL DEFAULT 0,
+    applications    bigint NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, status_id, category_id, entity_type_id, slot)
+);
+
+CREATE OR REPLACE FUNCTION applications.update_application_stats() RETURNS trigger
+LANGUAGE plpgsql AS $$
+DECLARE
+    stats_slot smallint := pg_backend_pid() % 16;
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        INSERT INTO applications.application_stats AS stats
+            (day, status_id, category_id, entity_type_id, slot, applications)
+        VALUES (OLD.created_at::date, OLD.status_id, COALESCE(OLD.category_id, 0), COALESCE(OLD.entity_type_id, 0),
+                stats_slot, -1)
+        ON CONFLICT (day, status_id, category_id, entity_type_id, slot)
+        DO UPDATE SET applications = stats.applications - 1;
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        INSERT INTO applications.application_stats AS stats
+            (day, status_id, category_id, entity_type_id, slot, applications)
+        VALUES (NEW.created_at::date, NEW.status_id, COALESCE(NEW.category_id, 0), COALESCE(NEW.entity_type_id, 0),
+                stats_slot, 1)
+        ON CONFLICT (day, status_id, category_id, entity_type_id, slot)
+        DO UPDATE SET applications = stats.applications + 1;
+    END IF;
+    RETURN NULL;
+END;
+$$;
+
+-- Триггер создается до заполнения таблицы: CREATE TRIGGER блокирует запись в заявки до конца миграции,
+-- поэтому заявки, созданные во время заполнения, не теряются и не учитываются дважды
+CREATE OR REPLACE TRIGGER application_stats_insert_delete
+    AFTER INSERT OR DELETE ON applications.applications
+    FOR EACH ROW EXECUTE FUNCTION applications.update_application_stats();
+
+CREATE OR REPLACE TRIGGER application_stats_update
+    AFTER UPDATE OF created_at, status_id, category_id, entity_type_id ON applications.applications
+    FOR EACH ROW
+    WHEN ((OLD.created_at::date, OLD.status_id, OLD.category_id, OLD.entity_type_id)
+          IS DISTINCT FROM (NEW.created_at::date, NEW.status_id, NEW.category_id, NEW.entity_type_id))
+    EXECUTE FUNCTION applications.update_application_stats();
+
+TRUNCATE applications.application_stats;
+
+INSERT INTO applications.application_stats (day, status_id, category_id, entity_type_id, applications)
+SELECT created_at::date, status_id, COALESCE(category_id, 0), COALESCE(entity_type_id, 0), count(*)
+FROM applications.applications
+GROUP BY 1, 2, 3, 4;
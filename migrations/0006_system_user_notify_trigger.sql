@@ -0,0 +1,28 @@
+-- Сброс кэша страницы "Статус заявок" при изменении системных пользователей: кэшируется только клиентская страница,
+-- поэтому пользователь, которого добавили в системные (или включили), должен сразу увидеть страницу сотрудника.
+-- Триггер публикует Telegram ID в канал, который слушает бот. Имя канала должно совпадать
+-- с `SYSTEM_USER_NOTIFY_CHANNEL` в `start_app.py`.
+
+CREATE OR REPLACE FUNCTION system_users_telegram_bot.notify_system_user_changed() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM pg_notify('system_user_changed', OLD.telegram_id::text);
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        -- Одинаковые уведомления в одной транзакции PostgreSQL доставляет один раз
+        PERFORM pg_notify('system_user_changed', NEW.telegram_id::text);
+    END IF;
+    RETURN NULL;
+END;
+$$;
+
+CREATE OR REPLACE TRIGGER system_user_changed_insert_delete
+    AFTER INSERT OR DELETE ON system_users_telegram_bot.system_users_for_telegram
+    FOR EACH ROW EXECUTE FUNCTION system_users_telegram_bot.notify_system_user_changed();
+
+CREATE OR REPLACE TRIGGER system_user_changed_update
+    AFTER UPDATE OF telegram_id, status ON system_users_telegram_bot.system_users_for_telegram
+    FOR EACH ROW
+    WHEN ((OLD.telegram_id, OLD.status) IS DISTINCT FROM (NEW.telegram_id, NEW.status))
+    EXECUTE FUNCTION system_users_telegram_bot.notify_system_user_changed();
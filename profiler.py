@@ -0,0 +1,171 @@
+import asyncio
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from datetime import datetime
+from pathlib import Path
+from types import CodeType
+from typing import Awaitable, Callable, Dict, Optional
+
+
+# Функции, в которых поток цикла событий ждет событий ввода-вывода: такие сэмплы считаются простоем
+_IDLE_FUNCTIONS = {'select', 'poll', 'epoll', 'kqueue', '_run_once'}
+
+# Метки сэмплов, которые не относятся ни к одному обработчику
+OUTSIDE_HANDLERS = '<вне обработчиков>'
+
+
+def _frame_name(code: CodeType) -> str:
+    return f"{Path(code.co_filename).name}:{code.co_firstlineno}:{code.co_name}"
+
+
+class ProfileSession:
+    """
+    Сеанс профилирования обработчиков бота.
+
+    Во время сеанса отдельный поток раз в `interval` секунд снимает стек потока цикла событий и относит сэмпл
+    к обработчику, корутина которого выполняется в этот момент. Сэмпл весит столько, сколько прошло с предыдущего:
+    пока цикл событий занят, поток профилировщика ждет GIL дольше интервала. Так видно, где обработчик тратит процессорное
+    время цикла событий, даже когда несколько обработчиков выполняются вперемешку. Время ожидания (запросы к базе,
+    Telegram, Redis) сэмплы не показывают - его показывает полное время обработчика, которое считает
+    `ProfilingMiddleware` через `record`.
+
+    Сеанс заканчивается после `updates` обработанных обновлений или через `seconds` секунд, что наступит раньше,
+    после чего вызывается `on_done` с готовым сеансом.
+    """
+
+    def __init__(self, handler_codes: Dict[CodeType, str], on_done: Callable[['ProfileSession'], Awaitable[None]],
+                 updates: Optional[int] = None, seconds: float = 60, interval: float = 0.005) -> None:
+        """
+        :param handler_codes: Код обработчиков -> имя обработчика. Тип: `dict[CodeType, str]`.
+        :param on_done: Вызывается по окончании сеанса. Тип: `Callable[[ProfileSession], Awaitable[None]]`.
+        :param updates: Сколько обновлений профилировать. `None` - без ограничения. Тип: `int | None`.
+        :param seconds: Максимальная длительность сеанса (сек.). Тип: `float`.
+        :param interval: Интервал сэмплирования (сек.). Тип: `float`.
+        """
+        self.handler_codes = handler_codes
+        self.on_done = on_done
+        self.updates = updates
+        self.seconds = seconds
+        self.interval = interval
+        self.started_at = datetime.now()
+        self.finished_at: Optional[datetime] = None
+        # Обработчик -> список длительностей вызовов (сек.)
+        self.timings: Dict[str, list] = defaultdict(list)
+        # Обработчик -> Counter стеков (от кадра обработчика к самому вложенному) с временем на CPU (сек.)
+        self.samples: Dict[str, Counter] = defaultdict(Counter)
+        self.idle_time = 0.0
+        self._loop_thread_id = threading.get_ident()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample_loop, name='profiler', daemon=True)
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._done_task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        """
+        Запустить сеанс. Вызывается из потока цикла событий.
+        """
+        self._thread.start()
+        self._timer = asyncio.get_running_loop().call_later(self.seconds, self.finish)
+
+    def record(self, handler: str, elapsed: float) -> None:
+        """
+        Учесть вызов обработчика.
+
+        :param handler: Имя обработчика. Тип: `str`.
+        :param elapsed: Полное время вызова (сек.). Тип: `float`.
+        :return: Возвращает `None`
+        """
+        if self.finished_at is not None:
+            return
+        self.timings[handler].append(elapsed)
+        if self.updates is not None and sum(map(len, self.timings.values())) >= self.updates:
+            self.finish()
+
+    def finish(self) -> None:
+        """
+        Остановить сэмплирование и передать результат в `on_done`.
+        """
+        if self.finished_at is not None:
+            return
+        self.finished_at = datetime.now()
+        self._stop.set()
+        if self._timer is not None:
+            self._timer.cancel()
+        self._done_task = asyncio.create_task(self._done())
+
+    async def _done(self) -> None:
+        await asyncio.to_thread(self._thread.join)
+        await self.on_done(self)
+
+    def _sample_loop(self) -> None:
+        previous = time.perf_counter()
+        while not self._stop.wait(self.interval):
+            now = time.perf_counter()
+            weight, previous = now - previous, now
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is None:
+                continue
+            stack = []
+            handler = None
+            while frame is not None:
+                code = frame.f_code
+                stack.append(code)
+                if code in self.handler_codes:
+                    handler = self.handler_codes[code]
+                    break
+                frame = frame.f_back
+            del frame
+            if handler is None:
+                if stack[0].co_name in _IDLE_FUNCTIONS:
+                    self.idle_time += weight
+                    continue
+                handler = OUTSIDE_HANDLERS
+                stack = stack[:20]
+            self.samples[handler][tuple(reversed(stack))] += weight
+
+    def report(self) -> str:
+        """
+        Текстовый отчет: время обработчиков и самые затратные функции внутри каждого из них.
+
+        :return: Отчет. Тип: `str`.
+        """
+        lines = [
+            f"Профиль обработчиков: {self.started_at:%d.%m.%Y %H:%M:%S} - {self.finished_at:%d.%m.%Y %H:%M:%S}",
+            f"Обновлений: {sum(map(len, self.timings.values()))}, интервал сэмплирования: {self.interval * 1000:.1f} мс, "
+            f"простой цикла событий: {self.idle_time * 1000:.0f} мс",
+            "",
+            f"{'Обработчик':<60} {'вызовов':>8} {'всего, мс':>10} {'среднее, мс':>12} {'максимум, мс':>13} "
+            f"{'CPU, мс':>9}",
+        ]
+        for handler in sorted(set(self.timings) | set(self.samples),
+                              key=lambda name: -sum(self.timings.get(name, [0]))):
+            timings = self.timings.get(handler, [])
+            total = sum(timings) * 1000
+            cpu = sum(self.samples.get(handler, Counter()).values()) * 1000
+            average = total / len(timings) if timings else 0
+            maximum = max(timings, default=0) * 1000
+            lines.append(f"{handler:<60} {len(timings):>8} {total:>10.1f} {average:>12.1f} {maximum:>13.1f} "
+                         f"{cpu:>9.1f}")
+        for handler, stacks in self.samples.items():
+            self_time = Counter()
+            cumulative = Counter()
+            for stack, spent in stacks.items():
+                self_time[stack[-1]] += spent
+                for code in set(stack):
+                    cumulative[code] += spent
+            lines += ["", f"[{handler}] на CPU: {sum(stacks.values()) * 1000:.1f} мс",
+                      f"  {'собств., мс':>12} {'всего, мс':>10}  функция"]
+            for code, spent in self_time.most_common(15):
+                lines.append(f"  {spent * 1000:>12.1f} {cumulative[code] * 1000:>10.1f}  {_frame_name(code)}")
+        return "\n".join(lines) + "\n"
+
+    def collapsed_stacks(self) -> str:
+        """
+        Стеки в формате collapsed (`обработчик;функция;...;функция микросекунды`) для построения flame graph.
+
+        :return: Стеки. Тип: `str`.
+        """
+        return "".join(f"{handler};{';'.join(map(_frame_name, stack))} {round(spent * 1000000)}\n"
+                       for handler, stacks in self.samples.items() for stack, spent in stacks.items())
@@ -1,53 +1,98 @@
 import asyncio
+import csv
+import json
+import os
+import tempfile
+import time
+import uuid
 from pathlib import Path
 import re
 import asyncpg
 import logging
-from aiogram import Bot, Dispatcher, F, types
+from dataclasses import dataclass
+from functools import cached_property
+from aiohttp import web
+from openpyxl import Workbook
+from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
+from aiogram import Bot, Dispatcher, F, Router, types
+from aiogram.client.telegram import PRODUCTION, SimpleFilesPathWrapper, TelegramAPIServer
 from aiogram.types import CallbackQuery, Message, InlineKeyboardMarkup, InlineKeyboardButton, FSInputFile, User
-from aiogram.filters import Command, StateFilter
+from aiogram.filters import Command, CommandObject, StateFilter
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
-from aiogram.fsm.storage.redis import RedisStorage
-from global_configs.telegram_configs import BOT_TOKEN, CHAT_ID
-from global_configs.database_configs import DBMS_HOST, DBMS_PORT, DBMS_USER, DBMS_PASSWORD, DBMS_DATABASE, REDIS_HOST
-from datetime import datetime
+from aiogram.exceptions import TelegramAPIError, TelegramRetryAfter
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+from global_configs.telegram_configs import (BOT_TOKEN, CHAT_ID, BOT_API_SERVER_URL, BOT_API_LOCAL_MODE,
+                                             BOT_API_SERVER_FILES_DIR, BOT_API_LOCAL_FILES_DIR, DOCUMENT_MAX_SIZE_MB,
+                                             LOCAL_DOCUMENT_MAX_SIZE_MB, BOT_API_POOL_LIMIT, BOT_API_KEEPALIVE_TIMEOUT,
+                                             BOT_API_TIMEOUT)
+from global_configs.storage_configs import (DOCS_STORAGE, S3_ENDPOINT_URL, S3_BUCKET, S3_ACCESS_KEY, S3_SECRET_KEY,
+                                            S3_REGION)
+from global_configs.database_configs import (DBMS_HOST, DBMS_PORT, DBMS_USER, DBMS_PASSWORD, DBMS_DATABASE, REDIS_HOST,
+                                             REDIS_STATE_TTL, REDIS_DATA_TTL, FSM_L1_SIZE, FSM_FLUSH_INTERVAL,
+                                             RUN_MIGRATIONS)
+from global_configs.app_configs import (EXPORT_PREFETCH, EXPORT_TIMEOUT, NOTIFY_RATE_LIMIT, NOTIFY_QUEUE_SIZE,
+                                        NOTIFY_RECONNECT_DELAY, NOTIFY_DEDUP_TTL, REFERENCE_CACHE_TTL, STATUS_PAGE_CACHE_TTL,
+                                        DOCS_SWEEP_INTERVAL, DOCS_SWEEP_MIN_AGE, DOCS_SWEEP_BATCH_SIZE,
+                                        DRAFT_TEXT_MAX_SIZE, MEDIA_GROUP_DELAY,
+                                        HEALTH_HOST, HEALTH_PORT, SHUTDOWN_TIMEOUT,
+                                        THROTTLE_BACKEND, THROTTLE_LIMITS, CALLBACK_DEDUP_TTL,
+                                        INSERT_BATCH_DELAY, INSERT_BATCH_SIZE, PROFILE_DEFAULT_SECONDS,
+                                        PROFILE_MAX_SECONDS, PROFILE_INTERVAL)
+from aiogram.dispatcher.event.handler import HandlerObject
+from fsm_storage import MsgpackRedisStorage, TieredStorage
+from application_writer import ApplicationWriter
+from bot_session import BotApiSession
+from middlewares import CallbackDedupMiddleware, InFlightMiddleware, ProfilingMiddleware, ThrottlingMiddleware
+from profiler import ProfileSession
+from document_storage import DocumentStorage, LocalDocumentStorage, S3DocumentStorage
+from migrate import run_migrations
+from datetime import datetime, date, timedelta
 import inspect
 
 
 # Путь к папке для хранения файлов
 DOCS_DIR = Path(__file__).parent / "docs"
-DOCS_DIR.mkdir(parents=True, exist_ok=True)
 
-# Настройка Redis для FSM
-storage = RedisStorage.from_url(REDIS_HOST)
-
-# Настройки Telegram-бота
-bot = Bot(token=BOT_TOKEN)
-dp = Dispatcher(storage=storage)
-chat = CHAT_ID
-
-
-# Узнаю реальное время и дату
-datetime_now_date = datetime.now().strftime(format="%d.%m.%Y")
-datetime_now_time = datetime.now().strftime(format="%H:%M:%S")
+# Флаги текстовых шагов создания заявки. Антифлуд на них отключен: длинное описание Telegram делит на серию
+# сообщений, и отброшенная часть молча пропала бы из заявки. Флуд здесь дешевый: шаги пишут только в FSM
+# и черновик в Redis (справочники берутся из кэша процесса), а размер описания ограничен `DRAFT_TEXT_MAX_SIZE`
+WIZARD_INPUT_FLAGS = {"throttling": None}
 
 # Определяем файл логов
 log_file = 'log.log'
 
-# Установка логов
-logging.basicConfig(
-    level=logging.DEBUG,                                    # Уровень логирования
-    format='%(asctime)s - %(levelname)s - %(message)s',     # Формат сообщений
-    filename=str(log_file),                                 # Имя файла для записи логов
-    filemode='w'                                            # Режим записи
-)
+
+def setup_logging() -> None:
+    """
+    Настроить запись логов в файл `log_file`. Файл дополняется при каждом запуске, а не перезаписывается.
+    """
+    logging.basicConfig(
+        level=logging.DEBUG,                                    # Уровень логирования
+        format='%(asctime)s - %(levelname)s - %(message)s',     # Формат сообщений
+        filename=str(log_file),                                 # Имя файла для записи логов
+        filemode='a'                                            # Режим записи
+    )
 
 
 def sanitize_filename(name: str) -> str:
     return re.sub(r'[^\w\-_. ]', '_', name or "")
 
 
+async def prepare_connection(connection: asyncpg.Connection) -> None:
+    """
+    Подготовить запросы, которые выполняются при каждом обращении к боту, на новом соединении пула.
+    asyncpg кэширует подготовленные запросы в соединении, поэтому первые обновления после запуска
+    не тратят время на разбор и планирование этих запросов.
+
+    :param connection: Новое соединение пула. Тип: `asyncpg.Connection`.
+    :return: Возвращает `None`
+    """
+    for query in (SEARCH_SYSTEM_USER_QUERY, SYSTEM_USER_QUERY, ACCESS_QUERY):
+        await connection.fetch(query, 0)
+
+
 # Создание пула подключений к PostgreSQL
 async def create_db_pool():
     return await asyncpg.create_pool(
@@ -57,20 +102,22 @@ async def create_db_pool():
         password=DBMS_PASSWORD,
         database=DBMS_DATABASE,
         timeout=3,
-        command_timeout=3
+        command_timeout=3,
+        init=prepare_connection
     )
 
 
 # Состояния FSM пользователя
+#
+# В данных FSM хранится только черновик заявки: выбранные ID и введенные пользователем поля.
+# Описание задачи, которое приходит несколькими сообщениями, и пути к загруженным документам копятся
+# отдельными списками в Redis (`append_draft_text`, `append_draft_documents`).
+# Названия из справочников берутся из кэша (`get_reference`), профиль системного пользователя - из базы
+# (`get_base_properties`), Telegram ID и Username - из самого обновления.
+#
 class UserFSM(StatesGroup):
-    # Общие состояния -------------------------------------------------------
-    telegram_id = State()           # Телеграм ID пользователя
-    telegram_username = State()     # Username пользователя
-
     # Состояния для заявки --------------------------------------------------
     entity_type_id = State()        # ID типа лица
-    name_entity_type = State()      # Имя типа лица
-    entity_types = State()          # Словарь всех типов лиц {'ID': 'name'}
 
     client_name = State()           # Имя клиента
     organization_name = State()     # Название организации
@@ -78,40 +125,17 @@ class UserFSM(StatesGroup):
     other_information = State()     # Информация/Описание задачи
 
     feedback_id = State()           # ID способа связи
-    name_feedback = State()         # Имя способа связи
-    feedbacks = State()             # Словарь всех способов связи {'ID': 'name'}
 
     phone = State()                 # Телефон
     email = State()                 # Почта
 
     convenient_time_id = State()    # ID удобного времени
-    convenient_time_name = State()  # Имя удобного времени
-    convenient_times = State()      # Словарь всех удобных времен {'ID': 'name'}
 
     category_id = State()           # ID категории
-    name_category = State()         # Имя категории
-    categories = State()            # Словарь всех категорий {'ID': 'name'}
 
     subcategory_id = State()        # ID подкатегории
-    name_subcategory = State()      # Имя подкатегории
-    subcategories = State()         # Словарь всех подкатегорий {'ID': 'name'}
 
-    documents = State()             # Пути к документам, куда вставил бот
-
-    # Состояния для системных пользователей ----------------------------------
-    check_status = State()          # Состояние того, что пользователь нашелся
-
-    access_id = State()             # ID доступа
-    access_name = State()           # Имя доступа
-    access_reading = State()        # Доступ к чтению
-    access_record = State()         # Доступ к записи
-    access_removal = State()        # Доступ к удалению
-
-    system_user_id = State()        # ID системного пользователя
-    full_name = State()             # ФИО
-    status = State()                # Статус системного пользователя
-    description = State()           # Описание
-    system_users = State()          # Все строки из таблицы системных пользователей
+    documents = State()             # Загрузка документов
 
     # Состояния для управления заявками -------------------------------------
     application_management_full_info_application = State()  # Полная информация по заявке по ID
@@ -139,6 +163,24 @@ async def safe_execute(pool: asyncpg.pool.Pool, query, *args, timeout=3):
     return await asyncio.wait_for(_inner(), timeout=timeout)
 
 
+# Запросы, которые выполняются при каждом обращении к боту. Подготавливаются на каждом соединении пула заранее
+SEARCH_SYSTEM_USER_QUERY = "SELECT telegram_id FROM system_users_telegram_bot.system_users_for_telegram WHERE telegram_id=$1;"
+SYSTEM_USER_QUERY = "SELECT * FROM system_users_telegram_bot.System_users_for_telegram WHERE telegram_id=$1;"
+ACCESS_QUERY = "SELECT * FROM system_users_telegram_bot.access WHERE access_id=$1;"
+
+# Заявки клиента ("Статус заявок"). Индекс applications_telegram_id_created_at_idx
+CLIENT_APPLICATIONS_QUERY = ("SELECT a.application_id, a.created_at, s.name_status FROM applications.applications a "
+                             "JOIN applications.statuses s ON a.status_id = s.status_id WHERE a.telegram_id = $1 "
+                             "ORDER BY a.created_at DESC;")
+# Все заявки для системных пользователей ("Статус заявок", "Список заявок"). Индекс applications_created_at_idx
+APPLICATIONS_QUERY = ("SELECT a.application_id, a.organization_name, a.client_name, a.created_at, s.name_status "
+                      "FROM applications.applications a JOIN applications.statuses s "
+                      "ON a.status_id = s.status_id ORDER BY a.created_at DESC;")
+# Документы заявки. Индекс documents_application_id_uploaded_at_idx
+APPLICATION_DOCUMENTS_QUERY = ("SELECT document_id, application_id, file_path, original_name, uploaded_at "
+                               "FROM applications.documents WHERE application_id = $1 ORDER BY uploaded_at ASC;")
+
+
 async def get_search_system_users(pool: asyncpg.pool.Pool, telegram_id) -> bool:
     """
     Получить результат поиска пользователя из таблицы 'system_users_telegram_bot.System_users_for_telegram' по условию telegram_id.
@@ -147,9 +189,7 @@ async def get_search_system_users(pool: asyncpg.pool.Pool, telegram_id) -> bool:
     :param telegram_id: ID пользователя телеграмма по которому будет выполняться условие поиска в таблице. Тип: `int`.
     :return: Bool значение - `True`: Если пользователь найден, `False`: Если пользователь не найден.
     """
-    _search_user = await safe_fetch(pool,
-                                    "SELECT telegram_id FROM system_users_telegram_bot.system_users_for_telegram WHERE telegram_id=$1;",
-                                    telegram_id)
+    _search_user = await safe_fetch(pool, SEARCH_SYSTEM_USER_QUERY, telegram_id)
 
     logging.info(f"Функция 'get_search_system_users' - (ID пользователя: {telegram_id}) "
                  f"Return: {True if _search_user else False}\n")
@@ -166,9 +206,7 @@ async def get_all_variables_system_users(pool: asyncpg.pool.Pool, telegram_id: i
     :param telegram_id: ID пользователя телеграмма по которому будет выполняться условие поиска в таблице. Тип: `int`.
     :return: Возвращает кортеж вида (`str`, `bool`, `int`, `str`)
     """
-    row = await safe_fetch(pool,
-                           "SELECT * FROM system_users_telegram_bot.System_users_for_telegram WHERE telegram_id=$1;",
-                           telegram_id)
+    row = await safe_fetch(pool, SYSTEM_USER_QUERY, telegram_id)
     _full_name = row[0]['full_name']
     _status = row[0]['status']
     _access_id = row[0]['access_id']
@@ -185,9 +223,7 @@ async def get_all_variables_access(pool: asyncpg.pool.Pool, access_id: int) -> (
     :param access_id: ID доступа по которому будет выполняться условие поиска в таблице. Тип: `int`.
     :return: Возвращает кортеж вида (`str`, `bool`, `bool`, `bool`)
     """
-    row = await safe_fetch(pool,
-                           f"SELECT * FROM system_users_telegram_bot.access WHERE access_id=$1;",
-                           access_id)
+    row = await safe_fetch(pool, ACCESS_QUERY, access_id)
     _access_name = row[0]['access_name']
     _access_reading = row[0]['access_reading']
     _access_record = row[0]['access_record']
@@ -195,32 +231,87 @@ async def get_all_variables_access(pool: asyncpg.pool.Pool, access_id: int) -> (
     return _access_name, _access_reading, _access_record, _access_removal
 
 
-async def updating_base_properties(state: FSMContext, user: User, pool: asyncpg.pool.Pool) -> None:
+async def get_base_properties(user: User, pool: asyncpg.pool.Pool) -> dict:
     """
-    Обновить базовые свойства пользователя.
+    Получить базовые свойства пользователя.
 
-    Написал отдельную функцию, чтобы по несколько раз не писать одно и тоже.
+    Профиль системного пользователя не сохраняется в FSM: он нужен только обработчику, который его запросил.
 
-    :param state: FSM. Тип: `FSMContext`.
-    :param user: Объект сообщения Telegram. Тип: `types.User`.
+    :param user: Объект пользователя Telegram. Тип: `types.User`.
     :param pool: Подключение к базе PostgreSQL. Тип: `asyncpg.pool.Pool`.
-    :return: Возвращает `None`
+    :return: Словарь с ключом `check_status` и, для системного пользователя, полями профиля и доступа.
     """
-    await state.update_data(telegram_id=user.id, telegram_username=user.username)
     if await get_search_system_users(pool, user.id):
         # Пользователь найден в таблице системных пользователей
-        await state.update_data(check_status=True)
         _full_name, _status, _access_id, _description = await get_all_variables_system_users(pool,
                                                                                              user.id)
         _access_name, _access_reading, _access_record, _access_removal = await get_all_variables_access(pool,
                                                                                                         _access_id)
-        await state.update_data(full_name=_full_name, status=_status,
-                                access_id=_access_id, description=_description,
-                                access_name=_access_name, access_reading=_access_reading,
-                                access_record=_access_record, access_removal=_access_removal)
-    else:
-        # Пользователь НЕ найден в таблице системных пользователей
-        await state.update_data(check_status=False)
+        return dict(check_status=True, full_name=_full_name, status=_status,
+                    access_id=_access_id, description=_description,
+                    access_name=_access_name, access_reading=_access_reading,
+                    access_record=_access_record, access_removal=_access_removal)
+    # Пользователь НЕ найден в таблице системных пользователей
+    return dict(check_status=False, status=None)
+
+
+# Справочники, которые бот показывает кнопками: имя -> запрос, возвращающий (ID, название)
+REFERENCE_QUERIES = {
+    'entity_types': "SELECT entity_type_id, name_entity_type FROM applications.entity_types;",
+    'categories': "SELECT category_id, name_category FROM applications.categories;",
+    'subcategories': "SELECT subcategory_id, name_subcategory FROM applications.subcategories WHERE category_id = $1;",
+    'feedbacks': "SELECT feedback_id, name_feedback FROM applications.feedback;",
+    'convenient_times': "SELECT convenient_time_id, convenient_time_name FROM applications.convenient_time;",
+}
+
+# Кэш справочников: (имя, *аргументы запроса) -> (время загрузки, {ID: название})
+_reference_cache = {}
+
+
+async def get_reference(pool: asyncpg.pool.Pool, name: str, *args) -> dict:
+    """
+    Получить справочник из кэша процесса, при необходимости загрузив его из базы.
+
+    :param pool: Подключение к базе PostgreSQL. Тип: `asyncpg.pool.Pool`.
+    :param name: Имя справочника из `REFERENCE_QUERIES`. Тип: `str`.
+    :param args: Аргументы запроса справочника (например, ID категории для подкатегорий).
+    :return: Словарь вида {ID: название}. Тип: `dict[int, str]`.
+    """
+    key = (name, *args)
+    cached = _reference_cache.get(key)
+    if cached and time.monotonic() - cached[0] < REFERENCE_CACHE_TTL:
+        return cached[1]
+    rows = await safe_fetch(pool, REFERENCE_QUERIES[name], *args)
+    reference = {row[0]: row[1] for row in rows}
+    _reference_cache[key] = (time.monotonic(), reference)
+    return reference
+
+
+async def get_reference_name(pool: asyncpg.pool.Pool, name: str, item_id: int | None, *args) -> str | None:
+    """
+    Получить название элемента справочника по его ID.
+
+    :param pool: Подключение к базе PostgreSQL. Тип: `asyncpg.pool.Pool`.
+    :param name: Имя справочника из `REFERENCE_QUERIES`. Тип: `str`.
+    :param item_id: ID элемента справочника. Тип: `int | None`.
+    :param args: Аргументы запроса справочника.
+    :return: Название элемента или `None`, если ID не указан или не найден.
+    """
+    if item_id is None:
+        return None
+    return (await get_reference(pool, name, *args)).get(item_id)
+
+
+def reference_keyboard(reference: dict) -> InlineKeyboardMarkup:
+    """
+    Построить клавиатуру выбора элемента справочника. В callback_data кладется ID элемента.
+
+    :param reference: Справочник вида {ID: название}. Тип: `dict[int, str]`.
+    :return: Клавиатура с кнопкой на каждый элемент. Тип: `InlineKeyboardMarkup`.
+    """
+    buttons = [[InlineKeyboardButton(text=item_name, callback_data=str(item_id))]
+               for item_id, item_name in reference.items()]
+    return InlineKeyboardMarkup(inline_keyboard=buttons)
 
 
 async def get_fsm_key(state: FSMContext, key: str):
@@ -238,22 +329,449 @@ async def get_fsm_key(state: FSMContext, key: str):
     return data.get(key)
 
 
+# Добавление части описания задачи: атомарно проверяет лимит размера, дописывает часть в список и продлевает TTL.
+# KEYS[1] - список частей, KEYS[2] - суммарный размер в байтах.
+# ARGV[1] - часть текста, ARGV[2] - ее размер, ARGV[3] - лимит, ARGV[4] - TTL (0 - без TTL).
+APPEND_DRAFT_TEXT_LUA = """
+local size = tonumber(redis.call('GET', KEYS[2]) or '0')
+local added = tonumber(ARGV[2])
+if size + added > tonumber(ARGV[3]) then
+    return -1
+end
+redis.call('RPUSH', KEYS[1], ARGV[1])
+size = redis.call('INCRBY', KEYS[2], added)
+if tonumber(ARGV[4]) > 0 then
+    redis.call('EXPIRE', KEYS[1], ARGV[4])
+    redis.call('EXPIRE', KEYS[2], ARGV[4])
+end
+return size
+"""
+
+
+def draft_key(user_id: int, part: str) -> str:
+    """
+    Получить ключ Redis для части черновика заявки пользователя.
+
+    :param user_id: Telegram ID пользователя. Тип: `int`.
+    :param part: Название части черновика. Тип: `str`.
+    :return: Ключ Redis. Тип: `str`.
+    """
+    return f"draft:{user_id}:{part}"
+
+
+async def append_draft_text(redis: Redis, user_id: int, text: str) -> bool:
+    """
+    Дописать часть описания задачи в черновик.
+
+    Части хранятся списком и склеиваются один раз при отправке заявки, поэтому каждое новое сообщение
+    передает в Redis только свой текст, а не всё описание целиком.
+
+    :param redis: Клиент Redis. Тип: `Redis`.
+    :param user_id: Telegram ID пользователя. Тип: `int`.
+    :param text: Текст сообщения. Тип: `str`.
+    :return: `True` - часть добавлена, `False` - превышен `DRAFT_TEXT_MAX_SIZE`.
+    """
+    result = await redis.register_script(APPEND_DRAFT_TEXT_LUA)(
+        keys=[draft_key(user_id, "other_information"), draft_key(user_id, "other_information_size")],
+        args=[text, len(text.encode()), DRAFT_TEXT_MAX_SIZE, REDIS_DATA_TTL or 0]
+    )
+    return result >= 0
+
+
+async def get_draft_text(redis: Redis, user_id: int) -> str | None:
+    """
+    Склеить части описания задачи из черновика.
+
+    :param redis: Клиент Redis. Тип: `Redis`.
+    :param user_id: Telegram ID пользователя. Тип: `int`.
+    :return: Описание задачи или `None`, если пользователь ничего не написал.
+    """
+    parts = await redis.lrange(draft_key(user_id, "other_information"), 0, -1)
+    return "\n".join(part.decode() for part in parts).strip() or None
+
+
+async def clear_draft(redis: Redis, user_id: int) -> None:
+    """
+    Удалить части черновика заявки, которые хранятся вне FSM.
+
+    :param redis: Клиент Redis. Тип: `Redis`.
+    :param user_id: Telegram ID пользователя. Тип: `int`.
+    :return: Возвращает `None`
+    """
+    await redis.delete(draft_key(user_id, "other_information"), draft_key(user_id, "other_information_size"),
+                       draft_key(user_id, "documents"))
+
+
+# Документы черновиков, еще не привязанные к заявке: ссылка -> время загрузки (сортированное множество).
+# По нему `sweep_orphaned_documents` находит документы брошенных черновиков, не просматривая всё хранилище
+DRAFT_DOCUMENTS_KEY = "draft_documents"
+
+
+async def append_draft_documents(redis: Redis, user_id: int, paths: list) -> None:
+    """
+    Атомарно дописать пути к сохраненным документам в черновик и отметить их в `DRAFT_DOCUMENTS_KEY`.
+
+    Один RPUSH вместо чтения и перезаписи списка: параллельные обработчики документов не затирают друг друга.
+
+    :param redis: Клиент Redis. Тип: `Redis`.
+    :param user_id: Telegram ID пользователя. Тип: `int`.
+    :param paths: Пути к сохраненным документам. Тип: `list[str]`.
+    :return: Возвращает `None`
+    """
+    key = draft_key(user_id, "documents")
+    async with redis.pipeline(transaction=True) as pipe:
+        pipe.rpush(key, *paths)
+        if REDIS_DATA_TTL:
+            pipe.expire(key, REDIS_DATA_TTL)
+        pipe.zadd(DRAFT_DOCUMENTS_KEY, {path: time.time() for path in paths})
+        await pipe.execute()
+
+
+async def get_draft_documents(redis: Redis, user_id: int) -> list:
+    """
+    Получить пути к документам из черновика.
+
+    :param redis: Клиент Redis. Тип: `Redis`.
+    :param user_id: Telegram ID пользователя. Тип: `int`.
+    :return: Пути к документам в порядке загрузки. Тип: `list[str]`.
+    """
+    return [path.decode() for path in await redis.lrange(draft_key(user_id, "documents"), 0, -1)]
+
+
+# Сохранение страницы "Статус заявок", только если кэш не сбрасывался с момента чтения поколения (до запроса к базе):
+# иначе страница могла устареть, пока шел запрос. KEYS[1] - страница, KEYS[2] - поколение.
+# ARGV[1] - страница, ARGV[2] - прочитанное поколение, ARGV[3] - время жизни (мс)
+STORE_STATUS_PAGE_LUA = """
+if (redis.call('GET', KEYS[2]) or '') ~= ARGV[2] then
+    return 0
+end
+redis.call('SET', KEYS[1], ARGV[1], 'PX', ARGV[3])
+return 1
+"""
+
+
+def status_page_key(user_id: int, part: str) -> str:
+    """
+    Получить ключ Redis для кэша страницы "Статус заявок" пользователя.
+
+    :param user_id: Telegram ID пользователя. Тип: `int`.
+    :param part: `page` - страница, `generation` - поколение кэша. Тип: `str`.
+    :return: Ключ Redis. Тип: `str`.
+    """
+    return f"status_page:{user_id}:{part}"
+
+
+async def get_status_page(redis: Redis, user_id: int) -> (str | None, str):
+    """
+    Получить страницу "Статус заявок" клиента из кэша.
+
+    :param redis: Клиент Redis. Тип: `Redis`.
+    :param user_id: Telegram ID пользователя. Тип: `int`.
+    :return: Кортеж (страница или `None`, если ее нет в кэше; поколение кэша для `store_status_page`).
+             Пустая страница - у клиента нет заявок.
+    """
+    page, generation = await redis.mget(status_page_key(user_id, "page"), status_page_key(user_id, "generation"))
+    return (page.decode() if page is not None else None), (generation or b"").decode()
+
+
+async def store_status_page(redis: Redis, user_id: int, page: str, generation: str) -> None:
+    """
+    Сохранить страницу "Статус заявок" клиента в кэш на `STATUS_PAGE_CACHE_TTL` секунд.
+
+    :param redis: Клиент Redis. Тип: `Redis`.
+    :param user_id: Telegram ID пользователя. Тип: `int`.
+    :param page: Страница. Тип: `str`.
+    :param generation: Поколение кэша из `get_status_page`, прочитанное до запроса к базе. Тип: `str`.
+    :return: Возвращает `None`
+    """
+    await redis.register_script(STORE_STATUS_PAGE_LUA)(
+        keys=[status_page_key(user_id, "page"), status_page_key(user_id, "generation")],
+        args=[page, generation, int(STATUS_PAGE_CACHE_TTL * 1000)]
+    )
+
+
+async def invalidate_status_page(redis: Redis, user_id: int) -> None:
+    """
+    Сбросить кэш страницы "Статус заявок" клиента. Новое поколение не дает сохранить страницу,
+    которую обработчик успел прочитать из базы до изменения.
+
+    :param redis: Клиент Redis. Тип: `Redis`.
+    :param user_id: Telegram ID пользователя. Тип: `int`.
+    :return: Возвращает `None`
+    """
+    generation = status_page_key(user_id, "generation")
+    async with redis.pipeline(transaction=True) as pipe:
+        pipe.incr(generation)
+        # Поколение живет дольше страницы, чтобы пережить запросы, начатые до сброса
+        pipe.pexpire(generation, int(STATUS_PAGE_CACHE_TTL * 2000))
+        pipe.delete(status_page_key(user_id, "page"))
+        await pipe.execute()
+
+
+# Альбомы документов, которые еще собираются: (Telegram ID, media_group_id) -> список сообщений
+_media_groups = {}
+
+
+async def get_documents_dir(pool: asyncpg.pool.Pool, data: dict, uploaded_at: datetime) -> str:
+    """
+    Получить папку (префикс ключа в хранилище документов) для документов черновика заявки.
+
+    :param pool: Подключение к базе PostgreSQL. Тип: `asyncpg.pool.Pool`.
+    :param data: Данные FSM черновика. Тип: `dict`.
+    :param uploaded_at: Время загрузки, из него строится имя папки. Тип: `datetime`.
+    :return: Относительный путь к папке. Тип: `str`.
+    """
+    client_name = sanitize_filename(data.get("client_name"))
+    org_name = sanitize_filename(data.get("organization_name"))
+    entity_type = await get_reference_name(pool, 'entity_types', data.get('entity_type_id'))
+    datetime_folder = f"{uploaded_at.strftime('%d.%m.%Y')}__{uploaded_at.strftime('%H-%M-%S')}"
+    if entity_type == "Юридическое лицо" and org_name:
+        return f"Юридическое лицо/{org_name}/{client_name}/{datetime_folder}"
+    return f"Физическое лицо/{client_name}/{datetime_folder}"
+
+
+async def save_document(bot: Bot, document_storage: DocumentStorage, message: Message, save_dir: str) -> str:
+    """
+    Сохранить документ из сообщения в хранилище документов.
+
+    Файл передается из Telegram в хранилище потоком, целиком в памяти он не держится. С локальным сервером Bot API
+    файл уже лежит на диске сервера и берется оттуда, без скачивания по HTTP.
+
+    :param bot: Бот, через который скачивается файл. Тип: `Bot`.
+    :param document_storage: Хранилище документов. Тип: `DocumentStorage`.
+    :param message: Сообщение с документом. Тип: `Message`.
+    :param save_dir: Папка черновика в хранилище документов. Тип: `str`.
+    :return: Ссылка на сохраненный документ. Тип: `str`.
+    """
+    document = message.document
+    key = f"{save_dir}/{message.from_user.id}_{document.file_name}"
+    file_info = await bot.get_file(document.file_id)
+    if bot.session.api.is_local:
+        return await document_storage.save_file(key, Path(bot.session.api.wrap_local_file.to_local(file_info.file_path)))
+    url = bot.session.api.file_url(bot.token, file_info.file_path)
+    return await document_storage.save_stream(key, bot.session.stream_content(url=url, timeout=bot.session.timeout))
+
+
+# Столбцы выгрузки заявок: (поле запроса, заголовок в файле)
+EXPORT_COLUMNS = (
+    ("application_id", "ID"),
+    ("created_at", "Дата создания"),
+    ("status", "Статус"),
+    ("entity_type", "Тип лица"),
+    ("client_name", "Имя клиента"),
+    ("organization_name", "Организация"),
+    ("phone", "Телефон"),
+    ("email", "Почта"),
+    ("category", "Категория"),
+    ("subcategory", "Подкатегория"),
+    ("feedback", "Способ связи"),
+    ("convenient_time", "Удобное время"),
+    ("other_information", "Информация"),
+    ("telegram_id", "Telegram ID"),
+)
+
+EXPORT_QUERY = ("SELECT a.application_id, a.created_at, s.name_status AS status, et.name_entity_type AS entity_type, "
+                "a.client_name, a.organization_name, a.phone, a.email, c.name_category AS category, "
+                "sc.name_subcategory AS subcategory, f.name_feedback AS feedback, "
+                "ct.convenient_time_name AS convenient_time, a.other_information, a.telegram_id "
+                "FROM applications.applications a "
+                "LEFT JOIN applications.categories c ON a.category_id = c.category_id "
+                "LEFT JOIN applications.subcategories sc ON a.subcategory_id = sc.subcategory_id "
+                "LEFT JOIN applications.statuses s ON a.status_id = s.status_id "
+                "LEFT JOIN applications.entity_types et ON a.entity_type_id = et.entity_type_id "
+                "LEFT JOIN applications.feedback f ON a.feedback_id = f.feedback_id "
+                "LEFT JOIN applications.convenient_time ct ON a.convenient_time_id = ct.convenient_time_id "
+                "WHERE ($1::date IS NULL OR a.created_at >= $1::date) "
+                "AND ($2::date IS NULL OR a.created_at < $2::date) "
+                "AND ($3::text IS NULL OR s.name_status ILIKE $3::text) "
+                "ORDER BY a.created_at;")
+
+
+def parse_export_args(args: str | None) -> (str, date | None, date | None, str | None):
+    """
+    Разобрать аргументы команды /export.
+
+    Формат: `/export [csv|xlsx] [ДД.ММ.ГГГГ] [ДД.ММ.ГГГГ] [статус]`. Первая дата - начало периода,
+    вторая - конец периода (включительно). Всё, что не является форматом или датой, считается названием статуса.
+
+    :param args: Строка аргументов команды. Тип: `str | None`.
+    :return: Кортеж (формат, дата с, дата по, статус). Даты и статус могут быть `None`.
+    :raises ValueError: Если указано больше двух дат.
+    """
+    file_format = "csv"
+    dates = []
+    status_words = []
+    for word in (args or "").split():
+        if word.lower() in ("csv", "xlsx"):
+            file_format = word.lower()
+            continue
+        try:
+            dates.append(datetime.strptime(word, "%d.%m.%Y").date())
+        except ValueError:
+            status_words.append(word)
+    if len(dates) > 2:
+        raise ValueError("Можно указать не больше двух дат")
+    date_from = dates[0] if dates else None
+    date_to = dates[1] if len(dates) > 1 else None
+    return file_format, date_from, date_to, " ".join(status_words) or None
+
+
+def export_value(value, file_format: str):
+    """
+    Привести значение из базы к виду, пригодному для записи в CSV/XLSX.
+
+    :param value: Значение поля записи.
+    :param file_format: Формат файла - `csv` или `xlsx`.
+    :return: Значение для записи в файл.
+    """
+    if isinstance(value, datetime):
+        if file_format == "xlsx":
+            # Excel не поддерживает часовые пояса
+            return value.replace(tzinfo=None)
+        return value.strftime("%d.%m.%Y %H:%M:%S")
+    if isinstance(value, str) and file_format == "xlsx":
+        return ILLEGAL_CHARACTERS_RE.sub("", value)
+    return value
+
+
+async def export_applications(pool: asyncpg.pool.Pool, file_format: str, date_from: date | None,
+                              date_to: date | None, status_name: str | None) -> (Path, int):
+    """
+    Выгрузить заявки во временный CSV/XLSX файл.
+
+    Строки читаются серверным курсором порциями по `EXPORT_PREFETCH` и сразу пишутся в файл,
+    поэтому расход памяти не зависит от количества заявок.
+
+    :param pool: Подключение к базе PostgreSQL. Тип: `asyncpg.pool.Pool`.
+    :param file_format: Формат файла - `csv` или `xlsx`.
+    :param date_from: Дата начала периода (включительно) или `None`.
+    :param date_to: Дата конца периода (включительно) или `None`.
+    :param status_name: Название статуса или `None`.
+    :return: Кортеж (путь к временному файлу, количество выгруженных заявок). Файл удаляет вызывающий.
+    """
+    fd, name = tempfile.mkstemp(prefix="applications_", suffix=f".{file_format}")
+    os.close(fd)
+    path = Path(name)
+    date_to_exclusive = date_to + timedelta(days=1) if date_to else None
+    headers = [title for _, title in EXPORT_COLUMNS]
+    count = 0
+    try:
+        async with pool.acquire() as connection:
+            # Серверный курсор существует только внутри транзакции
+            async with connection.transaction(readonly=True):
+                cursor = connection.cursor(EXPORT_QUERY, date_from, date_to_exclusive, status_name,
+                                           prefetch=EXPORT_PREFETCH, timeout=EXPORT_TIMEOUT)
+                if file_format == "xlsx":
+                    # В режиме write_only openpyxl сбрасывает строки во временный файл, а не держит их в памяти
+                    workbook = Workbook(write_only=True)
+                    sheet = workbook.create_sheet("Заявки")
+                    sheet.append(headers)
+                    async for record in cursor:
+                        sheet.append([export_value(record[field], file_format) for field, _ in EXPORT_COLUMNS])
+                        count += 1
+                else:
+                    with path.open("w", newline="", encoding="utf-8-sig") as file:
+                        writer = csv.writer(file, delimiter=";")
+                        writer.writerow(headers)
+                        async for record in cursor:
+                            writer.writerow([export_value(record[field], file_format) for field, _ in EXPORT_COLUMNS])
+                            count += 1
+        if file_format == "xlsx":
+            # Упаковка книги блокирующая, выполняем её вне цикла событий
+            await asyncio.to_thread(workbook.save, path)
+    except BaseException:
+        path.unlink(missing_ok=True)
+        raise
+    return path, count
+
+
+def parse_profile_args(args: str | None) -> (int | None, float):
+    """
+    Разобрать аргументы команды /profile.
+
+    Формат: `/profile [количество обновлений] [секунды]s`, например `/profile 200` или `/profile 200 30s`.
+    Профилирование заканчивается по первому из условий; без секунд - через `PROFILE_DEFAULT_SECONDS`.
+
+    :param args: Строка аргументов команды. Тип: `str | None`.
+    :return: Кортеж (количество обновлений или `None`, секунды). Тип: `tuple[int | None, float]`.
+    :raises ValueError: Если аргумент не число или выходит за допустимые пределы.
+    """
+    updates = None
+    seconds = PROFILE_DEFAULT_SECONDS
+    for word in (args or "").split():
+        if word.lower().endswith("s"):
+            seconds = float(word[:-1])
+        else:
+            updates = int(word)
+    if (updates is not None and updates < 1) or not 0 < seconds <= PROFILE_MAX_SECONDS:
+        raise ValueError("Некорректные аргументы профилирования")
+    return updates, seconds
+
+
+def handler_codes(router: Router) -> dict:
+    """
+    Собрать код всех обработчиков маршрутизатора и вложенных в него маршрутизаторов.
+
+    :param router: Маршрутизатор. Тип: `Router`.
+    :return: Код обработчика -> имя обработчика. Тип: `dict[CodeType, str]`.
+    """
+    codes = {}
+    for observer in router.observers.values():
+        for handler in observer.handlers:
+            codes[handler.callback.__code__] = handler.callback.__name__
+    for sub_router in router.sub_routers:
+        codes.update(handler_codes(sub_router))
+    return codes
+
+
+# Заявка по ключу идемпотентности (повторная отправка черновика)
+APPLICATION_BY_IDEMPOTENCY_KEY_QUERY = ("SELECT application_id, created_at FROM applications.applications "
+                                        "WHERE idempotency_key = $1;")
+
+# Документы заявки одним запросом. Документы, уже записанные при прошлой отправке заявки, пропускаются
+INSERT_APPLICATION_DOCUMENTS_QUERY = (
+    "INSERT INTO applications.documents (application_id, file_path, original_name, uploaded_at) "
+    "SELECT $1, d.file_path, d.original_name, $4 FROM unnest($2::text[], $3::text[]) AS d (file_path, original_name) "
+    "WHERE NOT EXISTS (SELECT 1 FROM applications.documents x "
+    "WHERE x.application_id = $1 AND x.file_path = d.file_path);"
+)
+
+
+async def notify_new_application(bot: Bot, redis: Redis, application_id: int, text: str) -> None:
+    """
+    Отправить уведомление о новой заявке в чат `CHAT_ID`, если оно еще не отправлено.
+
+    Отметка об отправке ставится после отправки, поэтому при сбое между отправкой и отметкой уведомление
+    может прийти дважды, но не потеряется.
+
+    :param bot: Бот. Тип: `Bot`.
+    :param redis: Клиент Redis. Тип: `Redis`.
+    :param application_id: ID заявки. Тип: `int`.
+    :param text: Текст уведомления. Тип: `str`.
+    :return: Возвращает `None`
+    """
+    key = f"application_notified:{application_id}"
+    if await redis.exists(key):
+        return
+    await bot.send_message(CHAT_ID, text, parse_mode="None")
+    await redis.set(key, 1, ex=REDIS_DATA_TTL)
+
+
 # Блок для всех --------------------------------------------------------------------------------------------------------
 
 
 # Команда /get_my_id - Отображение информации
-@dp.message(Command("get_my_id"))
-async def cmd_get_my_id(message: types.Message, state: FSMContext):
+async def cmd_get_my_id(message: types.Message, state: FSMContext, db_pool: asyncpg.pool.Pool):
     await state.clear()
-    await updating_base_properties(state=state, user=message.from_user, pool=dp["db_pool"])
-    if await get_fsm_key(state, 'check_status') and await get_fsm_key(state, 'status'):
+    properties = await get_base_properties(user=message.from_user, pool=db_pool)
+    if properties['check_status'] and properties['status']:
         await message.answer(
-            f"Добро пожаловать {await get_fsm_key(state, 'full_name')}! Вы являетесь системным пользователем!\n\n"
+            f"Добро пожаловать {properties['full_name']}! Вы являетесь системным пользователем!\n\n"
             f"Ваши уровни доступа:\n\n"
-            f"Уровень: {await get_fsm_key(state, 'access_name')}\n"
-            f"Чтение: {await get_fsm_key(state, 'access_reading')}\n"
-            f"Запись: {await get_fsm_key(state, 'access_record')}\n"
-            f"Удаление: {await get_fsm_key(state, 'access_removal')}\n\n"
+            f"Уровень: {properties['access_name']}\n"
+            f"Чтение: {properties['access_reading']}\n"
+            f"Запись: {properties['access_record']}\n"
+            f"Удаление: {properties['access_removal']}\n\n"
             f"ID пользователя: {message.from_user.id}\n"
             f"Пользователь: {message.from_user.full_name} (Username: @{message.from_user.username})"
         )
@@ -269,10 +787,10 @@ async def cmd_get_my_id(message: types.Message, state: FSMContext):
 
 
 # Главная команда /start
-async def cmd_start(state: FSMContext, user: User, send):
+async def cmd_start(state: FSMContext, user: User, send, db_pool: asyncpg.pool.Pool):
     await state.clear()
-    await updating_base_properties(state=state, user=user, pool=dp["db_pool"])
-    if await get_fsm_key(state, 'check_status') and await get_fsm_key(state, 'status'):
+    properties = await get_base_properties(user=user, pool=db_pool)
+    if properties['check_status'] and properties['status']:
         keyboard = InlineKeyboardMarkup(inline_keyboard=[
             [
                 InlineKeyboardButton(text="Статус заявок", callback_data="Статус заявок"),
@@ -283,7 +801,7 @@ async def cmd_start(state: FSMContext, user: User, send):
             ]
         ])
         await send(
-            f"🤖 Доброго времени суток, {await get_fsm_key(state, "full_name")}!\n\n"
+            f"🤖 Доброго времени суток, {properties['full_name']}!\n\n"
             "Выберите действие:\n\n",
             reply_markup=keyboard
         )
@@ -306,46 +824,137 @@ async def cmd_start(state: FSMContext, user: User, send):
                  f"Текущее состояние: {await state.get_state()}")
 
 
-@dp.message(Command("start"))
-async def cmd_start_message(message: Message, state: FSMContext):
-    await cmd_start(state, message.from_user, message.answer)
+async def cmd_start_message(message: Message, state: FSMContext, db_pool: asyncpg.pool.Pool):
+    await cmd_start(state, message.from_user, message.answer, db_pool)
 
 
 # Команда /status - Отображение информации о системе
-@dp.message(Command("status"))
-async def cmd_status(message: types.Message, state: FSMContext):
+async def cmd_status(message: types.Message, state: FSMContext, db_pool: asyncpg.pool.Pool, started_at: datetime):
     await state.clear()
-    await updating_base_properties(state=state, user=message.from_user, pool=dp["db_pool"])
+    properties = await get_base_properties(user=message.from_user, pool=db_pool)
 
     db_status = None
-    if await get_fsm_key(state, 'check_status') and await get_fsm_key(state, 'status'):
+    started = started_at.strftime('%d.%m.%Y %H:%M:%S')
+    uptime = str(datetime.now() - started_at).split('.')[0]
+    if properties['check_status'] and properties['status']:
         db_status = "Подключено"
         try:
-            await safe_execute(dp["db_pool"], "SELECT 1;")
+            await safe_execute(db_pool, "SELECT 1;")
         except Exception:
             db_status = "Ошибка"
         await message.answer("Вы являйтесь системным пользователем!")
         await message.answer(
             f"Инициализирована проверка работы Telegram-бота!\n"
             f"Статус: Работает\n"
-            f"Бот запущен: {datetime_now_date} {datetime_now_time}\n"
+            f"Бот запущен: {started}\n"
+            f"Время работы: {uptime}\n"
             f"Статус подключения к базе данных: {db_status}"
         )
     else:
         await message.answer('У вас нет доступа к этой функции.')
     logging.info(f"Функция '{inspect.currentframe().f_code.co_name}' - (ID пользователя: {message.from_user.id}) "
                  f"(Пользователь: {message.from_user.full_name}) (Username: @{message.from_user.username}) "
-                 f"(Статус: Работает) (Бот запущен: {datetime_now_date} {datetime_now_time}) (Статус подключения к базе данных: {db_status})\n"
+                 f"(Статус: Работает) (Бот запущен: {started}) (Время работы: {uptime}) (Статус подключения к базе данных: {db_status})\n"
+                 f"Data: {await state.get_data()}\n"
+                 f"Текущее состояние: {await state.get_state()}")
+
+
+# Команда /export - Экспорт заявок в CSV/XLSX (Только для системных пользователей)
+async def cmd_export(message: Message, state: FSMContext, command: CommandObject, db_pool: asyncpg.pool.Pool, bot: Bot):
+    await state.clear()
+    properties = await get_base_properties(user=message.from_user, pool=db_pool)
+    if properties['check_status'] and properties['status']:
+        try:
+            file_format, date_from, date_to, status_name = parse_export_args(command.args)
+        except ValueError:
+            await message.answer("🤖 Формат команды: /export [csv|xlsx] [ДД.ММ.ГГГГ] [ДД.ММ.ГГГГ] [статус]")
+            return
+        processing_message = await message.answer("🤖 Формирую выгрузку заявок...")
+        try:
+            path, count = await export_applications(db_pool, file_format, date_from, date_to, status_name)
+        except Exception as e:
+            # Таймаут курсора, ошибка базы или диска: сообщение о выгрузке не должно зависнуть
+            logging.error(f"Не удалось сформировать выгрузку заявок (ID пользователя: {message.from_user.id}) "
+                          f"(Аргументы: {command.args}): {e!r}")
+            await processing_message.edit_text("⚠ Не удалось сформировать выгрузку. Попробуйте позже "
+                                               "или укажите более короткий период.")
+        else:
+            try:
+                if count:
+                    file = FSInputFile(path, filename=f"applications_{datetime.now().strftime('%d.%m.%Y_%H-%M-%S')}"
+                                                      f".{file_format}")
+                    await bot.send_document(chat_id=message.chat.id, document=file,
+                                            caption=f"📄 Выгружено заявок: {count}")
+                    await processing_message.delete()
+                else:
+                    await processing_message.edit_text("🤖 Нет заявок по заданным условиям.")
+            except TelegramAPIError as e:
+                logging.error(f"Не удалось отправить выгрузку заявок (ID пользователя: {message.from_user.id}): {e}")
+                await processing_message.edit_text("⚠ Не удалось отправить файл выгрузки. Попробуйте позже.")
+            finally:
+                path.unlink(missing_ok=True)
+    else:
+        await message.answer('У вас нет доступа к этой функции.')
+    logging.info(f"Функция '{inspect.currentframe().f_code.co_name}' - (ID пользователя: {message.from_user.id}) "
+                 f"(Пользователь: {message.from_user.full_name}) (Username: @{message.from_user.username}) "
+                 f"(Аргументы: {command.args})\n"
+                 f"Data: {await state.get_data()}\n"
+                 f"Текущее состояние: {await state.get_state()}")
+
+
+# Команда /profile - Профилирование обработчиков (Только для системных пользователей)
+async def cmd_profile(message: Message, state: FSMContext, command: CommandObject, db_pool: asyncpg.pool.Pool,
+                      bot: Bot, profiling: ProfilingMiddleware, event_router: Router):
+    await state.clear()
+    properties = await get_base_properties(user=message.from_user, pool=db_pool)
+    if properties['check_status'] and properties['status']:
+        try:
+            updates, seconds = parse_profile_args(command.args)
+        except ValueError:
+            await message.answer(f"🤖 Формат команды: /profile [количество обновлений] [секунды]s\n"
+                                 f"Длительность не больше {PROFILE_MAX_SECONDS:.0f} сек.")
+            return
+        if profiling.session is not None:
+            await message.answer("🤖 Профилирование уже запущено.")
+            return
+        chat_id = message.chat.id
+
+        async def send_profile(session: ProfileSession) -> None:
+            profiling.session = None
+            name = f"profile_{session.started_at.strftime('%d.%m.%Y_%H-%M-%S')}"
+            with tempfile.TemporaryDirectory(prefix="profile_") as directory:
+                report = Path(directory) / f"{name}.txt"
+                stacks = Path(directory) / f"{name}.folded"
+                report.write_text(session.report(), encoding="utf-8")
+                stacks.write_text(session.collapsed_stacks(), encoding="utf-8")
+                try:
+                    await bot.send_document(chat_id=chat_id, document=FSInputFile(report),
+                                            caption="📄 Профиль обработчиков")
+                    await bot.send_document(chat_id=chat_id, document=FSInputFile(stacks),
+                                            caption="📄 Стеки для flame graph")
+                except TelegramAPIError as e:
+                    logging.error(f"Не удалось отправить профиль (Чат: {chat_id}): {e}")
+            logging.info(f"Профилирование завершено (Чат: {chat_id})")
+
+        profiling.session = ProfileSession(handler_codes(event_router), send_profile, updates=updates, seconds=seconds,
+                                           interval=PROFILE_INTERVAL)
+        profiling.session.start()
+        await message.answer(f"🤖 Профилирование запущено на {seconds:.0f} сек."
+                             f"{f' или {updates} обновлений' if updates else ''}. Отчет придет в этот чат.")
+    else:
+        await message.answer('У вас нет доступа к этой функции.')
+    logging.info(f"Функция '{inspect.currentframe().f_code.co_name}' - (ID пользователя: {message.from_user.id}) "
+                 f"(Пользователь: {message.from_user.full_name}) (Username: @{message.from_user.username}) "
+                 f"(Аргументы: {command.args})\n"
                  f"Data: {await state.get_data()}\n"
                  f"Текущее состояние: {await state.get_state()}")
 
 
 # Ответ на любые сообщения (Когда FSM состояние: None)
-@dp.message(StateFilter(None))
-async def other_message(message: Message, state: FSMContext):
+async def other_message(message: Message, state: FSMContext, db_pool: asyncpg.pool.Pool):
     await state.clear()
-    await updating_base_properties(state=state, user=message.from_user, pool=dp["db_pool"])
-    if await get_fsm_key(state, 'check_status') and await get_fsm_key(state, 'status'):
+    properties = await get_base_properties(user=message.from_user, pool=db_pool)
+    if properties['check_status'] and properties['status']:
         keyboard = InlineKeyboardMarkup(inline_keyboard=[
             [
                 InlineKeyboardButton(text="Статус заявок", callback_data="Статус заявок"),
@@ -356,7 +965,7 @@ async def other_message(message: Message, state: FSMContext):
             ]
         ])
         await message.answer(
-            f"🤖 Доброго времени суток, {await get_fsm_key(state, "full_name")}!\n\n"
+            f"🤖 Доброго времени суток, {properties['full_name']}!\n\n"
             "Выберите действие:\n\n",
             reply_markup=keyboard
         )
@@ -381,17 +990,18 @@ async def other_message(message: Message, state: FSMContext):
 
 
 # Статус заявки
-@dp.callback_query(F.data.startswith('Статус заявок'))
-async def application_status(callback_query: CallbackQuery, state: FSMContext):
+async def application_status(callback_query: CallbackQuery, state: FSMContext, db_pool: asyncpg.pool.Pool,
+                             redis: Redis):
     await state.clear()
-    await updating_base_properties(state=state, user=callback_query.from_user, pool=dp["db_pool"])
-    if await get_fsm_key(state, 'check_status') and await get_fsm_key(state, 'status'):
-        query = """
-                SELECT a.application_id, a.organization_name, a.client_name, a.created_at, s.name_status
-                FROM applications.applications a JOIN applications.statuses s ON a.status_id = s.status_id
-                ORDER BY a.created_at DESC;
-                """
-        rows = await safe_fetch(dp["db_pool"], query)
+    page, generation = (await get_status_page(redis, callback_query.from_user.id) if STATUS_PAGE_CACHE_TTL
+                        else (None, ""))
+    # Страница в кэше бывает только у клиента (кэш сбрасывается, когда пользователя делают системным),
+    # поэтому при попадании в кэш база не нужна совсем
+    properties = dict(check_status=False, status=None) if page is not None else \
+        await get_base_properties(user=callback_query.from_user, pool=db_pool)
+    response = None
+    if properties['check_status'] and properties['status']:
+        rows = await safe_fetch(db_pool, APPLICATIONS_QUERY)
         if rows:
             response = "📋 Заявки:\n\n"
             for row in rows:
@@ -402,26 +1012,24 @@ async def application_status(callback_query: CallbackQuery, state: FSMContext):
                     f"📌 Статус: {row['name_status']}\n\n"
                 )
     else:
-        query = """
-                SELECT a.application_id, a.created_at, s.name_status FROM applications.applications a
-                JOIN applications.statuses s ON a.status_id = s.status_id WHERE a.telegram_id = $1
-                ORDER BY a.created_at DESC;
-                """
-        rows = await safe_fetch(dp["db_pool"], query, callback_query.from_user.id)
-        if rows:
-            response = "📋 Ваши заявки:\n\n"
-            for row in rows:
-                response += (
-                    f"📅 Дата создания: {row['created_at'].strftime('%d.%m.%Y %H:%M')}\n"
-                    f"📌 Статус: {row['name_status']}\n\n"
-                )
-    if not rows:
+        if page is None:
+            rows = await safe_fetch(db_pool, CLIENT_APPLICATIONS_QUERY, callback_query.from_user.id)
+            page = "".join(
+                f"📅 Дата создания: {row['created_at'].strftime('%d.%m.%Y %H:%M')}\n"
+                f"📌 Статус: {row['name_status']}\n\n"
+                for row in rows
+            )
+            if STATUS_PAGE_CACHE_TTL:
+                await store_status_page(redis, callback_query.from_user.id, page, generation)
+        if page:
+            response = "📋 Ваши заявки:\n\n" + page
+    if not response:
         await callback_query.message.edit_text("🤖 У вас нет заявок на данный момент.")
         await asyncio.sleep(1)
     else:
         await callback_query.message.edit_text(response, parse_mode="None")
         await asyncio.sleep(1)
-    if await get_fsm_key(state, 'check_status') and await get_fsm_key(state, 'status'):
+    if properties['check_status'] and properties['status']:
         keyboard = InlineKeyboardMarkup(inline_keyboard=[
             [
                 InlineKeyboardButton(text="Статус заявок", callback_data="Статус заявок"),
@@ -432,7 +1040,7 @@ async def application_status(callback_query: CallbackQuery, state: FSMContext):
             ]
         ])
         await callback_query.message.answer(
-            f"🤖 Доброго времени суток, {await get_fsm_key(state, "full_name")}!\n\n"
+            f"🤖 Доброго времени суток, {properties['full_name']}!\n\n"
             "Выберите действие:\n\n",
             reply_markup=keyboard
         )
@@ -457,20 +1065,15 @@ async def application_status(callback_query: CallbackQuery, state: FSMContext):
 
 
 # Создать заявку - Начало
-@dp.callback_query(F.data.startswith('Создать заявку'))
-async def application_start(callback_query: CallbackQuery, state: FSMContext):
+async def application_start(callback_query: CallbackQuery, state: FSMContext, db_pool: asyncpg.pool.Pool, redis: Redis):
     await state.clear()
-    await updating_base_properties(state=state, user=callback_query.from_user, pool=dp["db_pool"])
-    query = "SELECT entity_type_id, name_entity_type FROM applications.entity_types;"
-    rows = await safe_fetch(dp["db_pool"], query)
-    entity_types = {row["entity_type_id"]: row["name_entity_type"] for row in rows}
-    buttons = [[InlineKeyboardButton(text=name_entity_type, callback_data=str(entity_type_id))]
-               for entity_type_id, name_entity_type in entity_types.items()]
-    keyboard = InlineKeyboardMarkup(inline_keyboard=buttons)
-    await state.update_data(entity_types=entity_types)
+    await clear_draft(redis, callback_query.from_user.id)
+    # Ключ идемпотентности черновика: повторная отправка того же черновика не создаст вторую заявку
+    await state.update_data(idempotency_key=str(uuid.uuid4()))
+    entity_types = await get_reference(db_pool, 'entity_types')
     await callback_query.message.answer(
         "Вы обращаетесь как физическое лицо или юридическое?",
-        reply_markup=keyboard
+        reply_markup=reference_keyboard(entity_types)
     )
     await state.set_state(UserFSM.entity_type_id)
     logging.info(f"Функция '{inspect.currentframe().f_code.co_name}' - (ID пользователя: {callback_query.from_user.id}) "
@@ -480,23 +1083,15 @@ async def application_start(callback_query: CallbackQuery, state: FSMContext):
 
 
 # Создать заявку - После выбора типа лица
-@dp.callback_query(StateFilter(UserFSM.entity_type_id))
-async def handle_entity_type(callback_query: CallbackQuery, state: FSMContext):
-    await updating_base_properties(state=state, user=callback_query.from_user, pool=dp["db_pool"])
-    entity_types = await get_fsm_key(state, 'entity_types')
-    await state.update_data(entity_type_id=int(callback_query.data), name_entity_type=entity_types.get(callback_query.data))
-    match await get_fsm_key(state, 'name_entity_type'):
+async def handle_entity_type(callback_query: CallbackQuery, state: FSMContext, db_pool: asyncpg.pool.Pool):
+    entity_type_id = int(callback_query.data)
+    await state.update_data(entity_type_id=entity_type_id)
+    match await get_reference_name(db_pool, 'entity_types', entity_type_id):
         case 'Юридическое лицо':
-            query = "SELECT category_id, name_category FROM applications.categories;"
-            rows = await safe_fetch(dp["db_pool"], query)
-            categories = {row["category_id"]: row["name_category"] for row in rows}
-            buttons = [[InlineKeyboardButton(text=name_category, callback_data=str(category_id))]
-                       for category_id, name_category in categories.items()]
-            keyboard = InlineKeyboardMarkup(inline_keyboard=buttons)
-            await state.update_data(categories=categories)
+            categories = await get_reference(db_pool, 'categories')
             await callback_query.message.edit_text(
                 "🤖 Пожалуйста, выберите категорию:",
-                reply_markup=keyboard
+                reply_markup=reference_keyboard(categories)
             )
             await state.set_state(UserFSM.category_id)
         case 'Физическое лицо':
@@ -509,21 +1104,13 @@ async def handle_entity_type(callback_query: CallbackQuery, state: FSMContext):
 
 
 # Создать заявку - Выбор категории. Условие: Юридическое лицо
-@dp.callback_query(StateFilter(UserFSM.category_id))
-async def handle_category(callback_query: CallbackQuery, state: FSMContext):
-    await updating_base_properties(state=state, user=callback_query.from_user, pool=dp["db_pool"])
-    categories = await get_fsm_key(state, 'categories')
-    await state.update_data(category_id=int(callback_query.data), name_category=categories.get(callback_query.data))
-    query = "SELECT subcategory_id, name_subcategory FROM applications.subcategories WHERE category_id = $1;"
-    rows = await safe_fetch(dp["db_pool"], query, int(callback_query.data))
-    subcategories = {row["subcategory_id"]: row["name_subcategory"] for row in rows}
-    buttons = [[InlineKeyboardButton(text=name_subcategory, callback_data=str(subcategory_id))]
-               for subcategory_id, name_subcategory in subcategories.items()]
-    keyboard = InlineKeyboardMarkup(inline_keyboard=buttons)
-    await state.update_data(subcategories=subcategories)
+async def handle_category(callback_query: CallbackQuery, state: FSMContext, db_pool: asyncpg.pool.Pool):
+    category_id = int(callback_query.data)
+    await state.update_data(category_id=category_id)
+    subcategories = await get_reference(db_pool, 'subcategories', category_id)
     await callback_query.message.edit_text(
         "🤖 Пожалуйста, выберите подкатегорию:",
-        reply_markup=keyboard
+        reply_markup=reference_keyboard(subcategories)
     )
     await state.set_state(UserFSM.subcategory_id)
     logging.info(f"Функция '{inspect.currentframe().f_code.co_name}' - (ID пользователя: {callback_query.from_user.id}) "
@@ -533,11 +1120,8 @@ async def handle_category(callback_query: CallbackQuery, state: FSMContext):
 
 
 # Создать заявку - Выбор подкатегории. Условие: Юридическое лицо
-@dp.callback_query(StateFilter(UserFSM.subcategory_id))
 async def handle_subcategory(callback_query: CallbackQuery, state: FSMContext):
-    await updating_base_properties(state=state, user=callback_query.from_user, pool=dp["db_pool"])
-    subcategories = await get_fsm_key(state, 'subcategories')
-    await state.update_data(subcategory_id=int(callback_query.data), name_subcategory=subcategories.get(callback_query.data))
+    await state.update_data(subcategory_id=int(callback_query.data))
     await callback_query.message.edit_text("🤖 Пожалуйста, напишите, как к вам обращаться:")
     await state.set_state(UserFSM.client_name)
     logging.info(f"Функция '{inspect.currentframe().f_code.co_name}' - (ID пользователя: {callback_query.from_user.id}) "
@@ -547,14 +1131,13 @@ async def handle_subcategory(callback_query: CallbackQuery, state: FSMContext):
 
 
 # Создать заявку - Ввод имени и запрос имени организации (Условие: Юридическое лицо)
-@dp.message(F.text, StateFilter(UserFSM.client_name))
-async def handle_name(message: Message, state: FSMContext):
-    await updating_base_properties(state=state, user=message.from_user, pool=dp["db_pool"])
-    await state.update_data(client_name=message.text)
-    if await get_fsm_key(state, "name_entity_type") == "Юридическое лицо":
+async def handle_name(message: Message, state: FSMContext, db_pool: asyncpg.pool.Pool):
+    data = await state.update_data(client_name=message.text)
+    name_entity_type = await get_reference_name(db_pool, 'entity_types', data.get('entity_type_id'))
+    if name_entity_type == "Юридическое лицо":
         await message.answer("🤖 Пожалуйста, напишите, как называется ваша организация:")
         await state.set_state(UserFSM.organization_name)
-    elif await get_fsm_key(state, "name_entity_type") == "Физическое лицо":
+    elif name_entity_type == "Физическое лицо":
         await message.answer(
             "🤖 Пожалуйста, опишите вашу задачу или проблему. Вы можете также добавить "
             "любую дополнительную информацию. Напишите всё, что считаете важным.\n\n"
@@ -568,9 +1151,7 @@ async def handle_name(message: Message, state: FSMContext):
 
 
 # Создать заявку - Ввод название организации и запрос у пользователя дополнительной информации
-@dp.message(F.text, StateFilter(UserFSM.organization_name))
 async def handle_organization(message: Message, state: FSMContext):
-    await updating_base_properties(state=state, user=message.from_user, pool=dp["db_pool"])
     await state.update_data(organization_name=message.text)
     await message.answer(
         "🤖 Пожалуйста, опишите вашу задачу или проблему. Вы можете также добавить "
@@ -585,22 +1166,22 @@ async def handle_organization(message: Message, state: FSMContext):
 
 
 # Создать заявку - Получаем дополнительную информацию
-@dp.message(F.text, StateFilter(UserFSM.other_information))
-async def message_other_information(message: Message, state: FSMContext):
-    await updating_base_properties(state=state, user=message.from_user, pool=dp["db_pool"])
+async def message_other_information(message: Message, state: FSMContext, redis: Redis, bot: Bot):
     if message.text.lower() == 'далее':
+        # Лимит зависит от сервера Bot API, с которым работает бот
+        max_size = LOCAL_DOCUMENT_MAX_SIZE_MB if bot.session.api.is_local else DOCUMENT_MAX_SIZE_MB
         await message.answer(
             "🤖 Спасибо за предоставленную информацию!\n "
             "Можете отправить документы (файлы, сканы или инструкции), если они есть. "
             "Это поможет нам быстрее и точнее обработать вашу заявку.\n\n"
-            "Важно! Документ не должен превышать 20 МБ!"
+            f"Важно! Документ не должен превышать {max_size} МБ!"
         )
         await state.set_state(UserFSM.documents)
-    else:
-        new_text = message.text
-        old_text = await get_fsm_key(state, "other_information") or ""
-        await state.update_data(other_information=f"{old_text}\n{new_text}".strip())
+    elif await append_draft_text(redis, message.from_user.id, message.text):
         await message.answer("🤖 Информация добавлена. Если хотите завершить, отправьте сообщение \"Далее\".")
+    else:
+        await message.answer("🤖 Описание задачи слишком большое, это сообщение не добавлено. "
+                             "Если хотите завершить, отправьте сообщение \"Далее\".")
     logging.info(f"Функция '{inspect.currentframe().f_code.co_name}' - (ID пользователя: {message.from_user.id}) "
                  f"(Пользователь: {message.from_user.full_name}) (Username: @{message.from_user.username})\n"
                  f"Data: {await state.get_data()}\n"
@@ -608,21 +1189,13 @@ async def message_other_information(message: Message, state: FSMContext):
 
 
 # Создать заявку - Перестать отправлять документы
-@dp.message(F.text, StateFilter(UserFSM.documents))
-async def handle_document_text(message: types.Message, state: FSMContext):
-    await updating_base_properties(state=state, user=message.from_user, pool=dp["db_pool"])
+async def handle_document_text(message: types.Message, state: FSMContext, db_pool: asyncpg.pool.Pool):
     if message.text.lower() == 'далее':
-        query = "SELECT feedback_id, name_feedback FROM applications.feedback;"
-        rows = await safe_fetch(dp["db_pool"], query)
-        feedbacks = {row["feedback_id"]: row["name_feedback"] for row in rows}
-        buttons = [[InlineKeyboardButton(text=name_feedback, callback_data=str(feedback_id))]
-                   for feedback_id, name_feedback in feedbacks.items()]
-        keyboard = InlineKeyboardMarkup(inline_keyboard=buttons)
-        await state.update_data(feedbacks=feedbacks)
+        feedbacks = await get_reference(db_pool, 'feedbacks')
         await message.answer(
             "🤖 Спасибо за предоставленную информацию!\n "
             "Как с вами связаться?",
-            reply_markup=keyboard
+            reply_markup=reference_keyboard(feedbacks)
         )
         await state.set_state(UserFSM.feedback_id)
     else:
@@ -634,40 +1207,54 @@ async def handle_document_text(message: types.Message, state: FSMContext):
 
 
 # Создать заявку - Получаем документы
-@dp.message(F.document, StateFilter(UserFSM.documents))
-async def handle_document(message: types.Message, state: FSMContext):
-    await updating_base_properties(state=state, user=message.from_user, pool=dp["db_pool"])
-    document = message.document
-    file_info = await bot.get_file(document.file_id)
-    user_id = str(message.from_user.id)
-    client_name = sanitize_filename(await get_fsm_key(state, "client_name"))
-    org_name = sanitize_filename(await get_fsm_key(state, "organization_name"))
-    entity_type = await get_fsm_key(state, "name_entity_type")
-    datetime_folder = f"{datetime.now().strftime(format="%d.%m.%Y")}__{datetime.now().strftime(format="%H-%M-%S")}"
-    if entity_type == "Юридическое лицо" and org_name:
-        save_dir = DOCS_DIR / "Юридическое лицо" / org_name / client_name / datetime_folder
+async def handle_document(message: types.Message, state: FSMContext, db_pool: asyncpg.pool.Pool, bot: Bot, redis: Redis,
+                          document_storage: DocumentStorage):
+    if message.media_group_id:
+        # Файлы альбома приходят отдельными обновлениями почти одновременно. Первое обновление собирает альбом,
+        # остальные только добавляют в него свое сообщение
+        key = (message.from_user.id, message.media_group_id)
+        group = _media_groups.get(key)
+        if group is not None:
+            group.append(message)
+            return
+        group = _media_groups[key] = [message]
+        try:
+            while True:
+                received = len(group)
+                await asyncio.sleep(MEDIA_GROUP_DELAY)
+                if len(group) == received:
+                    break
+        finally:
+            del _media_groups[key]
     else:
-        save_dir = DOCS_DIR / "Физическое лицо" / client_name / datetime_folder
-    save_dir.mkdir(parents=True, exist_ok=True)
-    file_path = save_dir / f"{user_id}_{document.file_name}"
-    await bot.download_file(file_info.file_path, destination=file_path)
-    await message.answer(
-        f'✅ Файл {document.file_name} успешно сохранён! Если вы закончили, отправьте сообщение "Далее"')
-    docs = await get_fsm_key(state, "documents") or []
-    docs.append(str(file_path))
-    await state.update_data(documents=docs)
+        group = [message]
+    data = await state.get_data()
+    save_dir = await get_documents_dir(db_pool, data, datetime.now())
+    results = await asyncio.gather(*(save_document(bot, document_storage, item, save_dir) for item in group),
+                                   return_exceptions=True)
+    saved = [(item, path) for item, path in zip(group, results) if not isinstance(path, BaseException)]
+    failed = [(item, e) for item, e in zip(group, results) if isinstance(e, BaseException)]
+    if saved:
+        await append_draft_documents(redis, message.from_user.id, [path for _, path in saved])
+        names = ", ".join(item.document.file_name for item, _ in saved)
+        if len(saved) == 1:
+            await message.answer(f'✅ Файл {names} успешно сохранён! Если вы закончили, отправьте сообщение "Далее"')
+        else:
+            await message.answer(f'✅ Файлы успешно сохранены: {names}. Если вы закончили, отправьте сообщение "Далее"')
+    for item, e in failed:
+        logging.error(f"Не удалось сохранить файл {item.document.file_name} "
+                      f"(ID пользователя: {message.from_user.id}): {e}")
+        await message.answer(f"⚠ Не удалось сохранить файл {item.document.file_name}")
     logging.info(f"Функция '{inspect.currentframe().f_code.co_name}' - (ID пользователя: {message.from_user.id}) "
-                 f"(Пользователь: {message.from_user.full_name}) (Username: @{message.from_user.username})\n"
+                 f"(Пользователь: {message.from_user.full_name}) (Username: @{message.from_user.username}) "
+                 f"(Файлов: {len(group)})\n"
                  f"Data: {await state.get_data()}\n"
                  f"Текущее состояние: {await state.get_state()}")
 
 
 # Создать заявку - Выбор способа связи
-@dp.callback_query(StateFilter(UserFSM.feedback_id))
 async def handle_feedback(callback_query: CallbackQuery, state: FSMContext):
-    await updating_base_properties(state=state, user=callback_query.from_user, pool=dp["db_pool"])
-    feedbacks = await get_fsm_key(state, 'feedbacks')
-    await state.update_data(feedback_id=int(callback_query.data), name_feedback=feedbacks.get(callback_query.data))
+    await state.update_data(feedback_id=int(callback_query.data))
     await callback_query.message.edit_text("🤖 Напишите ваш контактный номер телефона.")
     await state.set_state(UserFSM.phone)
     logging.info(f"Функция '{inspect.currentframe().f_code.co_name}' - (ID пользователя: {callback_query.from_user.id}) "
@@ -677,9 +1264,7 @@ async def handle_feedback(callback_query: CallbackQuery, state: FSMContext):
 
 
 # Создать заявку - Ввод номера телефона
-@dp.message(F.text, StateFilter(UserFSM.phone))
 async def handle_phone(message: Message, state: FSMContext):
-    await updating_base_properties(state=state, user=message.from_user, pool=dp["db_pool"])
     await state.update_data(phone=message.text)
     await message.answer("🤖 Напишите ваш контактный адрес почты.")
     await state.set_state(UserFSM.email)
@@ -690,18 +1275,10 @@ async def handle_phone(message: Message, state: FSMContext):
 
 
 # Создать заявку - Ввод адреса почты
-@dp.message(F.text, StateFilter(UserFSM.email))
-async def handle_email(message: Message, state: FSMContext):
-    await updating_base_properties(state=state, user=message.from_user, pool=dp["db_pool"])
+async def handle_email(message: Message, state: FSMContext, db_pool: asyncpg.pool.Pool):
     await state.update_data(email=message.text)
-    query = "SELECT convenient_time_id, convenient_time_name FROM applications.convenient_time;"
-    rows = await safe_fetch(dp["db_pool"], query)
-    convenient_times = {row["convenient_time_id"]: row["convenient_time_name"] for row in rows}
-    buttons = [[InlineKeyboardButton(text=convenient_time_name, callback_data=str(convenient_time_id))]
-               for convenient_time_id, convenient_time_name in convenient_times.items()]
-    keyboard = InlineKeyboardMarkup(inline_keyboard=buttons)
-    await state.update_data(convenient_times=convenient_times)
-    await message.answer("🤖 Укажите удобное для вас время:", reply_markup=keyboard)
+    convenient_times = await get_reference(db_pool, 'convenient_times')
+    await message.answer("🤖 Укажите удобное для вас время:", reply_markup=reference_keyboard(convenient_times))
     await state.set_state(UserFSM.convenient_time_id)
     logging.info(f"Функция '{inspect.currentframe().f_code.co_name}' - (ID пользователя: {message.from_user.id}) "
                  f"(Пользователь: {message.from_user.full_name}) (Username: @{message.from_user.username})\n"
@@ -710,89 +1287,95 @@ async def handle_email(message: Message, state: FSMContext):
 
 
 # Создать заявку - Выбор удобного времени
-@dp.callback_query(StateFilter(UserFSM.convenient_time_id))
-async def handle_convenient_time(callback_query: CallbackQuery, state: FSMContext):
-    await updating_base_properties(state=state, user=callback_query.from_user, pool=dp["db_pool"])
-    convenient_times = await get_fsm_key(state, 'convenient_times')
-    await state.update_data(convenient_time_id=int(callback_query.data), convenient_time_name=convenient_times.get(callback_query.data))
+async def handle_convenient_time(callback_query: CallbackQuery, state: FSMContext, db_pool: asyncpg.pool.Pool, bot: Bot,
+                                 redis: Redis, application_writer: ApplicationWriter):
+    data = await state.update_data(convenient_time_id=int(callback_query.data))
+    user = callback_query.from_user
+    # Названия из справочников подставляются только в уведомление, в FSM хранятся ID
+    name_entity_type = await get_reference_name(db_pool, 'entity_types', data.get('entity_type_id'))
+    name_feedback = await get_reference_name(db_pool, 'feedbacks', data.get('feedback_id'))
+    convenient_time_name = await get_reference_name(db_pool, 'convenient_times', data.get('convenient_time_id'))
+    other_information = await get_draft_text(redis, user.id)
+    # Черновики, начатые до появления ключа идемпотентности, получают новый ключ
+    idempotency_key = uuid.UUID(data['idempotency_key']) if data.get('idempotency_key') else uuid.uuid4()
     processing_message = await callback_query.message.edit_text("Обработка заявки...")
     await asyncio.sleep(1)
-    match await get_fsm_key(state, 'name_entity_type'):
+    match name_entity_type:
         case "Физическое лицо":
             application_info = (
                 f"📋 НОВАЯ ЗАЯВКА!\n\n"
-                f"👤 Имя: {await get_fsm_key(state, 'client_name')} \nID: {await get_fsm_key(state, 'telegram_id')}, Username: @{await get_fsm_key(state, 'telegram_username')})\n\n"
-                f"🏢 Тип лица: {await get_fsm_key(state, 'name_entity_type')}\n\n\n"
-                f"📝 Описание задачи: \n{await get_fsm_key(state, 'other_information')}\n\n\n"
-                f"📞 Способ связи: {await get_fsm_key(state, 'name_feedback')}\n"
-                f"📞 Телефон: {await get_fsm_key(state, 'phone')}\n"
-                f"📞 Почта: {await get_fsm_key(state, 'email')}\n\n"
-                f"⏰ Удобное время:\n{await get_fsm_key(state, 'convenient_time_name')}\n"
+                f"👤 Имя: {data.get('client_name')} \nID: {user.id}, Username: @{user.username})\n\n"
+                f"🏢 Тип лица: {name_entity_type}\n\n\n"
+                f"📝 Описание задачи: \n{other_information}\n\n\n"
+                f"📞 Способ связи: {name_feedback}\n"
+                f"📞 Телефон: {data.get('phone')}\n"
+                f"📞 Почта: {data.get('email')}\n\n"
+                f"⏰ Удобное время:\n{convenient_time_name}\n"
             )
-            query = ("INSERT INTO applications.applications(telegram_id, client_name, phone, email, other_information, "
-                     "entity_type_id, feedback_id, convenient_time_id)\nVALUES($1,$2,$3,$4,$5,$6,$7,$8) "
-                     "RETURNING application_id, created_at;")
-            row = await safe_fetchrow(dp["db_pool"], query,
-                               await get_fsm_key(state, 'telegram_id'),
-                               await get_fsm_key(state, 'client_name'),
-                               await get_fsm_key(state, 'phone'),
-                               await get_fsm_key(state, 'email'),
-                               await get_fsm_key(state, 'other_information'),
-                               await get_fsm_key(state, 'entity_type_id'),
-                               await get_fsm_key(state, 'feedback_id'),
-                               await get_fsm_key(state, 'convenient_time_id'),
-                               )
-            await bot.send_message(CHAT_ID, application_info, parse_mode="None")
+            values = dict(telegram_id=user.id,
+                          client_name=data.get('client_name'),
+                          phone=data.get('phone'),
+                          email=data.get('email'),
+                          other_information=other_information,
+                          entity_type_id=data.get('entity_type_id'),
+                          feedback_id=data.get('feedback_id'),
+                          convenient_time_id=data.get('convenient_time_id'),
+                          idempotency_key=idempotency_key)
         case "Юридическое лицо":
+            name_category = await get_reference_name(db_pool, 'categories', data.get('category_id'))
+            name_subcategory = await get_reference_name(db_pool, 'subcategories', data.get('subcategory_id'),
+                                                        data.get('category_id'))
             application_info = (
                 f"📋 НОВАЯ ЗАЯВКА!\n\n"
-                f"👤 Имя: {await get_fsm_key(state, 'client_name')} \nID: {await get_fsm_key(state, 'telegram_id')}, Username: @{await get_fsm_key(state, 'telegram_username')})\n\n"
-                f"🏢 Тип лица: {await get_fsm_key(state, 'name_entity_type')}\n"
-                f"🏢 Организация: {await get_fsm_key(state, 'organization_name')}\n\n"
-                f"* Категория задачи:\n{await get_fsm_key(state, 'name_category')}\n"
-                f"* Подкатегория задачи:\n{await get_fsm_key(state, 'name_subcategory')}\n\n\n"
-                f"📝 Описание задачи: \n{await get_fsm_key(state, 'other_information')}\n\n\n"
-                f"📞 Способ связи: {await get_fsm_key(state, 'name_feedback')}\n"
-                f"📞 Телефон: {await get_fsm_key(state, 'phone')}\n"
-                f"📞 Почта: {await get_fsm_key(state, 'email')}\n\n"
-                f"⏰ Удобное время:\n{await get_fsm_key(state, 'convenient_time_name')}\n"
+                f"👤 Имя: {data.get('client_name')} \nID: {user.id}, Username: @{user.username})\n\n"
+                f"🏢 Тип лица: {name_entity_type}\n"
+                f"🏢 Организация: {data.get('organization_name')}\n\n"
+                f"* Категория задачи:\n{name_category}\n"
+                f"* Подкатегория задачи:\n{name_subcategory}\n\n\n"
+                f"📝 Описание задачи: \n{other_information}\n\n\n"
+                f"📞 Способ связи: {name_feedback}\n"
+                f"📞 Телефон: {data.get('phone')}\n"
+                f"📞 Почта: {data.get('email')}\n\n"
+                f"⏰ Удобное время:\n{convenient_time_name}\n"
             )
-            query = ("INSERT INTO applications.applications(telegram_id, client_name, organization_name, phone, email, "
-                     "other_information, entity_type_id, feedback_id, convenient_time_id, category_id, subcategory_id)"
-                     "\nVALUES($1,$2,$3,$4,$5,$6,$7,$8,$9,$10,$11) RETURNING application_id, created_at;")
-            row = await safe_fetchrow(dp["db_pool"], query,
-                                      await get_fsm_key(state, 'telegram_id'),
-                                      await get_fsm_key(state, 'client_name'),
-                                      await get_fsm_key(state, 'organization_name'),
-                                      await get_fsm_key(state, 'phone'),
-                                      await get_fsm_key(state, 'email'),
-                                      await get_fsm_key(state, 'other_information'),
-                                      await get_fsm_key(state, 'entity_type_id'),
-                                      await get_fsm_key(state, 'feedback_id'),
-                                      await get_fsm_key(state, 'convenient_time_id'),
-                                      await get_fsm_key(state, 'category_id'),
-                                      await get_fsm_key(state, 'subcategory_id')
-                               )
-            await bot.send_message(CHAT_ID, application_info, parse_mode="None")
+            values = dict(telegram_id=user.id,
+                          client_name=data.get('client_name'),
+                          organization_name=data.get('organization_name'),
+                          phone=data.get('phone'),
+                          email=data.get('email'),
+                          other_information=other_information,
+                          entity_type_id=data.get('entity_type_id'),
+                          feedback_id=data.get('feedback_id'),
+                          convenient_time_id=data.get('convenient_time_id'),
+                          category_id=data.get('category_id'),
+                          subcategory_id=data.get('subcategory_id'),
+                          idempotency_key=idempotency_key)
+    row = await application_writer.insert(values)
+    if row is None:
+        # Заявка с этим ключом уже сохранена: повтор после сбоя на одном из следующих шагов (например, обновление
+        # прервано при остановке бота). Берем сохраненную заявку и завершаем оставшиеся шаги
+        row = await safe_fetchrow(db_pool, APPLICATION_BY_IDEMPOTENCY_KEY_QUERY, idempotency_key)
+        logging.info(f"Функция '{inspect.currentframe().f_code.co_name}' - повторная отправка заявки, "
+                     f"завершение оставшихся шагов (ID пользователя: {user.id}) "
+                     f"(Ключ идемпотентности: {idempotency_key})")
     application_id = row["application_id"]
     uploaded_at = row["created_at"]
-    docs = await get_fsm_key(state, "documents") or []
-    for file_path in docs:
-        query = ("INSERT INTO applications.documents (application_id, file_path, original_name, uploaded_at)"
-                 "VALUES ($1,$2,$3,$4)")
-        await safe_execute(dp["db_pool"],
-                           query,
-                           application_id,
-                           file_path,
-                           Path(file_path).name,
-                           uploaded_at)
-
+    if STATUS_PAGE_CACHE_TTL:
+        await invalidate_status_page(redis, user.id)
+    docs = await get_draft_documents(redis, user.id)
+    if docs:
+        await safe_execute(db_pool, INSERT_APPLICATION_DOCUMENTS_QUERY, application_id, docs,
+                           [Path(file_path).name for file_path in docs], uploaded_at)
+        # Документы привязаны к заявке, очистке они больше не подлежат
+        await redis.zrem(DRAFT_DOCUMENTS_KEY, *docs)
+    await notify_new_application(bot, redis, application_id, application_info)
+    await clear_draft(redis, user.id)
 
     await processing_message.edit_text("🤖 Спасибо за предоставленную информацию!"
                                        " Ваша заявка отправлена. Мы свяжемся с вами в ближайшее время.")
     await asyncio.sleep(1)
     await state.set_state(None)
-    await cmd_start(state, callback_query.from_user, callback_query.message.answer)
+    await cmd_start(state, callback_query.from_user, callback_query.message.answer, db_pool)
     logging.info(f"Функция '{inspect.currentframe().f_code.co_name}' - (ID пользователя: {callback_query.from_user.id}) "
                  f"(Пользователь: {callback_query.from_user.full_name}) (Username: @{callback_query.from_user.username})\n"
                  f"Data: {await state.get_data()}\n"
@@ -803,11 +1386,10 @@ async def handle_convenient_time(callback_query: CallbackQuery, state: FSMContex
 
 
 # Управление заявками - Старт
-@dp.callback_query(F.data.startswith('Управление заявками'))
-async def application_management_start(callback_query: CallbackQuery, state: FSMContext):
+async def application_management_start(callback_query: CallbackQuery, state: FSMContext, db_pool: asyncpg.pool.Pool):
     await state.clear()
-    await updating_base_properties(state=state, user=callback_query.from_user, pool=dp["db_pool"])
-    if await get_fsm_key(state, 'check_status') and await get_fsm_key(state, 'status'):
+    properties = await get_base_properties(user=callback_query.from_user, pool=db_pool)
+    if properties['check_status'] and properties['status']:
         keyboard = InlineKeyboardMarkup(inline_keyboard=[
             [
                 InlineKeyboardButton(text="Список заявок", callback_data="Список заявок")
@@ -816,6 +1398,9 @@ async def application_management_start(callback_query: CallbackQuery, state: FSM
                 InlineKeyboardButton(text="Вся информация о заявке по ID",
                                      callback_data="Вся информация о заявки по ID")
             ],
+            [
+                InlineKeyboardButton(text="Аналитика", callback_data="Аналитика")
+            ],
             [
                 InlineKeyboardButton(text="Вернуться в стартовое меню", callback_data="Вернуться в стартовое меню")
             ]
@@ -828,15 +1413,12 @@ async def application_management_start(callback_query: CallbackQuery, state: FSM
 
 
 # Управление заявками - Список заявок
-@dp.callback_query(F.data.startswith('Список заявок'))
-async def application_management_list_applications(callback_query: CallbackQuery, state: FSMContext):
+async def application_management_list_applications(callback_query: CallbackQuery, state: FSMContext,
+                                                   db_pool: asyncpg.pool.Pool):
     await state.clear()
-    await updating_base_properties(state=state, user=callback_query.from_user, pool=dp["db_pool"])
-    if await get_fsm_key(state, 'check_status') and await get_fsm_key(state, 'status'):
-        query = ("SELECT a.application_id, a.organization_name, a.client_name, a.created_at, s.name_status "
-                 "FROM applications.applications a JOIN applications.statuses s "
-                 "ON a.status_id = s.status_id ORDER BY a.created_at DESC;")
-        rows = await safe_fetch(dp["db_pool"], query)
+    properties = await get_base_properties(user=callback_query.from_user, pool=db_pool)
+    if properties['check_status'] and properties['status']:
+        rows = await safe_fetch(db_pool, APPLICATIONS_QUERY)
         if not rows:
             await callback_query.message.edit_text("🤖 Нет заявок на данный момент.")
             await asyncio.sleep(1)
@@ -848,6 +1430,9 @@ async def application_management_list_applications(callback_query: CallbackQuery
                     InlineKeyboardButton(text="Вся информация о заявке по ID",
                                          callback_data="Вся информация о заявки по ID")
                 ],
+                [
+                    InlineKeyboardButton(text="Аналитика", callback_data="Аналитика")
+                ],
                 [
                     InlineKeyboardButton(text="Вернуться в стартовое меню", callback_data="Вернуться в стартовое меню")
                 ]
@@ -875,6 +1460,9 @@ async def application_management_list_applications(callback_query: CallbackQuery
                 InlineKeyboardButton(text="Вся информация о заявке по ID",
                                      callback_data="Вся информация о заявки по ID")
             ],
+            [
+                InlineKeyboardButton(text="Аналитика", callback_data="Аналитика")
+            ],
             [
                 InlineKeyboardButton(text="Вернуться в стартовое меню", callback_data="Вернуться в стартовое меню")
             ]
@@ -889,11 +1477,61 @@ async def application_management_list_applications(callback_query: CallbackQuery
                  f"Текущее состояние: {await state.get_state()}")
 
 
+# Сводка для кнопки "Аналитика". Запросы читают таблицу applications.application_stats, которую триггер
+# обновляет при каждом изменении заявки (см. migrations/0005_application_stats.sql), а не сами заявки
+ANALYTICS_QUERIES = {
+    'statuses': ("SELECT s.name_status AS name, sum(st.applications) AS total "
+                 "FROM applications.application_stats st JOIN applications.statuses s ON st.status_id = s.status_id "
+                 "GROUP BY s.name_status HAVING sum(st.applications) > 0 ORDER BY total DESC;"),
+    'categories': ("SELECT COALESCE(c.name_category, 'Без категории') AS name, sum(st.applications) AS total "
+                   "FROM applications.application_stats st "
+                   "LEFT JOIN applications.categories c ON st.category_id = c.category_id "
+                   "GROUP BY 1 HAVING sum(st.applications) > 0 ORDER BY total DESC;"),
+    'entity_types': ("SELECT COALESCE(et.name_entity_type, 'Не указан') AS name, sum(st.applications) AS total "
+                     "FROM applications.application_stats st "
+                     "LEFT JOIN applications.entity_types et ON st.entity_type_id = et.entity_type_id "
+                     "GROUP BY 1 HAVING sum(st.applications) > 0 ORDER BY total DESC;"),
+    'days': ("SELECT to_char(day, 'DD.MM.YYYY') AS name, sum(applications) AS total "
+             "FROM applications.application_stats WHERE day > current_date - $1::int "
+             "GROUP BY day HAVING sum(applications) > 0 ORDER BY day DESC;"),
+}
+
+# За сколько последних дней показывать количество заявок по дням
+ANALYTICS_DAYS = 14
+
+
+# Управление заявками - Аналитика
+async def application_management_analytics(callback_query: CallbackQuery, state: FSMContext,
+                                           db_pool: asyncpg.pool.Pool):
+    await state.clear()
+    properties = await get_base_properties(user=callback_query.from_user, pool=db_pool)
+    if properties['check_status'] and properties['status']:
+        statuses, categories, entity_types, days = await asyncio.gather(
+            safe_fetch(db_pool, ANALYTICS_QUERIES['statuses']),
+            safe_fetch(db_pool, ANALYTICS_QUERIES['categories']),
+            safe_fetch(db_pool, ANALYTICS_QUERIES['entity_types']),
+            safe_fetch(db_pool, ANALYTICS_QUERIES['days'], ANALYTICS_DAYS),
+        )
+        response = f"📊 Аналитика заявок\n\nВсего заявок: {sum(row['total'] for row in statuses)}\n"
+        for title, rows in (("📌 По статусам", statuses), ("🗂 По категориям", categories),
+                            ("🏢 По типу лица", entity_types), (f"📅 За последние {ANALYTICS_DAYS} дней", days)):
+            response += f"\n{title}:\n"
+            response += "".join(f"  {row['name']}: {row['total']}\n" for row in rows) or "  Нет заявок\n"
+        keyboard = InlineKeyboardMarkup(inline_keyboard=[
+            [
+                InlineKeyboardButton(text="Вернуться в стартовое меню", callback_data="Вернуться в стартовое меню")
+            ]
+        ])
+        await callback_query.message.answer(response, reply_markup=keyboard, parse_mode="None")
+    logging.info(f"Функция '{inspect.currentframe().f_code.co_name}' - (ID пользователя: {callback_query.from_user.id}) "
+                 f"(Пользователь: {callback_query.from_user.full_name}) (Username: @{callback_query.from_user.username})\n"
+                 f"Data: {await state.get_data()}\n"
+                 f"Текущее состояние: {await state.get_state()}")
+
+
 # Управление заявками - Пользователь выбрал кнопку "Вся информация о заявки по ID"
-@dp.callback_query(F.data.startswith('Вся информация о заявки по ID'))
 async def application_management_full_info_application_input_id(callback_query: CallbackQuery, state: FSMContext):
     await state.clear()
-    await updating_base_properties(state=state, user=callback_query.from_user, pool=dp["db_pool"])
     await callback_query.message.answer("🤖 Введите ID заявки:")
     await state.set_state(UserFSM.application_management_full_info_application)
     logging.info(f"Функция '{inspect.currentframe().f_code.co_name}' - (ID пользователя: {callback_query.from_user.id}) "
@@ -903,12 +1541,12 @@ async def application_management_full_info_application_input_id(callback_query:
 
 
 # Управление заявками - Пользователь выбрал ID заявки, который будет просматривать
-@dp.message(F.text, StateFilter(UserFSM.application_management_full_info_application))
-async def application_management_full_info_application_search_id(message: Message, state: FSMContext):
-    await updating_base_properties(state=state, user=message.from_user, pool=dp["db_pool"])
+async def application_management_full_info_application_search_id(message: Message, state: FSMContext,
+                                                                 db_pool: asyncpg.pool.Pool):
+    properties = await get_base_properties(user=message.from_user, pool=db_pool)
     try:
         application_id = int(message.text)
-        if await get_fsm_key(state, 'check_status') and await get_fsm_key(state, 'status'):
+        if properties['check_status'] and properties['status']:
             query = ("SELECT a.application_id, a.telegram_id, a.organization_name, a.client_name, a.phone, a.email, "
                      "c.name_category AS category, sc.name_subcategory AS subcategory, a.other_information, "
                      "s.name_status AS status, a.created_at, et.name_entity_type AS entity_type, "
@@ -921,13 +1559,12 @@ async def application_management_full_info_application_search_id(message: Messag
                      "LEFT JOIN applications.feedback f  ON a.feedback_id = f.feedback_id "
                      "LEFT JOIN applications.convenient_time ct ON a.convenient_time_id = ct.convenient_time_id "
                      "WHERE a.application_id = $1;")
-            row = await safe_fetchrow(dp["db_pool"], query, application_id)
+            row = await safe_fetchrow(db_pool, query, application_id)
             if not row:
                 await message.answer("❌ Такой заявки нет.")
                 await asyncio.sleep(1)
                 await state.clear()
-                await updating_base_properties(state=state, user=message.from_user, pool=dp["db_pool"])
-                if await get_fsm_key(state, 'check_status') and await get_fsm_key(state, 'status'):
+                if properties['check_status'] and properties['status']:
                     keyboard = InlineKeyboardMarkup(inline_keyboard=[
                         [
                             InlineKeyboardButton(text="Список заявок", callback_data="Список заявок")
@@ -936,6 +1573,9 @@ async def application_management_full_info_application_search_id(message: Messag
                             InlineKeyboardButton(text="Вся информация о заявке по ID",
                                                  callback_data="Вся информация о заявки по ID")
                         ],
+                        [
+                            InlineKeyboardButton(text="Аналитика", callback_data="Аналитика")
+                        ],
                         [
                             InlineKeyboardButton(text="Вернуться в стартовое меню",
                                                  callback_data="Вернуться в стартовое меню")
@@ -957,9 +1597,7 @@ async def application_management_full_info_application_search_id(message: Messag
                           f"Предпочтительное время для связи: {row['convenient_time']}\n\n"
                           f"Telegram ID: {row['telegram_id']}\n")
 
-            documents = await safe_fetch(dp["db_pool"],"SELECT document_id, application_id, file_path, "
-                                                       "original_name, uploaded_at FROM applications.documents "
-                                                       "WHERE application_id = $1 ORDER BY uploaded_at ASC;", application_id)
+            documents = await safe_fetch(db_pool, APPLICATION_DOCUMENTS_QUERY, application_id)
             if not documents:
                 keyboard = InlineKeyboardMarkup(inline_keyboard=[
                     [
@@ -988,21 +1626,16 @@ async def application_management_full_info_application_search_id(message: Messag
 
 
 # Управление заявками - Скачать документы
-@dp.callback_query(StateFilter(UserFSM.download_file))
-async def download_documents(callback_query: CallbackQuery, state: FSMContext):
-    await updating_base_properties(state=state, user=callback_query.from_user, pool=dp["db_pool"])
-    query = ("SELECT file_path, original_name "
-             "FROM applications.documents "
-             "WHERE application_id = $1 "
-             "ORDER BY uploaded_at ASC;")
-    documents = await safe_fetch(dp["db_pool"], query, int(callback_query.data))
+async def download_documents(callback_query: CallbackQuery, state: FSMContext, db_pool: asyncpg.pool.Pool, bot: Bot,
+                             document_storage: DocumentStorage):
+    documents = await safe_fetch(db_pool, APPLICATION_DOCUMENTS_QUERY, int(callback_query.data))
     if not documents:
         await callback_query.message.answer("❌ Для этой заявки нет документов.")
         await state.clear()
         return
     for doc in documents:
         try:
-            file = FSInputFile(doc["file_path"], filename=doc["original_name"])
+            file = document_storage.input_file(doc["file_path"], filename=doc["original_name"])
             await bot.send_document(
                 chat_id=callback_query.from_user.id,
                 document=file,
@@ -1020,21 +1653,514 @@ async def download_documents(callback_query: CallbackQuery, state: FSMContext):
 
 
 # Общий блок -----------------------------------------------------------------------------------------------------------
-@dp.callback_query(F.data.startswith("Вернуться в стартовое меню"))
-async def cmd_start_callback(callback: CallbackQuery, state: FSMContext):
-    await cmd_start(state, callback.from_user, callback.message.answer)
+async def cmd_start_callback(callback: CallbackQuery, state: FSMContext, db_pool: asyncpg.pool.Pool):
+    await cmd_start(state, callback.from_user, callback.message.answer, db_pool)
 
 
-# Запуск бота
-async def main():
-    logging.info('Запуск системы')
-    db_pool = await create_db_pool()
-    dp["db_pool"] = db_pool
-    try:
-        await dp.start_polling(bot)
-    finally:
-        await db_pool.close()
+# Уведомления об изменении статуса заявки ------------------------------------------------------------------------------
+
+
+# Канал PostgreSQL, в который триггер публикует изменения статуса заявки (см. migrations/0003_status_notify_trigger.sql)
+STATUS_NOTIFY_CHANNEL = 'application_status_changed'
+# Канал, в который триггер публикует Telegram ID измененного системного пользователя
+# (см. migrations/0006_system_user_notify_trigger.sql)
+SYSTEM_USER_NOTIFY_CHANNEL = 'system_user_changed'
+
+
+async def listen_status_changes(queue: asyncio.Queue, redis: Redis) -> None:
+    """
+    Слушать канал `STATUS_NOTIFY_CHANNEL` и складывать уведомления в очередь отправки.
+    Кэш страницы "Статус заявок" клиента сбрасывается сразу, не дожидаясь отправки уведомления.
+    По каналу `SYSTEM_USER_NOTIFY_CHANNEL` кэш сбрасывается пользователю, которого добавили в системные,
+    удалили из них или у которого изменился статус: кэшированная клиентская страница ему больше не подходит.
+
+    Для LISTEN используется отдельное соединение, а не соединение из пула: оно живёт всё время работы бота.
+    При обрыве соединения слушатель переподключается через `NOTIFY_RECONNECT_DELAY` секунд.
+
+    :param queue: Очередь уведомлений для `send_status_notifications`. Тип: `asyncio.Queue`.
+    :param redis: Клиент Redis. Тип: `Redis`.
+    :return: Возвращает `None`
+    """
+    invalidations = set()
+
+    async def invalidate(telegram_id: int) -> None:
+        try:
+            await invalidate_status_page(redis, telegram_id)
+        except RedisError as e:
+            logging.error(f"Не удалось сбросить кэш статуса заявок (ID пользователя: {telegram_id}): {e}")
+
+    def schedule_invalidation(telegram_id: int) -> None:
+        task = asyncio.create_task(invalidate(telegram_id))
+        invalidations.add(task)
+        task.add_done_callback(invalidations.discard)
+
+    def on_notify(_connection, _pid, _channel, payload):
+        notification = json.loads(payload)
+        if STATUS_PAGE_CACHE_TTL and notification.get('telegram_id'):
+            schedule_invalidation(notification['telegram_id'])
+        try:
+            queue.put_nowait(notification)
+        except asyncio.QueueFull:
+            logging.warning(f"Очередь уведомлений переполнена, уведомление отброшено: {payload}")
+
+    def on_system_user_changed(_connection, _pid, _channel, payload):
+        if STATUS_PAGE_CACHE_TTL:
+            schedule_invalidation(int(payload))
+
+    while True:
+        connection = None
+        try:
+            connection = await asyncpg.connect(host=DBMS_HOST, port=DBMS_PORT, user=DBMS_USER,
+                                               password=DBMS_PASSWORD, database=DBMS_DATABASE, timeout=3)
+            await connection.add_listener(STATUS_NOTIFY_CHANNEL, on_notify)
+            await connection.add_listener(SYSTEM_USER_NOTIFY_CHANNEL, on_system_user_changed)
+            logging.info(f"Слушатель канала '{STATUS_NOTIFY_CHANNEL}' подключен")
+            # Проверяем соединение запросом: обрыв TCP без запроса не обнаружить
+            while True:
+                await asyncio.sleep(NOTIFY_RECONNECT_DELAY)
+                await connection.execute("SELECT 1;", timeout=3)
+        except (OSError, asyncio.TimeoutError, asyncpg.PostgresError, asyncpg.InterfaceError) as e:
+            logging.error(f"Слушатель канала '{STATUS_NOTIFY_CHANNEL}' потерял соединение: {e}")
+        finally:
+            if connection is not None and not connection.is_closed():
+                connection.terminate()
+        await asyncio.sleep(NOTIFY_RECONNECT_DELAY)
+
+
+async def send_status_notifications(bot: Bot, queue: asyncio.Queue, redis: Redis) -> None:
+    """
+    Отправлять клиентам уведомления из очереди не чаще `NOTIFY_RATE_LIMIT` сообщений в секунду.
+
+    Уведомление о статусе заявки отправляет тот экземпляр бота, который первым занял ключ
+    `notified:<заявка>:<статус>` в Redis, остальные его пропускают. Ошибка одного уведомления не останавливает отправку.
+
+    :param bot: Бот, от имени которого отправляются уведомления. Тип: `Bot`.
+    :param queue: Очередь уведомлений, которую наполняет `listen_status_changes`. Тип: `asyncio.Queue`.
+    :param redis: Клиент Redis. Тип: `Redis`.
+    :return: Возвращает `None`
+    """
+    interval = 1 / NOTIFY_RATE_LIMIT
+    while True:
+        notification = await queue.get()
+        try:
+            if notification.get('telegram_id'):
+                key = f"notified:{notification['application_id']}:{notification['status_id']}"
+                try:
+                    first = await redis.set(key, 1, nx=True, ex=max(int(NOTIFY_DEDUP_TTL), 1))
+                except RedisError as e:
+                    logging.error(f"Дедупликация уведомлений: ошибка Redis, уведомление отправлено без проверки: {e}")
+                    first = True
+                if first:
+                    text = (f"🔔 Статус вашей заявки от {notification['created_at']} изменён!\n\n"
+                            f"📌 Статус: {notification['name_status']}")
+                    while True:
+                        try:
+                            await bot.send_message(notification['telegram_id'], text, parse_mode="None")
+                            break
+                        except TelegramRetryAfter as e:
+                            await asyncio.sleep(e.retry_after)
+        except TelegramAPIError as e:
+            # Например, пользователь заблокировал бота
+            logging.warning(f"Не удалось отправить уведомление {notification}: {e}")
+        except Exception as e:
+            # Например, некорректное уведомление: отправка остальных продолжается
+            logging.error(f"Ошибка обработки уведомления {notification}: {e!r}")
+        finally:
+            queue.task_done()
+        await asyncio.sleep(interval)
+
+
+# Очистка документов брошенных черновиков -----------------------------------------------------------------------------
+
+
+async def sweep_orphaned_documents(pool: asyncpg.pool.Pool, redis: Redis, document_storage: DocumentStorage) -> int:
+    """
+    Удалить документы, которые не привязаны ни к одной заявке и ни к одному живому черновику.
+
+    Такие файлы остаются, когда пользователь загрузил документы, но не отправил заявку,
+    и его черновик в Redis истек по TTL. Проверяются только документы из `DRAFT_DOCUMENTS_KEY`, загруженные
+    больше `DOCS_SWEEP_MIN_AGE` секунд назад, пачками по `DOCS_SWEEP_BATCH_SIZE`: на пачку - один конвейер
+    запросов к Redis и один запрос к базе. Поэтому проход не зависит от количества уже отправленных заявок.
+
+    :param pool: Подключение к базе PostgreSQL. Тип: `asyncpg.pool.Pool`.
+    :param redis: Клиент Redis с черновиками заявок. Тип: `Redis`.
+    :param document_storage: Хранилище документов. Тип: `DocumentStorage`.
+    :return: Количество удаленных файлов.
+    """
+    removed = 0
+    while True:
+        deadline = time.time() - DOCS_SWEEP_MIN_AGE
+        refs = [ref.decode() for ref in await redis.zrangebyscore(DRAFT_DOCUMENTS_KEY, "-inf", deadline,
+                                                                   start=0, num=DOCS_SWEEP_BATCH_SIZE)]
+        if not refs:
+            return removed
+        # Имя файла начинается с Telegram ID загрузившего пользователя: <telegram_id>_<имя файла>
+        user_ids = sorted({int(user_id) for user_id, _, _ in (Path(ref).name.partition("_") for ref in refs)
+                           if user_id.isdigit()})
+        # Черновики проверяются до базы: заявка сначала записывает документы в базу и только потом очищает черновик,
+        # поэтому документ отправленной заявки найдется либо в черновике, либо в базе
+        async with redis.pipeline(transaction=False) as pipe:
+            for user_id in user_ids:
+                pipe.lrange(draft_key(user_id, "documents"), 0, -1)
+            drafts = await pipe.execute()
+        in_drafts = {path.decode() for paths in drafts for path in paths}
+        rows = await safe_fetch(pool, "SELECT file_path FROM applications.documents WHERE file_path = ANY($1::text[]);",
+                                refs)
+        referenced = {row["file_path"] for row in rows}
+        orphaned = [ref for ref in refs if ref not in in_drafts and ref not in referenced]
+        if orphaned:
+            await document_storage.delete(orphaned)
+            removed += len(orphaned)
+            logging.info(f"Удалены документы брошенных черновиков: {orphaned}")
+        async with redis.pipeline(transaction=True) as pipe:
+            pipe.zrem(DRAFT_DOCUMENTS_KEY, *(ref for ref in refs if ref not in in_drafts))
+            if in_drafts & set(refs):
+                # Черновик еще жив: проверим документ снова, когда черновик истечет
+                pipe.zadd(DRAFT_DOCUMENTS_KEY, {ref: time.time() for ref in refs if ref in in_drafts})
+            await pipe.execute()
+
+
+async def documents_sweeper(pool: asyncpg.pool.Pool, redis: Redis, document_storage: DocumentStorage) -> None:
+    """
+    Периодически запускать `sweep_orphaned_documents` с интервалом `DOCS_SWEEP_INTERVAL` секунд.
+
+    :param pool: Подключение к базе PostgreSQL. Тип: `asyncpg.pool.Pool`.
+    :param redis: Клиент Redis с черновиками заявок. Тип: `Redis`.
+    :param document_storage: Хранилище документов. Тип: `DocumentStorage`.
+    :return: Возвращает `None`
+    """
+    while True:
+        await asyncio.sleep(DOCS_SWEEP_INTERVAL)
+        try:
+            removed = await sweep_orphaned_documents(pool, redis, document_storage)
+            logging.info(f"Очистка документов завершена, удалено файлов: {removed}")
+        except Exception as e:
+            logging.error(f"Ошибка очистки документов: {e}")
+
+
+# Маршрутизатор --------------------------------------------------------------------------------------------------------
+
+
+def create_router() -> Router:
+    """
+    Создать маршрутизатор со всеми обработчиками бота.
+
+    Маршрутизатор можно подключить только к одному диспетчеру, поэтому каждый `App.dispatcher` получает свой:
+    `create_app` можно вызывать несколько раз в одном процессе (тесты, несколько экземпляров бота).
+
+    :return: Маршрутизатор. Тип: `Router`.
+    """
+    router = Router()
+    router.message.register(cmd_get_my_id, Command("get_my_id"), flags={"throttling": "menu"})
+    router.message.register(cmd_start_message, Command("start"), flags={"throttling": "menu"})
+    router.message.register(cmd_status, Command("status"), flags={"throttling": "menu"})
+    router.message.register(cmd_export, Command("export"), flags={"throttling": "heavy"})
+    router.message.register(cmd_profile, Command("profile"), flags={"throttling": "heavy"})
+    router.message.register(other_message, StateFilter(None), flags={"throttling": "menu"})
+    router.callback_query.register(application_status, F.data.startswith('Статус заявок'), flags={"throttling": "menu"})
+    router.callback_query.register(application_start, F.data.startswith('Создать заявку'))
+    router.callback_query.register(handle_entity_type, StateFilter(UserFSM.entity_type_id))
+    router.callback_query.register(handle_category, StateFilter(UserFSM.category_id))
+    router.callback_query.register(handle_subcategory, StateFilter(UserFSM.subcategory_id))
+    router.message.register(handle_name, F.text, StateFilter(UserFSM.client_name), flags=WIZARD_INPUT_FLAGS)
+    router.message.register(handle_organization, F.text, StateFilter(UserFSM.organization_name),
+                            flags=WIZARD_INPUT_FLAGS)
+    router.message.register(message_other_information, F.text, StateFilter(UserFSM.other_information),
+                            flags=WIZARD_INPUT_FLAGS)
+    router.message.register(handle_document_text, F.text, StateFilter(UserFSM.documents), flags=WIZARD_INPUT_FLAGS)
+    router.message.register(handle_document, F.document, StateFilter(UserFSM.documents),
+                            flags={"throttling": "documents"})
+    router.callback_query.register(handle_feedback, StateFilter(UserFSM.feedback_id))
+    router.message.register(handle_phone, F.text, StateFilter(UserFSM.phone), flags=WIZARD_INPUT_FLAGS)
+    router.message.register(handle_email, F.text, StateFilter(UserFSM.email), flags=WIZARD_INPUT_FLAGS)
+    router.callback_query.register(handle_convenient_time, StateFilter(UserFSM.convenient_time_id))
+    router.callback_query.register(application_management_start, F.data.startswith('Управление заявками'),
+                                   flags={"throttling": "menu"})
+    router.callback_query.register(application_management_list_applications, F.data.startswith('Список заявок'),
+                                   flags={"throttling": "heavy"})
+    router.callback_query.register(application_management_analytics, F.data.startswith('Аналитика'),
+                                   flags={"throttling": "menu"})
+    router.callback_query.register(application_management_full_info_application_input_id,
+                                   F.data.startswith('Вся информация о заявки по ID'))
+    router.message.register(application_management_full_info_application_search_id, F.text,
+                            StateFilter(UserFSM.application_management_full_info_application),
+                            flags={"throttling": "heavy"})
+    router.callback_query.register(download_documents, StateFilter(UserFSM.download_file),
+                                   flags={"throttling": "heavy"})
+    router.callback_query.register(cmd_start_callback, F.data.startswith("Вернуться в стартовое меню"),
+                                   flags={"throttling": "menu"})
+    return router
+
+
+# Приложение -----------------------------------------------------------------------------------------------------------
+
+
+# Справочники, которые загружаются в кэш при запуске. Подкатегории зависят от категории и загружаются по требованию
+WARMUP_REFERENCES = ('entity_types', 'categories', 'feedbacks', 'convenient_times')
+
+
+@dataclass
+class AppConfig:
+    """
+    Настройки приложения. По умолчанию берутся из global_configs (переменных окружения).
+    """
+    bot_token: str | None = BOT_TOKEN
+    redis_url: str | None = REDIS_HOST
+    docs_storage: str = DOCS_STORAGE
+    docs_dir: Path = DOCS_DIR
+    fsm_l1_size: int = FSM_L1_SIZE
+    fsm_flush_interval: float = FSM_FLUSH_INTERVAL
+    run_migrations: bool = RUN_MIGRATIONS
+    health_host: str = HEALTH_HOST
+    health_port: int = HEALTH_PORT
+    bot_api_server_url: str = BOT_API_SERVER_URL
+    bot_api_local_mode: bool = BOT_API_LOCAL_MODE
+
+
+class App:
+    """
+    Бот и его подключения.
+
+    Компоненты (бот, диспетчер, клиент Redis, хранилище документов) создаются при первом обращении,
+    а подключения открываются в `startup`, поэтому создание приложения ничего не подключает и не пишет на диск.
+    Зависимости передаются обработчикам через данные диспетчера: `db_pool`, `redis`, `document_storage`, `started_at`.
+    """
+
+    def __init__(self, config: AppConfig) -> None:
+        """
+        :param config: Настройки приложения. Тип: `AppConfig`.
+        """
+        self.config = config
+        self.db_pool: asyncpg.pool.Pool | None = None
+        self.started_at: datetime | None = None
+        self.ready = False
+        self.status_notifications: asyncio.Queue | None = None
+        self.application_writer: ApplicationWriter | None = None
+        # Фоновые задачи по именам: status_listener, status_sender, documents_sweeper
+        self.background_tasks = {}
+        self.in_flight = InFlightMiddleware()
+        self.profiling = ProfilingMiddleware()
+
+    @cached_property
+    def redis(self) -> Redis:
+        # Подключение к Redis: хранилище FSM и части черновика заявки, которые копятся по сообщениям
+        return Redis.from_url(self.config.redis_url)
+
+    @cached_property
+    def document_storage(self) -> DocumentStorage:
+        if self.config.docs_storage == 's3':
+            return S3DocumentStorage(bucket=S3_BUCKET, endpoint_url=S3_ENDPOINT_URL, access_key=S3_ACCESS_KEY,
+                                     secret_key=S3_SECRET_KEY, region=S3_REGION)
+        return LocalDocumentStorage(self.config.docs_dir)
+
+    @cached_property
+    def bot(self) -> Bot:
+        api = PRODUCTION
+        if self.config.bot_api_server_url:
+            wrap_local_file = SimpleFilesPathWrapper(Path(BOT_API_SERVER_FILES_DIR), Path(BOT_API_LOCAL_FILES_DIR)) \
+                if BOT_API_SERVER_FILES_DIR and BOT_API_LOCAL_FILES_DIR else PRODUCTION.wrap_local_file
+            api = TelegramAPIServer.from_base(self.config.bot_api_server_url, is_local=self.config.bot_api_local_mode,
+                                              wrap_local_file=wrap_local_file)
+        session = BotApiSession(api=api, limit=BOT_API_POOL_LIMIT, keepalive_timeout=BOT_API_KEEPALIVE_TIMEOUT,
+                                timeout=BOT_API_TIMEOUT)
+        return Bot(token=self.config.bot_token, session=session)
+
+    @cached_property
+    def dispatcher(self) -> Dispatcher:
+        storage = MsgpackRedisStorage(self.redis, state_ttl=REDIS_STATE_TTL, data_ttl=REDIS_DATA_TTL)
+        if self.config.fsm_l1_size:
+            # Горячие сессии обслуживаются из памяти процесса, Redis остается долговременной копией
+            storage = TieredStorage(storage, max_size=self.config.fsm_l1_size,
+                                    flush_interval=self.config.fsm_flush_interval, ttl=REDIS_DATA_TTL)
+        dispatcher = Dispatcher(storage=storage, redis=self.redis, document_storage=self.document_storage)
+        dispatcher.update.outer_middleware(self.in_flight)
+        if CALLBACK_DEDUP_TTL:
+            dispatcher.callback_query.outer_middleware(CallbackDedupMiddleware(self.redis, CALLBACK_DEDUP_TTL))
+        if THROTTLE_LIMITS:
+            throttling = ThrottlingMiddleware(THROTTLE_LIMITS, self.redis if THROTTLE_BACKEND == 'redis' else None)
+            dispatcher.message.middleware(throttling)
+            dispatcher.callback_query.middleware(throttling)
+        dispatcher.message.middleware(self.profiling)
+        dispatcher.callback_query.middleware(self.profiling)
+        dispatcher["profiling"] = self.profiling
+        # Диспетчер при остановке закрывает хранилище FSM обработчиком, зарегистрированным в его конструкторе.
+        # Дренаж должен выполниться раньше, пока хранилище и сессия бота еще открыты
+        dispatcher.shutdown.handlers.insert(0, HandlerObject(callback=self.drain))
+        dispatcher.include_router(create_router())
+        return dispatcher
+
+    async def startup(self) -> None:
+        """
+        Применить миграции, открыть подключения и прогреть их. Независимые шаги выполняются одновременно:
+        пул PostgreSQL (с подготовкой горячих запросов на каждом соединении), Redis и сессия Bot API,
+        затем справочники из `WARMUP_REFERENCES`. После этого бот считается готовым (`ready`).
+
+        :return: Возвращает `None`
+        """
+        self.started_at = datetime.now()
+        if self.config.run_migrations:
+            versions = await run_migrations()
+            logging.info(f"Применено миграций: {len(versions)}")
+        self.db_pool, _, _ = await asyncio.gather(create_db_pool(), self.redis.ping(), self.bot.get_me())
+        await asyncio.gather(*(get_reference(self.db_pool, name) for name in WARMUP_REFERENCES))
+
+        self.status_notifications = asyncio.Queue(maxsize=NOTIFY_QUEUE_SIZE)
+        self.dispatcher["db_pool"] = self.db_pool
+        self.dispatcher["application_writer"] = self.application_writer = ApplicationWriter(
+            self.db_pool, batch_delay=INSERT_BATCH_DELAY, batch_size=INSERT_BATCH_SIZE
+        )
+        self.dispatcher["started_at"] = self.started_at
+        self.background_tasks = {
+            'status_listener': asyncio.create_task(listen_status_changes(self.status_notifications,
+                                                                         self.redis)),
+            'status_sender': asyncio.create_task(send_status_notifications(self.bot, self.status_notifications,
+                                                                           self.redis)),
+        }
+        if DOCS_SWEEP_INTERVAL:
+            self.background_tasks['documents_sweeper'] = asyncio.create_task(
+                documents_sweeper(self.db_pool, self.redis, self.document_storage)
+            )
+        self.ready = True
+        logging.info(f"Система готова к работе, запуск занял {datetime.now() - self.started_at}")
+
+    async def stop_background_tasks(self, *names: str) -> None:
+        """
+        Остановить фоновые задачи.
+
+        :param names: Имена задач из `background_tasks`. Без имен - все задачи.
+        :return: Возвращает `None`
+        """
+        tasks = [self.background_tasks.pop(name) for name in names or list(self.background_tasks)
+                 if name in self.background_tasks]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def drain(self) -> None:
+        """
+        Плавная остановка. Вызывается диспетчером, когда опрос обновлений уже остановлен (SIGTERM/SIGINT),
+        но хранилище FSM и сессия бота еще открыты. Всё укладывается в `SHUTDOWN_TIMEOUT` секунд:
+
+        1. Бот перестает считаться готовым (`/health/ready` отвечает 503).
+        2. Дожидается обработки уже полученных обновлений: загрузки документов, отправки заявок и уведомлений
+           в CHAT_ID. Не успевшие к сроку обработчики прерываются.
+        3. Подтверждает Telegram обработанные обновления, чтобы следующий экземпляр не получил их повторно.
+           Прерванные обновления не подтверждаются и будут доставлены заново.
+        4. Отправляет уведомления о смене статуса, уже стоящие в очереди.
+
+        После дренажа диспетчер сбрасывает и закрывает хранилище FSM и закрывает сессию бота,
+        затем `shutdown` закрывает остальные подключения.
+
+        :return: Возвращает `None`
+        """
+        self.ready = False
+        deadline = time.monotonic() + SHUTDOWN_TIMEOUT
+        logging.info(f"Остановка системы: обновлений в обработке - {len(self.in_flight.tasks)}")
+
+        # Новые события больше не нужны: очистка документов и прием уведомлений останавливаются сразу
+        await self.stop_background_tasks('documents_sweeper', 'status_listener')
+
+        interrupted = []
+        if not await self.in_flight.wait_idle(deadline - time.monotonic()):
+            interrupted = await self.in_flight.cancel()
+            logging.warning(f"Обработка обновлений прервана по истечении времени остановки: {interrupted}")
+        await self.confirm_updates(interrupted)
+
+        if self.status_notifications is not None:
+            try:
+                await asyncio.wait_for(self.status_notifications.join(), timeout=max(deadline - time.monotonic(), 0))
+            except asyncio.TimeoutError:
+                logging.warning(f"Не отправлены уведомления о смене статуса: "
+                                f"{self.status_notifications.qsize()} шт.")
+        await self.stop_background_tasks()
+        logging.info('Дренаж завершен')
+
+    async def confirm_updates(self, interrupted: list) -> None:
+        """
+        Подтвердить Telegram получение обработанных обновлений.
+
+        Опрос подтверждает обновления только следующим запросом getUpdates, поэтому обновления последней пачки
+        остаются неподтвержденными, если бот остановился сразу после их получения.
+
+        :param interrupted: ID обновлений, обработка которых прервана. Тип: `list[int]`.
+        :return: Возвращает `None`
+        """
+        if self.in_flight.last_update_id is None:
+            return
+        offset = min(interrupted) if interrupted else self.in_flight.last_update_id + 1
+        try:
+            await self.bot.get_updates(offset=offset, limit=1, timeout=0)
+        except TelegramAPIError as e:
+            logging.warning(f"Не удалось подтвердить обработанные обновления: {e}")
+
+    async def shutdown(self) -> None:
+        """
+        Остановить фоновые задачи и закрыть подключения, открытые в `startup`.
+
+        :return: Возвращает `None`
+        """
+        self.ready = False
+        await self.stop_background_tasks()
+        if self.application_writer is not None:
+            await self.application_writer.close()
+        await self.document_storage.close()
+        if self.db_pool is not None:
+            await self.db_pool.close()
+        # Хранилище FSM закрывает клиент Redis при остановке диспетчера, но не если бот не успел запуститься
+        await self.redis.aclose()
+        for handler in logging.getLogger().handlers:
+            handler.flush()
+
+    async def start_health_server(self) -> web.AppRunner:
+        """
+        Запустить HTTP-сервер проверок для оркестратора:
+        `/health/live` - процесс работает, `/health/ready` - бот прогрет и принимает обновления (иначе 503).
+
+        :return: Запущенный сервер, его нужно остановить через `cleanup()`. Тип: `web.AppRunner`.
+        """
+        async def live(_request: web.Request) -> web.Response:
+            return web.Response(text="ok")
+
+        async def ready(_request: web.Request) -> web.Response:
+            if self.ready:
+                return web.Response(text="ok")
+            return web.Response(status=503, text="not ready")
+
+        application = web.Application()
+        application.router.add_get("/health/live", live)
+        application.router.add_get("/health/ready", ready)
+        runner = web.AppRunner(application, access_log=None)
+        await runner.setup()
+        await web.TCPSite(runner, self.config.health_host, self.config.health_port).start()
+        return runner
+
+    async def run(self) -> None:
+        """
+        Запустить бота: прогрев, опрос обновлений до остановки, затем закрытие подключений.
+
+        :return: Возвращает `None`
+        """
+        logging.info('Запуск системы')
+        health = await self.start_health_server() if self.config.health_port else None
+        try:
+            await self.startup()
+            await self.dispatcher.start_polling(self.bot)
+        finally:
+            await self.shutdown()
+            if health is not None:
+                await health.cleanup()
+
+
+def create_app(config: AppConfig | None = None) -> App:
+    """
+    Создать приложение бота.
+
+    :param config: Настройки приложения. `None` - настройки из global_configs. Тип: `AppConfig | None`.
+    :return: Приложение, которое запускается через `run()`. Тип: `App`.
+    """
+    return App(config or AppConfig())
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    setup_logging()
+    asyncio.run(create_app().run())
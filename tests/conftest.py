@@ -0,0 +1,66 @@
+import sys
+import uuid
+from pathlib import Path
+
+import asyncpg
+import pytest
+import pytest_asyncio
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+
+# Модули бота лежат в корне репозитория
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from global_configs.database_configs import (DBMS_HOST, DBMS_PORT, DBMS_USER, DBMS_PASSWORD,  # noqa: E402
+                                             DBMS_DATABASE, REDIS_HOST)
+from migrate import apply_migration, applied_migrations, list_migrations  # noqa: E402
+
+
+@pytest_asyncio.fixture
+async def redis():
+    """
+    Клиент Redis из `PROJECT_0_REDIS_HOST`. Без доступного Redis тест пропускается.
+    Ключи, добавленные тестом в `redis.test_keys`, удаляются после теста.
+    """
+    if not REDIS_HOST:
+        pytest.skip("Redis не настроен (PROJECT_0_REDIS_HOST)")
+    client = Redis.from_url(REDIS_HOST)
+    try:
+        await client.ping()
+    except (RedisError, OSError) as e:
+        await client.aclose()
+        pytest.skip(f"Redis недоступен: {e}")
+    client.test_keys = []
+    yield client
+    if client.test_keys:
+        await client.delete(*client.test_keys)
+    await client.aclose()
+
+
+@pytest_asyncio.fixture(scope="module", loop_scope="module")
+async def database():
+    """
+    Соединение с временной базой, к которой применены все миграции. База создается на сервере
+    из `global_configs.database_configs` (нужно право CREATE DATABASE) и удаляется после тестов модуля.
+    Без доступного PostgreSQL тест пропускается.
+    """
+    try:
+        admin = await asyncpg.connect(host=DBMS_HOST, port=DBMS_PORT, user=DBMS_USER, password=DBMS_PASSWORD,
+                                      database=DBMS_DATABASE, timeout=3)
+    except (OSError, asyncpg.PostgresError, TimeoutError) as e:
+        pytest.skip(f"PostgreSQL недоступен: {e}")
+    name = f"bot_tests_{uuid.uuid4().hex[:12]}"
+    await admin.execute(f'CREATE DATABASE "{name}"')
+    try:
+        connection = await asyncpg.connect(host=DBMS_HOST, port=DBMS_PORT, user=DBMS_USER, password=DBMS_PASSWORD,
+                                           database=name)
+        try:
+            await applied_migrations(connection)
+            for version, path in list_migrations():
+                await apply_migration(connection, version, path)
+            yield connection
+        finally:
+            await connection.close()
+    finally:
+        await admin.execute(f'DROP DATABASE IF EXISTS "{name}" WITH (FORCE)')
+        await admin.close()
@@ -0,0 +1,16 @@
+from start_app import AppConfig, cmd_start_message, create_app
+
+
+async def test_create_app_can_be_called_more_than_once(tmp_path):
+    config = AppConfig(redis_url="redis://localhost:6379/15", docs_storage="local", docs_dir=tmp_path)
+    first, second = create_app(config), create_app(config)
+    try:
+        # Каждый диспетчер получает свой маршрутизатор: повторное подключение одного и того же вызвало бы ошибку
+        routers = [first.dispatcher.sub_routers[0], second.dispatcher.sub_routers[0]]
+
+        assert routers[0] is not routers[1]
+        for router in routers:
+            assert cmd_start_message in [handler.callback for handler in router.message.handlers]
+    finally:
+        await first.redis.aclose()
+        await second.redis.aclose()
@@ -0,0 +1,148 @@
+import asyncio
+import uuid
+
+import pytest
+
+from application_writer import (APPLICATION_COLUMNS, INSERT_APPLICATION_QUERY, INSERT_APPLICATIONS_BATCH_QUERY,
+                                ApplicationWriter)
+
+
+class FakeConnection:
+    """
+    Соединение, которое вставляет заявки в список и соблюдает уникальность ключа идемпотентности.
+    """
+
+    def __init__(self, pool: "FakePool") -> None:
+        self.pool = pool
+
+    def _insert(self, row: tuple):
+        key = row[-1]
+        if key in self.pool.fail_keys:
+            raise ValueError("нарушено ограничение")
+        if key in self.pool.rows:
+            return None
+        application_id = len(self.pool.rows) + 1
+        self.pool.rows[key] = row
+        return {"idempotency_key": key, "application_id": application_id, "created_at": f"created {application_id}"}
+
+    async def fetchrow(self, query, *row, timeout=None):
+        self.pool.queries.append((query, row))
+        return self._insert(row)
+
+    async def fetch(self, query, *columns, timeout=None):
+        self.pool.queries.append((query, columns))
+        rows = list(zip(*columns))
+        if any(row[-1] in self.pool.fail_keys for row in rows):
+            raise ValueError("нарушено ограничение")
+        return [record for record in map(self._insert, rows) if record is not None]
+
+
+class FakePool:
+    def __init__(self) -> None:
+        self.rows = {}
+        self.queries = []
+        self.fail_keys = set()
+
+    def acquire(self, timeout=None):
+        pool = self
+
+        class Acquire:
+            async def __aenter__(self):
+                return FakeConnection(pool)
+
+            async def __aexit__(self, *exc):
+                return False
+
+        return Acquire()
+
+
+def make_values(key: uuid.UUID = None, **values) -> dict:
+    return dict(telegram_id=1, client_name="Клиент", idempotency_key=key or uuid.uuid4(), **values)
+
+
+async def test_insert_without_batching_uses_single_row_query():
+    pool = FakePool()
+    writer = ApplicationWriter(pool)
+    values = make_values(phone="+7")
+
+    record = await writer.insert(values)
+
+    assert record["application_id"] == 1
+    query, row = pool.queries[0]
+    assert query == INSERT_APPLICATION_QUERY
+    # Значения передаются в порядке APPLICATION_COLUMNS, отсутствующие - NULL
+    assert row == tuple(values.get(name) for name, _ in APPLICATION_COLUMNS)
+
+
+async def test_insert_without_batching_returns_none_for_duplicate_key():
+    writer = ApplicationWriter(FakePool())
+    key = uuid.uuid4()
+
+    assert await writer.insert(make_values(key)) is not None
+    assert await writer.insert(make_values(key)) is None
+
+
+async def test_concurrent_inserts_are_batched_into_one_query():
+    pool = FakePool()
+    writer = ApplicationWriter(pool, batch_delay=0.01)
+    values = [make_values() for _ in range(5)]
+
+    records = await asyncio.gather(*(writer.insert(item) for item in values))
+
+    assert [query for query, _ in pool.queries] == [INSERT_APPLICATIONS_BATCH_QUERY]
+    # Каждый отправитель получает свою строку
+    assert [record["idempotency_key"] for record in records] == [item["idempotency_key"] for item in values]
+    assert len({record["application_id"] for record in records}) == 5
+
+
+async def test_batch_returns_none_for_repeated_key_in_same_batch():
+    writer = ApplicationWriter(FakePool(), batch_delay=0.01)
+    key = uuid.uuid4()
+
+    first, repeated = await asyncio.gather(writer.insert(make_values(key)), writer.insert(make_values(key)))
+
+    assert first is not None
+    assert repeated is None
+
+
+async def test_full_batch_is_flushed_without_waiting_for_delay():
+    pool = FakePool()
+    writer = ApplicationWriter(pool, batch_delay=60, batch_size=3)
+
+    records = await asyncio.wait_for(asyncio.gather(*(writer.insert(make_values()) for _ in range(3))), timeout=1)
+
+    assert all(record is not None for record in records)
+    assert len(pool.queries) == 1
+
+
+async def test_failed_batch_falls_back_to_single_inserts():
+    pool = FakePool()
+    writer = ApplicationWriter(pool, batch_delay=0.01)
+    bad_key = uuid.uuid4()
+    pool.fail_keys.add(bad_key)
+
+    good, bad = await asyncio.gather(writer.insert(make_values()), writer.insert(make_values(bad_key)),
+                                     return_exceptions=True)
+
+    assert good["application_id"] == 1
+    # Ошибка достается только отправителю заявки, которая ее вызвала
+    assert isinstance(bad, ValueError)
+    assert [query for query, _ in pool.queries] == [INSERT_APPLICATIONS_BATCH_QUERY, INSERT_APPLICATION_QUERY,
+                                                    INSERT_APPLICATION_QUERY]
+
+
+async def test_close_flushes_pending_inserts():
+    pool = FakePool()
+    writer = ApplicationWriter(pool, batch_delay=60)
+
+    task = asyncio.create_task(writer.insert(make_values()))
+    await asyncio.sleep(0)
+    await writer.close()
+
+    assert (await task)["application_id"] == 1
+
+
+@pytest.mark.parametrize("name, column_type", APPLICATION_COLUMNS)
+def test_batch_query_unnests_every_column(name, column_type):
+    assert name in INSERT_APPLICATIONS_BATCH_QUERY
+    assert f"::{column_type}[]" in INSERT_APPLICATIONS_BATCH_QUERY
@@ -0,0 +1,30 @@
+from aiogram.client.telegram import TelegramAPIServer
+
+from bot_session import BotApiSession
+
+
+async def test_session_connector_uses_pool_settings():
+    session = BotApiSession(limit=7, keepalive_timeout=42)
+    try:
+        client = await session.create_session()
+
+        assert client.connector.limit == 7
+        assert client.connector._keepalive_timeout == 42
+        # Остальное настраивает AiohttpSession, как для обычной сессии
+        assert "aiogram/" in client.headers["User-Agent"]
+        # Сессия переиспользуется между запросами
+        assert await session.create_session() is client
+    finally:
+        await session.close()
+
+
+async def test_session_is_recreated_after_close():
+    session = BotApiSession(api=TelegramAPIServer.from_base("http://localhost:8081", is_local=True))
+    client = await session.create_session()
+    await session.close()
+    try:
+        assert client.closed
+        assert await session.create_session() is not client
+        assert session.api.is_local
+    finally:
+        await session.close()
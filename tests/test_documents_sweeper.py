@@ -0,0 +1,96 @@
+import time
+import uuid
+
+import pytest
+
+import start_app
+from start_app import append_draft_documents, draft_key, sweep_orphaned_documents
+
+
+class FakePool:
+    """
+    Пул, в котором `applications.documents` - это множество путей.
+    """
+
+    def __init__(self, file_paths=()) -> None:
+        self.file_paths = set(file_paths)
+        self.queries = []
+
+    def acquire(self):
+        pool = self
+
+        class Connection:
+            async def fetch(self, query, refs):
+                pool.queries.append(refs)
+                return [{"file_path": ref} for ref in refs if ref in pool.file_paths]
+
+        class Acquire:
+            async def __aenter__(self):
+                return Connection()
+
+            async def __aexit__(self, *exc):
+                return False
+
+        return Acquire()
+
+
+class FakeStorage:
+    def __init__(self) -> None:
+        self.deleted = []
+
+    async def delete(self, refs):
+        self.deleted += refs
+
+
+@pytest.fixture
+def sweep_key(redis, monkeypatch):
+    key = f"draft_documents_test:{uuid.uuid4().hex}"
+    monkeypatch.setattr(start_app, "DRAFT_DOCUMENTS_KEY", key)
+    monkeypatch.setattr(start_app, "DOCS_SWEEP_MIN_AGE", 100)
+    redis.test_keys.append(key)
+    return key
+
+
+def make_user(redis) -> int:
+    user_id = uuid.uuid4().int % 10 ** 12
+    redis.test_keys.append(draft_key(user_id, "documents"))
+    return user_id
+
+
+async def test_sweep_deletes_only_abandoned_draft_documents(redis, sweep_key):
+    live, abandoned, submitted = make_user(redis), make_user(redis), make_user(redis)
+    old = time.time() - 1000
+    refs = {user_id: f"/docs/{user_id}_file.pdf" for user_id in (live, abandoned, submitted)}
+    await redis.zadd(sweep_key, {ref: old for ref in refs.values()})
+    await redis.zadd(sweep_key, {f"/docs/{abandoned}_fresh.pdf": time.time()})
+    await redis.rpush(draft_key(live, "documents"), refs[live])
+    pool, storage = FakePool([refs[submitted]]), FakeStorage()
+
+    assert await sweep_orphaned_documents(pool, redis, storage) == 1
+
+    assert storage.deleted == [refs[abandoned]]
+    # Документ живого черновика остается под наблюдением с новым временем, остальные проверенные - сняты
+    remaining = dict(await redis.zrange(sweep_key, 0, -1, withscores=True))
+    assert set(remaining) == {refs[live].encode(), f"/docs/{abandoned}_fresh.pdf".encode()}
+    assert remaining[refs[live].encode()] > old
+
+
+async def test_sweep_checks_in_batches(redis, sweep_key, monkeypatch):
+    monkeypatch.setattr(start_app, "DOCS_SWEEP_BATCH_SIZE", 2)
+    user_id = make_user(redis)
+    await redis.zadd(sweep_key, {f"/docs/{user_id}_{n}.pdf": time.time() - 1000 for n in range(5)})
+    pool, storage = FakePool(), FakeStorage()
+
+    assert await sweep_orphaned_documents(pool, redis, storage) == 5
+
+    assert [len(refs) for refs in pool.queries] == [2, 2, 1]
+    assert await redis.zcard(sweep_key) == 0
+
+
+async def test_uploaded_documents_are_tracked(redis, sweep_key):
+    user_id = make_user(redis)
+
+    await append_draft_documents(redis, user_id, ["/docs/a.pdf", "/docs/b.pdf"])
+
+    assert await redis.zcard(sweep_key) == 2
+    assert await redis.zscore(sweep_key, "/docs/a.pdf") == pytest.approx(time.time(), abs=5)
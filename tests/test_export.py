@@ -0,0 +1,53 @@
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock
+
+import asyncpg
+import pytest
+
+import start_app
+from start_app import cmd_export
+
+
+@pytest.fixture
+def staff(monkeypatch):
+    monkeypatch.setattr(start_app, "get_base_properties", AsyncMock(return_value=dict(check_status=True, status=True)))
+
+
+def make_message():
+    message = MagicMock()
+    message.from_user = SimpleNamespace(id=1, full_name="Сотрудник", username="staff")
+    message.chat = SimpleNamespace(id=1)
+    processing_message = MagicMock()
+    processing_message.edit_text = AsyncMock()
+    processing_message.delete = AsyncMock()
+    message.answer = AsyncMock(return_value=processing_message)
+    return message, processing_message
+
+
+async def test_export_failure_replaces_progress_message(staff, monkeypatch):
+    monkeypatch.setattr(start_app, "export_applications",
+                        AsyncMock(side_effect=asyncpg.QueryCanceledError("canceling statement due to timeout")))
+    message, processing_message = make_message()
+    bot = MagicMock()
+    bot.send_document = AsyncMock()
+
+    await cmd_export(message, AsyncMock(), SimpleNamespace(args="csv"), db_pool=MagicMock(), bot=bot)
+
+    processing_message.edit_text.assert_awaited_once()
+    assert processing_message.edit_text.await_args.args[0].startswith("⚠ Не удалось сформировать выгрузку")
+    bot.send_document.assert_not_awaited()
+
+
+async def test_export_sends_file_and_removes_it(staff, monkeypatch, tmp_path):
+    path = tmp_path / "applications.csv"
+    path.write_text("ID\n1\n")
+    monkeypatch.setattr(start_app, "export_applications", AsyncMock(return_value=(path, 1)))
+    message, processing_message = make_message()
+    bot = MagicMock()
+    bot.send_document = AsyncMock()
+
+    await cmd_export(message, AsyncMock(), SimpleNamespace(args="csv"), db_pool=MagicMock(), bot=bot)
+
+    bot.send_document.assert_awaited_once()
+    processing_message.delete.assert_awaited_once()
+    assert not path.exists()
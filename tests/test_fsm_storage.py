@@ -0,0 +1,203 @@
+import asyncio
+
+import pytest
+from aiogram.fsm.storage.base import BaseStorage, StorageKey
+
+import fsm_storage
+from fsm_storage import TieredStorage
+
+
+class FakeBackend(BaseStorage):
+    """
+    Нижний уровень в памяти. Запись сессии можно задержать (`gates`) или заставить падать (`fail`).
+    """
+
+    def __init__(self) -> None:
+        self.states = {}
+        self.data = {}
+        self.writes = []
+        self.reads = 0
+        self.fail = False
+        # Ключ -> событие, до которого запись этой сессии не завершается
+        self.gates = {}
+        self.closed = False
+
+    async def _write(self, store, key, value):
+        if key in self.gates:
+            await self.gates[key].wait()
+        if self.fail:
+            raise ConnectionError("backend down")
+        store[key] = value
+        self.writes.append((key.user_id, value))
+
+    async def set_state(self, key, state=None):
+        await self._write(self.states, key, state)
+
+    async def get_state(self, key):
+        self.reads += 1
+        return self.states.get(key)
+
+    async def set_data(self, key, data):
+        await self._write(self.data, key, dict(data))
+
+    async def get_data(self, key):
+        self.reads += 1
+        return dict(self.data.get(key, {}))
+
+    async def close(self):
+        self.closed = True
+
+
+def make_key(user_id: int) -> StorageKey:
+    return StorageKey(bot_id=1, chat_id=user_id, user_id=user_id)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(fsm_storage.time, "monotonic", lambda: now[0])
+    return now
+
+
+async def test_write_through_writes_every_change():
+    backend = FakeBackend()
+    storage = TieredStorage(backend)
+
+    await storage.set_state(make_key(1), "UserFSM:phone")
+    await storage.set_data(make_key(1), {"phone": "+7"})
+
+    assert backend.states[make_key(1)] == "UserFSM:phone"
+    assert backend.data[make_key(1)] == {"phone": "+7"}
+    # Прочитанное обслуживается из памяти
+    assert await storage.get_state(make_key(1)) == "UserFSM:phone"
+    assert backend.reads == 0
+
+
+async def test_write_behind_flushes_latest_value_once():
+    backend = FakeBackend()
+    storage = TieredStorage(backend, flush_interval=60)
+
+    for n in range(3):
+        await storage.set_data(make_key(1), {"n": n})
+    assert backend.writes == []
+
+    await storage.flush()
+
+    assert backend.writes == [(1, {"n": 2})]
+    await storage.flush()
+    assert len(backend.writes) == 1
+    await storage.close()
+
+
+async def test_close_flushes_pending_changes():
+    backend = FakeBackend()
+    storage = TieredStorage(backend, flush_interval=60)
+    await storage.set_state(make_key(1), "UserFSM:email")
+
+    await storage.close()
+
+    assert backend.states[make_key(1)] == "UserFSM:email"
+    assert backend.closed
+
+
+async def test_failed_flush_keeps_change_for_next_flush():
+    backend = FakeBackend()
+    storage = TieredStorage(backend, flush_interval=60)
+    await storage.set_data(make_key(1), {"name": "Клиент"})
+
+    backend.fail = True
+    await storage.flush()
+    backend.fail = False
+    await storage.flush()
+
+    assert backend.data[make_key(1)] == {"name": "Клиент"}
+    await storage.close()
+
+
+async def test_eviction_writes_dirty_entry_and_reads_it_back():
+    backend = FakeBackend()
+    storage = TieredStorage(backend, max_size=1, flush_interval=60)
+
+    await storage.set_data(make_key(1), {"n": 1})
+    await storage.set_data(make_key(2), {"n": 2})
+
+    # Вытесненная измененная сессия записана в нижний уровень, а не потеряна
+    assert backend.data[make_key(1)] == {"n": 1}
+    assert await storage.get_data(make_key(1)) == {"n": 1}
+    await storage.close()
+
+
+async def test_failed_eviction_keeps_entry_in_memory():
+    backend = FakeBackend()
+    storage = TieredStorage(backend, max_size=1, flush_interval=60)
+    await storage.set_data(make_key(1), {"n": 1})
+
+    backend.fail = True
+    await storage.set_data(make_key(2), {"n": 2})
+    backend.fail = False
+
+    assert backend.data == {}
+    assert await storage.get_data(make_key(1)) == {"n": 1}
+    await storage.flush()
+    assert backend.data[make_key(1)] == {"n": 1}
+    await storage.close()
+
+
+async def test_entry_evicted_during_write_is_not_read_stale():
+    # Пока вытесненная сессия записывается, чтение не должно идти в нижний уровень за устаревшей копией
+    backend = FakeBackend()
+    backend.data[make_key(1)] = {"n": 0}
+    storage = TieredStorage(backend, max_size=1, flush_interval=60)
+    await storage.set_data(make_key(1), {"n": 1})
+    gate = backend.gates[make_key(1)] = asyncio.Event()
+
+    evicting = asyncio.create_task(storage.set_data(make_key(2), {"n": 2}))
+    await asyncio.sleep(0)
+    assert await storage.get_data(make_key(1)) == {"n": 1}
+    gate.set()
+    await evicting
+
+    assert await storage.get_data(make_key(1)) == {"n": 1}
+    await storage.close()
+    assert backend.data[make_key(1)] == {"n": 1}
+
+
+async def test_change_during_eviction_write_is_not_lost():
+    backend = FakeBackend()
+    storage = TieredStorage(backend, max_size=1, flush_interval=60)
+    await storage.set_data(make_key(1), {"n": 1})
+    gate = backend.gates[make_key(1)] = asyncio.Event()
+
+    evicting = asyncio.create_task(storage.set_data(make_key(2), {"n": 2}))
+    await asyncio.sleep(0)
+    changing = asyncio.create_task(storage.set_data(make_key(1), {"n": 10}))
+    await asyncio.sleep(0)
+    gate.set()
+    await asyncio.gather(evicting, changing)
+    await storage.close()
+
+    assert backend.data[make_key(1)] == {"n": 10}
+
+
+async def test_clean_entry_expires_and_is_reloaded(clock):
+    backend = FakeBackend()
+    storage = TieredStorage(backend, ttl=60)
+    await storage.set_state(make_key(1), "UserFSM:phone")
+
+    # Сессия истекла в нижнем уровне (TTL Redis), копия в памяти тоже не должна отдаваться
+    del backend.states[make_key(1)]
+    clock[0] += 61
+
+    assert await storage.get_state(make_key(1)) is None
+    assert backend.reads == 1
+
+
+async def test_dirty_entry_does_not_expire_before_write(clock):
+    backend = FakeBackend()
+    storage = TieredStorage(backend, flush_interval=60, ttl=60)
+    await storage.set_state(make_key(1), "UserFSM:email")
+
+    clock[0] += 61
+
+    assert await storage.get_state(make_key(1)) == "UserFSM:email"
+    await storage.close()
@@ -0,0 +1,203 @@
+import uuid
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+from aiogram.dispatcher.event.handler import HandlerObject
+from aiogram.types import CallbackQuery, Message
+from redis.exceptions import RedisError
+
+import middlewares
+from middlewares import CallbackDedupMiddleware, ThrottlingMiddleware
+
+
+def make_handler():
+    return AsyncMock(return_value="handled")
+
+
+def make_data(user_id: int = 1, **flags) -> dict:
+    async def callback():
+        pass
+
+    return {"event_from_user": SimpleNamespace(id=user_id), "handler": HandlerObject(callback=callback, flags=flags)}
+
+
+def make_message():
+    message = MagicMock(spec=Message)
+    message.answer = AsyncMock()
+    return message
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = SimpleNamespace(value=1000.0)
+    monkeypatch.setattr(middlewares.time, "monotonic", lambda: now.value)
+    return now
+
+
+async def test_throttling_passes_burst_and_warns_once(clock):
+    throttling = ThrottlingMiddleware({"default": (1, 2)})
+    handler, message, data = make_handler(), make_message(), make_data()
+
+    results = [await throttling(handler, message, data) for _ in range(4)]
+
+    assert results == ["handled", "handled", None, None]
+    assert handler.await_count == 2
+    # Предупреждение отправляется один раз на серию отказов
+    message.answer.assert_awaited_once()
+
+
+async def test_throttling_refills_bucket_over_time(clock):
+    throttling = ThrottlingMiddleware({"default": (1, 1)})
+    handler, message, data = make_handler(), make_message(), make_data()
+
+    await throttling(handler, message, data)
+    assert await throttling(handler, message, data) is None
+    clock.value += 1
+    assert await throttling(handler, message, data) == "handled"
+
+
+async def test_throttling_buckets_are_per_user_and_class(clock):
+    throttling = ThrottlingMiddleware({"default": (1, 1), "menu": (1, 1)})
+    handler, message = make_handler(), make_message()
+
+    assert await throttling(handler, message, make_data(user_id=1)) == "handled"
+    assert await throttling(handler, message, make_data(user_id=2)) == "handled"
+    assert await throttling(handler, message, make_data(user_id=1, throttling="menu")) == "handled"
+    assert await throttling(handler, message, make_data(user_id=1)) is None
+
+
+async def test_throttling_disabled_by_flag(clock):
+    throttling = ThrottlingMiddleware({"default": (1, 1)})
+    handler, message, data = make_handler(), make_message(), make_data(throttling=None)
+
+    for _ in range(5):
+        assert await throttling(handler, message, data) == "handled"
+
+
+def test_wizard_text_steps_are_not_throttled():
+    # Длинное описание приходит серией сообщений: отброшенная часть пропала бы из заявки
+    from start_app import create_router
+
+    flags = {handler.callback.__name__: handler.flags for handler in create_router().message.handlers}
+    for name in ("handle_name", "handle_organization", "message_other_information", "handle_document_text",
+                 "handle_phone", "handle_email"):
+        assert flags[name]["throttling"] is None
+
+
+async def test_throttling_answers_callback_query(clock):
+    throttling = ThrottlingMiddleware({"default": (1, 1)})
+    handler, data = make_handler(), make_data()
+    callback_query = MagicMock(spec=CallbackQuery)
+    callback_query.answer = AsyncMock()
+
+    await throttling(handler, callback_query, data)
+    await throttling(handler, callback_query, data)
+
+    callback_query.answer.assert_awaited_once()
+
+
+async def test_throttling_fails_open_on_redis_error():
+    script = AsyncMock(side_effect=RedisError("down"))
+    redis = MagicMock()
+    redis.register_script.return_value = script
+    throttling = ThrottlingMiddleware({"default": (1, 1)}, redis)
+    handler, message, data = make_handler(), make_message(), make_data()
+
+    assert await throttling(handler, message, data) == "handled"
+    assert await throttling(handler, message, data) == "handled"
+    script.assert_awaited_with(keys=["throttle:1:default"], args=[1, 1])
+
+
+async def test_throttling_redis_bucket(redis):
+    user_id = uuid.uuid4().int % 10 ** 12
+    redis.test_keys.append(f"throttle:{user_id}:default")
+    throttling = ThrottlingMiddleware({"default": (0.01, 2)}, redis)
+    handler, message, data = make_handler(), make_message(), make_data(user_id=user_id)
+
+    results = [await throttling(handler, message, data) for _ in range(4)]
+
+    assert results == ["handled", "handled", None, None]
+    message.answer.assert_awaited_once()
+    assert 0 < await redis.ttl(f"throttle:{user_id}:default") <= 201
+
+
+def make_callback_query(user_id: int = 1, message_id: int = 10, data: str = "Статус заявок"):
+    callback_query = MagicMock(spec=CallbackQuery)
+    callback_query.from_user = SimpleNamespace(id=user_id)
+    callback_query.message = SimpleNamespace(message_id=message_id)
+    callback_query.inline_message_id = None
+    callback_query.data = data
+    callback_query.answer = AsyncMock()
+    return callback_query
+
+
+class SetNxRedis:
+    """
+    Минимальный клиент Redis для проверки дедупликации: только SET NX.
+    """
+
+    def __init__(self) -> None:
+        self.keys = {}
+
+    async def set(self, key, value, nx=False, px=None):
+        if nx and key in self.keys:
+            return None
+        self.keys[key] = (value, px)
+        return True
+
+
+async def test_dedup_drops_repeated_press():
+    dedup = CallbackDedupMiddleware(SetNxRedis(), ttl=3)
+    handler = make_handler()
+    first, repeated = make_callback_query(), make_callback_query()
+
+    assert await dedup(handler, first, {}) == "handled"
+    assert await dedup(handler, repeated, {}) is None
+
+    handler.assert_awaited_once()
+    # Повторному нажатию отвечаем пустым ответом, чтобы убрать индикатор загрузки на кнопке
+    repeated.answer.assert_awaited_once_with()
+
+
+async def test_dedup_key_includes_user_message_and_data():
+    redis = SetNxRedis()
+    dedup = CallbackDedupMiddleware(redis, ttl=3)
+    handler = make_handler()
+
+    for callback_query in (make_callback_query(), make_callback_query(user_id=2), make_callback_query(message_id=11),
+                           make_callback_query(data="Создать заявку")):
+        assert await dedup(handler, callback_query, {}) == "handled"
+    assert redis.keys["callback:1:10:None:Статус заявок"] == (1, 3000)
+
+
+async def test_dedup_same_button_on_next_wizard_step_is_not_repeat():
+    # Шаги мастера редактируют одно сообщение, и кнопки разных шагов используют одни и те же номера
+    dedup = CallbackDedupMiddleware(SetNxRedis(), ttl=3)
+    handler = make_handler()
+
+    assert await dedup(handler, make_callback_query(data="1"), {"raw_state": "UserFSM:category_id"}) == "handled"
+    assert await dedup(handler, make_callback_query(data="1"), {"raw_state": "UserFSM:subcategory_id"}) == "handled"
+    assert await dedup(handler, make_callback_query(data="1"), {"raw_state": "UserFSM:subcategory_id"}) is None
+    assert handler.await_count == 2
+
+
+async def test_dedup_passes_press_on_redis_error():
+    redis = MagicMock()
+    redis.set = AsyncMock(side_effect=RedisError("down"))
+    dedup = CallbackDedupMiddleware(redis, ttl=3)
+    handler = make_handler()
+
+    assert await dedup(handler, make_callback_query(), {}) == "handled"
+    assert await dedup(handler, make_callback_query(), {}) == "handled"
+
+
+async def test_dedup_redis_key_expires(redis):
+    user_id = uuid.uuid4().int % 10 ** 12
+    redis.test_keys.append(f"callback:{user_id}:10:None:Статус заявок")
+    dedup = CallbackDedupMiddleware(redis, ttl=3)
+    handler = make_handler()
+
+    assert await dedup(handler, make_callback_query(user_id=user_id), {}) == "handled"
+    assert await dedup(handler, make_callback_query(user_id=user_id), {}) is None
+    assert 0 < await redis.pttl(f"callback:{user_id}:10:None:Статус заявок") <= 3000
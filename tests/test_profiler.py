@@ -0,0 +1,73 @@
+import asyncio
+
+import pytest
+from aiogram import Router
+
+from global_configs.app_configs import PROFILE_DEFAULT_SECONDS, PROFILE_MAX_SECONDS
+from profiler import ProfileSession
+from start_app import handler_codes, parse_profile_args
+
+
+@pytest.mark.parametrize("args, expected", [
+    (None, (None, PROFILE_DEFAULT_SECONDS)),
+    ("", (None, PROFILE_DEFAULT_SECONDS)),
+    ("200", (200, PROFILE_DEFAULT_SECONDS)),
+    ("200 30s", (200, 30)),
+    ("30S 200", (200, 30)),
+    ("0.5s", (None, 0.5)),
+    (f"{PROFILE_MAX_SECONDS:g}s", (None, PROFILE_MAX_SECONDS)),
+])
+def test_parse_profile_args(args, expected):
+    assert parse_profile_args(args) == expected
+
+
+@pytest.mark.parametrize("args", ["abc", "200 abcs", "1.5", "0", "-5", "0s", "-1s", f"{PROFILE_MAX_SECONDS + 1:g}s"])
+def test_parse_profile_args_rejects_invalid(args):
+    with pytest.raises(ValueError):
+        parse_profile_args(args)
+
+
+def test_handler_codes_includes_nested_routers():
+    router = Router()
+    sub_router = Router()
+    router.include_router(sub_router)
+
+    @router.message()
+    async def first(message): ...
+
+    @sub_router.callback_query()
+    async def second(callback_query): ...
+
+    assert handler_codes(router) == {first.__code__: "first", second.__code__: "second"}
+
+
+async def test_session_finishes_after_requested_updates():
+    done = asyncio.Event()
+
+    async def on_done(session):
+        done.set()
+
+    session = ProfileSession({}, on_done, updates=2, seconds=60, interval=0.001)
+    session.start()
+    session.record("first", 0.01)
+    session.record("first", 0.03)
+    session.record("second", 0.05)
+    await asyncio.wait_for(done.wait(), timeout=5)
+
+    # Вызовы после окончания сеанса не учитываются
+    assert session.timings == {"first": [0.01, 0.03]}
+    assert session.report().splitlines()[4].split()[:3] == ["first", "2", "40.0"]
+
+
+async def test_session_finishes_after_timeout():
+    done = asyncio.Event()
+
+    async def on_done(session):
+        done.set()
+
+    session = ProfileSession({}, on_done, seconds=0.05, interval=0.001)
+    session.start()
+    await asyncio.wait_for(done.wait(), timeout=5)
+
+    assert session.finished_at is not None
+    assert not session._thread.is_alive()
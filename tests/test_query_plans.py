@@ -0,0 +1,79 @@
+"""
+Проверка планов частых запросов: на синтетических данных запросы должны использовать индексы из миграций.
+
+Для тестов нужен сервер PostgreSQL с правом CREATE DATABASE (подключение из global_configs.database_configs).
+Тесты заполняют временную базу с примененными миграциями (фикстура `database`). Без сервера тесты пропускаются.
+"""
+import json
+from datetime import date, timedelta
+
+import asyncpg
+import pytest
+import pytest_asyncio
+
+from start_app import (APPLICATION_DOCUMENTS_QUERY, APPLICATIONS_QUERY, CLIENT_APPLICATIONS_QUERY, EXPORT_QUERY,
+                       SEARCH_SYSTEM_USER_QUERY)
+
+pytestmark = pytest.mark.asyncio(loop_scope="module")
+
+# Синтетические данные: 50 000 заявок от 5 000 клиентов за год, по два документа на заявку
+SEED_SQL = """
+INSERT INTO applications.statuses (name_status) SELECT 'Статус ' || i FROM generate_series(2, 5) AS i;
+INSERT INTO applications.categories (name_category) SELECT 'Категория ' || i FROM generate_series(1, 10) AS i;
+INSERT INTO system_users_telegram_bot.access (access_name) VALUES ('Сотрудник');
+INSERT INTO system_users_telegram_bot.system_users_for_telegram (telegram_id, full_name, access_id)
+SELECT i, 'Сотрудник ' || i, 1 FROM generate_series(1, 5000) AS i;
+INSERT INTO applications.applications (telegram_id, client_name, organization_name, entity_type_id, category_id,
+                                       status_id, created_at, idempotency_key)
+SELECT 100000 + i % 5000, 'Клиент ' || i, 'Организация ' || i, 1 + i % 2, 1 + i % 10, 1 + i % 5,
+       now() - (50000 - i) * interval '10 minutes', gen_random_uuid()
+FROM generate_series(1, 50000) AS i;
+INSERT INTO applications.documents (application_id, file_path, original_name, uploaded_at)
+SELECT a.application_id, '/docs/' || a.application_id || '_' || n, 'file_' || n || '.pdf', a.created_at
+FROM applications.applications a CROSS JOIN generate_series(1, 2) AS n;
+ANALYZE;
+"""
+
+
+@pytest_asyncio.fixture(scope="module", loop_scope="module")
+async def connection(database):
+    await database.execute(SEED_SQL)
+    # Бот выполняет запросы через asyncpg с конкретными значениями параметров
+    await database.execute("SET plan_cache_mode = force_custom_plan")
+    return database
+
+
+def plan_indexes(plan: dict) -> set:
+    """
+    Собрать имена индексов, которые использует план.
+    """
+    indexes = {plan["Index Name"]} if "Index Name" in plan else set()
+    for child in plan.get("Plans", []):
+        indexes |= plan_indexes(child)
+    return indexes
+
+
+async def explain(connection: asyncpg.Connection, query: str, *args) -> set:
+    result = await connection.fetchval(f"EXPLAIN (FORMAT JSON) {query}", *args)
+    return plan_indexes(json.loads(result)[0]["Plan"])
+
+
+async def test_system_user_lookup_uses_telegram_id_index(connection):
+    assert "system_users_for_telegram_telegram_id_idx" in await explain(connection, SEARCH_SYSTEM_USER_QUERY, 42)
+
+
+async def test_client_status_uses_telegram_id_created_at_index(connection):
+    assert "applications_telegram_id_created_at_idx" in await explain(connection, CLIENT_APPLICATIONS_QUERY, 100042)
+
+
+async def test_applications_list_uses_created_at_index(connection):
+    assert "applications_created_at_idx" in await explain(connection, APPLICATIONS_QUERY)
+
+
+async def test_export_for_period_uses_created_at_index(connection):
+    date_from = date.today() - timedelta(days=7)
+    assert "applications_created_at_idx" in await explain(connection, EXPORT_QUERY, date_from, None, None)
+
+
+async def test_application_documents_use_application_id_index(connection):
+    assert "documents_application_id_uploaded_at_idx" in await explain(connection, APPLICATION_DOCUMENTS_QUERY, 42)
@@ -0,0 +1,65 @@
+import asyncio
+
+import pytest
+
+from start_app import (SYSTEM_USER_NOTIFY_CHANNEL, get_status_page, invalidate_status_page, status_page_key,
+                       store_status_page)
+
+USER_ID = 987654321
+
+
+@pytest.fixture
+def page_keys(redis):
+    redis.test_keys += [status_page_key(USER_ID, "page"), status_page_key(USER_ID, "generation")]
+
+
+async def test_stored_page_is_returned(redis, page_keys):
+    page, generation = await get_status_page(redis, USER_ID)
+    assert page is None
+
+    await store_status_page(redis, USER_ID, "страница", generation)
+
+    assert (await get_status_page(redis, USER_ID))[0] == "страница"
+
+
+async def test_invalidate_drops_page(redis, page_keys):
+    _, generation = await get_status_page(redis, USER_ID)
+    await store_status_page(redis, USER_ID, "страница", generation)
+
+    await invalidate_status_page(redis, USER_ID)
+
+    assert (await get_status_page(redis, USER_ID))[0] is None
+
+
+async def test_page_read_before_invalidation_is_not_stored(redis, page_keys):
+    # Обработчик прочитал поколение и пошел в базу, а в это время пользователя сделали сотрудником
+    _, generation = await get_status_page(redis, USER_ID)
+    await invalidate_status_page(redis, USER_ID)
+
+    await store_status_page(redis, USER_ID, "устаревшая страница", generation)
+
+    assert (await get_status_page(redis, USER_ID))[0] is None
+
+
+@pytest.mark.asyncio(loop_scope="module")
+async def test_system_user_changes_are_published(database):
+    payloads = asyncio.Queue()
+    await database.add_listener(SYSTEM_USER_NOTIFY_CHANNEL, lambda *args: payloads.put_nowait(args[-1]))
+    access_id = await database.fetchval(
+        "INSERT INTO system_users_telegram_bot.access (access_name) VALUES ('Сотрудник') RETURNING access_id;"
+    )
+    table = "system_users_telegram_bot.system_users_for_telegram"
+
+    await database.execute(f"INSERT INTO {table} (telegram_id, access_id) VALUES (1001, $1);", access_id)
+    await database.execute(f"UPDATE {table} SET full_name = 'Сотрудник' WHERE telegram_id = 1001;")
+    await database.execute(f"UPDATE {table} SET status = false WHERE telegram_id = 1001;")
+    await database.execute(f"UPDATE {table} SET telegram_id = 1002 WHERE telegram_id = 1001;")
+    await database.execute(f"DELETE FROM {table} WHERE telegram_id = 1002;")
+    # Уведомление, которое точно придет последним: все предыдущие уже доставлены
+    await database.execute("SELECT pg_notify($1, '0');", SYSTEM_USER_NOTIFY_CHANNEL)
+
+    received = []
+    while not received or received[-1] != "0":
+        received.append(await asyncio.wait_for(payloads.get(), timeout=5))
+    # Изменение имени страницу не меняет и уведомления не публикует
+    assert received == ["1001", "1001", "1001", "1002", "1002", "0"]